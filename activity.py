@@ -0,0 +1,128 @@
+import itertools
+import logging
+from collections import defaultdict
+from typing import Dict
+
+import clock
+from guild_state import guild_states
+
+logger = logging.getLogger("discord_bot")
+
+ACTIVITY_POINTS = 2            # Points per qualifying message
+ACTIVITY_MIN_INTERVAL = 20     # Seconds between messages that earn
+ACTIVITY_WINDOW = 3600         # Cap window in seconds
+ACTIVITY_WINDOW_CAP = 60       # Max points per user per window
+ACTIVITY_MIN_LENGTH = 5        # Shorter messages don't earn
+ACTIVITY_FLUSH_SECONDS = 60
+
+_batch_ids = itertools.count(1)
+
+
+async def credit_batches(pending: Dict[int, Dict[int, int]], source: str, retry: Dict[int, Dict[int, int]]) -> int:
+    """Apply {guild_id: {user_id: points}} as one ledger transaction per guild.
+
+    Credits for a guild whose transaction fails are added back into `retry`
+    for the next flush. Returns the number of users credited.
+    """
+    credited = 0
+    for guild_id, deltas in pending.items():
+        try:
+            applied, _ = await guild_states.get(guild_id).ledger.apply_many(
+                dict(deltas), key=f"{source}:{guild_id}:{next(_batch_ids)}"
+            )
+            credited += len(applied)
+        except Exception as e:
+            logger.error(f"Error crediting {source} points for guild {guild_id}: {e}")
+            for user_id, delta in deltas.items():
+                retry[guild_id][user_id] += delta
+    return credited
+
+
+def mark_live(guilds) -> None:
+    """Remember when each guild started earning from live chat, the first time only"""
+    now = clock.now()
+    for guild in guilds:
+        state = guild_states.get(guild.id)
+        if state.activity_since is None:
+            state.activity_since = now
+            state.save_activity()
+
+
+class _Earner:
+    __slots__ = ('next_allowed', 'window_start', 'earned', 'last_hash')
+
+    def __init__(self, now: float):
+        self.next_allowed = 0.0
+        self.window_start = now
+        self.earned = 0
+        self.last_hash = None
+
+
+class ActivityEarner:
+    """Awards points for chatting, with anti-spam caps.
+
+    record() is O(1) and never touches disk: credits accumulate in memory
+    per guild and flush() hands each guild's total to its ledger as one
+    apply_many() transaction.
+    """
+
+    def __init__(self, points: int = ACTIVITY_POINTS, min_interval: float = ACTIVITY_MIN_INTERVAL,
+                 window: float = ACTIVITY_WINDOW, window_cap: int = ACTIVITY_WINDOW_CAP):
+        self.points = points
+        self.min_interval = min_interval
+        self.window = window
+        self.window_cap = window_cap
+        self._earners = {}
+        self.pending: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.awarded = 0
+        self.rejected = 0
+
+    def record(self, guild_id: int, user_id: int, content: str) -> bool:
+        """Count one message; True if it earned points"""
+        if len(content) < ACTIVITY_MIN_LENGTH:
+            self.rejected += 1
+            return False
+        now = clock.now()
+        key = (guild_id, user_id)
+        earner = self._earners.get(key)
+        if earner is None:
+            earner = self._earners[key] = _Earner(now)
+
+        content_hash = hash(content)
+        repeated = content_hash == earner.last_hash
+        earner.last_hash = content_hash
+        if repeated or now < earner.next_allowed:
+            self.rejected += 1
+            return False
+        if now - earner.window_start >= self.window:
+            earner.window_start = now
+            earner.earned = 0
+        if earner.earned + self.points > self.window_cap:
+            self.rejected += 1
+            return False
+
+        earner.next_allowed = now + self.min_interval
+        earner.earned += self.points
+        self.pending[guild_id][user_id] += self.points
+        self.awarded += 1
+        return True
+
+    async def flush(self) -> int:
+        """Credit everything accumulated so far; returns the number of users credited"""
+        pending, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+        credited = await credit_batches(pending, "activity", self.pending)
+        self._prune()
+        return credited
+
+    def _prune(self) -> None:
+        """Forget users whose cap window and cooldown have both run out"""
+        now = clock.now()
+        stale = [
+            key for key, earner in self._earners.items()
+            if now - earner.window_start >= self.window and now >= earner.next_allowed
+        ]
+        for key in stale:
+            del self._earners[key]
+
+
+activity_earner = ActivityEarner()
@@ -1,21 +1,24 @@
 import discord
 from discord.ext import commands
-import time
+import clock
 import logging
-import asyncio
+import resource
 from shared import (
     is_mod_or_admin,
     log_activity,
-    save_data,
     PRISON_ROLE_NAME,
-    reported_users,
-    user_roles_before_prison,
-    user_nicknames_before_prison,
-    PRISON_DATA_FILE,
-    REPORT_DATA_FILE,
-    PRISON_DURATION,
-    dm_permissions
+    REPORT_PRISON_THRESHOLD
 )
+from guild_state import guild_states
+from records import ReportRecord
+from report_search import report_search
+from dm_queue import dm_queue
+from prison import prison_service
+from vc_locks import vc_locks
+from task_supervisor import task_supervisor
+from rate_limits import rate_limits
+from gateway_profile import features
+from member_lookup import member_lookup
 
 logger = logging.getLogger("discord_bot")
 
@@ -23,162 +26,21 @@ class AdminCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    async def save_reports(self):
-        """Save reports data to file"""
-        save_data(reported_users, REPORT_DATA_FILE, default_factory=lambda: {
-            'count': 0,
-            'reasons': [],
-            'last_report': 0
-        })
+    async def save_reports(self, guild_id):
+        """Save a guild's reports data to file"""
+        guild_states.get(guild_id).save_reports()
 
-    async def save_prison_state(self):
-        """Save prison state to file"""
-        data = {
-            'user_roles': {
-                str(user_id): [role.id for role in roles]  # Convert to string for JSON
-                for user_id, roles in user_roles_before_prison.items()
-            },
-            'user_nicknames': dict(user_nicknames_before_prison)
-        }
-        save_data(data, PRISON_DATA_FILE)
+    async def save_prison_state(self, guild_id):
+        """Save a guild's prison state to file"""
+        guild_states.get(guild_id).save_prison()
 
     async def put_in_prison(self, member):
         """Put a member in prison"""
-        if not member:
-            return False
-        
-        if member.id == member.guild.owner_id:
-            return False
-        
-        try:
-            guild = member.guild
-            prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
-            
-            if not prison_role:
-                try:
-                    prison_role = await guild.create_role(
-                        name=PRISON_ROLE_NAME,
-                        permissions=discord.Permissions.none()
-                    )
-                    
-                    for channel in guild.channels:
-                        await channel.set_permissions(prison_role, 
-                                                   send_messages=False,
-                                                   add_reactions=False)
-                except discord.errors.Forbidden:
-                    await log_activity(self.bot, f"❌ Failed to create prison role - insufficient permissions")
-                    return False
-            
-            # Store current roles and nickname
-            user_roles_before_prison[member.id] = [role for role in member.roles if not role.is_default()]
-            user_nicknames_before_prison[str(member.id)] = member.display_name
-            
-            try:
-                # Set prisoner nickname
-                new_nick = f"🔒 Prisoner"
-                if len(new_nick) > 32:
-                    new_nick = new_nick[:32]
-                
-                # Apply prison role and remove all other roles
-                await member.edit(
-                    roles=[prison_role],
-                    nick=new_nick
-                )
-                
-                await log_activity(self.bot, f"🔒 {member.mention} has been imprisoned for 1 hour!")
-                
-                await self.save_prison_state()
-                asyncio.create_task(self.release_after_delay(member, PRISON_DURATION))
-                return True
-            except discord.errors.Forbidden:
-                await log_activity(self.bot, f"❌ Failed to imprison {member.mention} - insufficient permissions")
-                return False
-        except Exception as e:
-            await log_activity(self.bot, f"❌ Error imprisoning {member.mention}: {e}")
-            logger.error(f"Error in put_in_prison: {e}")
-            return False
+        return await prison_service.imprison(self.bot, member)
 
     async def release_from_prison(self, member):
         """Release a member from prison"""
-        if not member:
-            return False
-        
-        try:
-            prison_role = discord.utils.get(member.guild.roles, name=PRISON_ROLE_NAME)
-            is_in_prison_by_role = prison_role and prison_role in member.roles
-            is_in_prison_by_tracking = member.id in user_roles_before_prison or str(member.id) in user_nicknames_before_prison
-            
-            if not is_in_prison_by_role and not is_in_prison_by_tracking:
-                return False
-                
-            # Get original roles
-            original_roles = []
-            if member.id in user_roles_before_prison:
-                # Convert role IDs to role objects if needed
-                if isinstance(user_roles_before_prison[member.id][0], int):
-                    original_roles = [
-                        member.guild.get_role(role_id) 
-                        for role_id in user_roles_before_prison[member.id]
-                        if member.guild.get_role(role_id) is not None
-                    ]
-                else:
-                    original_roles = [
-                        role for role in user_roles_before_prison[member.id] 
-                        if hasattr(role, 'is_default') and not role.is_default()
-                    ]
-            
-            # Remove prison role first
-            if prison_role and prison_role in member.roles:
-                await member.remove_roles(prison_role)
-            
-            # Restore original roles
-            if original_roles:
-                roles_to_restore = [
-                    role for role in original_roles 
-                    if role and role != prison_role
-                ]
-                if roles_to_restore:
-                    await member.add_roles(*roles_to_restore)
-            
-            # Restore nickname
-            member_id_str = str(member.id)
-            original_nick = user_nicknames_before_prison.pop(member_id_str, None)
-            
-            if original_nick:
-                try:
-                    await member.edit(nick=original_nick)
-                    await log_activity(self.bot, f"🔓 Restored original nickname '{original_nick}' to {member.mention}")
-                except discord.errors.Forbidden:
-                    await log_activity(self.bot, f"⚠️ Failed to restore nickname for {member.mention} due to permissions")
-            else:
-                current_nick = member.display_name
-                if current_nick.startswith("🔒 Prisoner"):
-                    try:
-                        await member.edit(nick=None)
-                        await log_activity(self.bot, f"🔓 Reset nickname for {member.mention} to default username")
-                    except discord.errors.Forbidden:
-                        await log_activity(self.bot, f"⚠️ Failed to reset nickname for {member.mention} due to permissions")
-            
-            # Clean up tracking
-            if member.id in user_roles_before_prison:
-                del user_roles_before_prison[member.id]
-            
-            await self.save_prison_state()
-            await log_activity(self.bot, f"🔓 {member.mention} has been released from prison!")
-            return True
-            
-        except discord.errors.Forbidden:
-            await log_activity(self.bot, f"❌ Failed to release {member.mention} - insufficient permissions")
-            return False
-        except Exception as e:
-            await log_activity(self.bot, f"❌ Error releasing {member.mention}: {e}")
-            logger.error(f"Error in release_from_prison: {e}")
-            return False
-
-    async def release_after_delay(self, member, delay):
-        """Release member after a delay"""
-        await asyncio.sleep(delay)
-        await self.release_from_prison(member)
+        return await prison_service.release(self.bot, member)
 
     @commands.command()
     @commands.check(is_mod_or_admin)
@@ -186,17 +48,20 @@ class AdminCommands(commands.Cog):
         """Test report function (Admin only)"""
         if reported_user.id == ctx.guild.owner_id:
             for _ in range(10):
-                await reported_user.send("NO NO YA DEK!")
+                dm_queue.enqueue(reported_user.id, "NO NO YA DEK!", dedupe=False)
             await ctx.send(f"⚠️ **{reported_user.mention} has received 15 reports but is the owner and cannot be imprisoned. Sent 10 'NO NO YA DEK' messages to their DM.**")
             return
 
-        reported_id = str(reported_user.id)
-        reported_users[reported_id] = {
-            'count': 15,
-            'reasons': ["Test report oleh admin"],
-            'last_report': time.time()
-        }
-        await self.save_reports()
+        state = guild_states.get(ctx.guild.id)
+        record = state.reported_users[reported_user.id] = ReportRecord(
+            count=15,
+            reasons=["Test report oleh admin"],
+            last_report=clock.now(),
+            guild_id=ctx.guild.id
+        )
+        state.report_index.refresh(reported_user.id, record)
+        report_search.add(reported_user.id, ctx.guild.id, "Test report oleh admin", clock.now())
+        await self.save_reports(ctx.guild.id)
         await self.put_in_prison(reported_user)
         await ctx.send(f"✅ **{reported_user.mention} langsung mendapatkan 15 report dan masuk penjara!**")
 
@@ -221,9 +86,10 @@ class AdminCommands(commands.Cog):
                 return
             
             # Reset reports
-            if str(member.id) in reported_users:
-                reported_users[str(member.id)]['count'] = 0
-                save_data(reported_users, REPORT_DATA_FILE)
+            state = guild_states.get(ctx.guild.id)
+            if member.id in state.reported_users:
+                state.set_report_count(member.id, 0)
+                state.save_reports()
             
             await ctx.send(f"🔓 **{member.mention} telah dibebaskan dari penjara oleh {ctx.author.mention}!**")
             await log_activity(self.bot, f"🔓 **{ctx.author.mention} membebaskan {member.mention} dari penjara**")
@@ -236,45 +102,164 @@ class AdminCommands(commands.Cog):
     @commands.check(is_mod_or_admin)
     async def resetreports(self, ctx, member: discord.Member = None):
         """Reset reports for a user or all users"""
+        state = guild_states.get(ctx.guild.id)
         if member:
-            reported_users.pop(str(member.id), None)
+            state.remove_reports(member.id)
             await ctx.send(f"✅ Reports for {member.mention} have been reset!")
         else:
-            reported_users.clear()
+            state.clear_reports()
             await ctx.send("✅ All reports have been reset!")
         
-        save_data(reported_users, REPORT_DATA_FILE, default_factory=lambda: {
-            'count': 0,
-            'reasons': [],
-            'last_report': 0
-        })
+        state.save_reports()
 
     @commands.command()
     @commands.check(is_mod_or_admin)
     async def cleanup_reports(self, ctx, member: discord.Member = None):
         """Cleanup reports for users with >= 15 reports"""
         cleaned = 0
+        state = guild_states.get(ctx.guild.id)
         
         if member:
-            if str(member.id) in reported_users and reported_users[str(member.id)]['count'] >= 15:
-                reported_users.pop(str(member.id))
+            if state.report_index.count(member.id) >= REPORT_PRISON_THRESHOLD:
+                state.remove_reports(member.id)
                 cleaned += 1
                 await ctx.send(f"✅ Cleaned reports for {member.mention}")
             else:
                 await ctx.send(f"❌ {member.mention} doesn't have enough reports to clean")
         else:
-            to_remove = [uid for uid, data in reported_users.items() if data['count'] >= 15]
+            to_remove = state.report_index.at_least(REPORT_PRISON_THRESHOLD)
             cleaned = len(to_remove)
             for uid in to_remove:
-                reported_users.pop(uid)
+                state.remove_reports(uid)
             await ctx.send(f"✅ Cleaned {cleaned} users with excessive reports")
         
         if cleaned > 0:
-            save_data(reported_users, REPORT_DATA_FILE, default_factory=lambda: {
-                'count': 0,
-                'reasons': [],
-                'last_report': 0
-            })
+            state.save_reports()
+
+    @commands.command()
+    @commands.check(is_mod_or_admin)
+    async def prunevcoverwrites(self, ctx, *flags: str):
+        """Remove orphaned member overwrites on voice channels. Flags: --dry --untracked"""
+        dry_run = "--dry" in flags
+        untracked = "--untracked" in flags
+        channels, removed = await vc_locks.prune_orphans(ctx.guild, untracked_locks=untracked, dry_run=dry_run)
+        if not removed:
+            await ctx.send("✅ No orphaned voice overwrites found")
+            return
+        verb = "Would remove" if dry_run else "Removed"
+        await ctx.send(f"🧹 {verb} {removed} overwrite(s) across {channels} voice channel(s)")
+
+    @commands.command(name="tasks")
+    @commands.check(is_mod_or_admin)
+    async def task_stats(self, ctx):
+        """Show live background tasks per category"""
+        stats = task_supervisor.stats()
+        embed = discord.Embed(title="⚙️ Background tasks", color=discord.Color.blurple())
+        if not stats:
+            embed.description = "No background tasks running"
+        for category, row in sorted(stats.items()):
+            limit = f" / {row['limit']}" if row['limit'] else ""
+            embed.add_field(
+                name=category,
+                value=(
+                    f"Live: {row['live']} (running {row['running']}{limit}, waiting {row['waiting']})\n"
+                    f"Oldest: {int(row['oldest'])}s • Failed: {row['failed']}"
+                ),
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.check(is_mod_or_admin)
+    async def ratelimits(self, ctx):
+        """Show Discord rate limit buckets with the least headroom"""
+        metrics = rate_limits.metrics()
+        limited = ", ".join(f"{scope}: {count}" for scope, count in metrics['responses_429'].items()) or "none"
+        embed = discord.Embed(
+            title="🚦 Rate limit buckets",
+            description=(
+                f"Requests: {metrics['requests']} • 429s: {limited}\n"
+                f"Paced: {metrics['paced']} request(s), {metrics['paced_seconds']}s total"
+            ),
+            color=discord.Color.blurple()
+        )
+        now = clock.now()
+        for bucket in rate_limits.tightest():
+            reset_in = max(0.0, bucket.reset_at - now)
+            routes = ", ".join(sorted(bucket.routes)[:3])
+            embed.add_field(
+                name=f"{bucket.name} ({bucket.requests} requests)",
+                value=(
+                    f"{max(bucket.remaining, 0)}/{bucket.limit} left • reset in {reset_in:.1f}s • "
+                    f"429s: {bucket.limited}\n`{routes[:200]}`"
+                ),
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.check(is_mod_or_admin)
+    async def cachestats(self, ctx):
+        """Show member cache size per guild and the on-demand lookup cache"""
+        embed = discord.Embed(
+            title="🧠 Member cache",
+            description=(
+                f"Features: {', '.join(sorted(features)) or 'none'}\n"
+                f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MiB • "
+                f"Cached users: {len(self.bot.users)}\n"
+                f"Lookup LRU: {len(member_lookup)}/{member_lookup.size} • "
+                f"hits {member_lookup.hits} • fetches {member_lookup.fetches}"
+            ),
+            color=discord.Color.blurple()
+        )
+        guilds = sorted(self.bot.guilds, key=lambda guild: guild.member_count or 0, reverse=True)
+        for guild in guilds[:10]:
+            mode = "chunked" if guild.chunked else "lean"
+            embed.add_field(
+                name=guild.name,
+                value=f"{len(guild.members)}/{guild.member_count} cached ({mode})",
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command(aliases=['carireport'])
+    @commands.check(is_mod_or_admin)
+    async def searchreports(self, ctx, *, query: str = ""):
+        """Search report reasons. Filters: reporter:<name> page:<n>"""
+        reporter = None
+        page = 1
+        words = []
+        for token in query.split():
+            if token.lower().startswith("reporter:"):
+                reporter = token[len("reporter:"):]
+            elif token.lower().startswith("page:") and token[len("page:"):].isdigit():
+                page = max(1, int(token[len("page:"):]))
+            else:
+                words.append(token)
+
+        if not words and not reporter:
+            await ctx.send("❌ **Gunakan:** `!searchreports <kata kunci> [reporter:<nama>] [page:<n>]`")
+            return
+
+        rows, has_more = report_search.search(" ".join(words), reporter, ctx.guild.id, page)
+        embed = discord.Embed(
+            title=f"🔎 Report search: {query}",
+            color=discord.Color.orange()
+        )
+        if not rows:
+            embed.description = "No matching reports"
+        for target_id, reason, by, reported_at in rows:
+            when = f" • <t:{int(reported_at)}:R>" if reported_at else ""
+            embed.add_field(
+                name=f"Reported by {by or 'unknown'}",
+                value=f"<@{target_id}>: {reason[:200]}{when}",
+                inline=False
+            )
+        footer = f"Page {page}"
+        if has_more:
+            footer += f" • more results with page:{page + 1}"
+        embed.set_footer(text=footer)
+        await ctx.send(embed=embed)
 
 async def setup(bot):
     await bot.add_cog(PointSystem(bot, ADMIN_USER_IDS)) 
\ No newline at end of file
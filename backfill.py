@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import discord
+import clock
+from activity import (
+    ACTIVITY_POINTS,
+    ACTIVITY_MIN_INTERVAL,
+    ACTIVITY_WINDOW,
+    ACTIVITY_WINDOW_CAP,
+    ACTIVITY_MIN_LENGTH
+)
+from dm_queue import TokenBucket
+from guild_state import guild_states
+from rate_limits import rate_limits
+
+logger = logging.getLogger("discord_bot")
+
+BACKFILL_CONCURRENCY = 3            # Channels walked at once
+BACKFILL_PAGE_SIZE = 100            # Messages per history request (Discord's maximum)
+BACKFILL_PAGE_RATE = (5, 1.0)       # History pages per second, across channels
+BACKFILL_CHECKPOINT_EVERY = 1000    # Messages per channel between checkpoints
+BACKFILL_USER_CAP = 5000            # Most points one member can get from a backfill
+BACKFILL_PROGRESS_SECONDS = 15
+BACKFILL_FILE = "backfill.json"
+BACKFILL_SLOTS_FILE = "backfill_slots.jsonl"
+BACKFILL_CHECKPOINT_VERSION = 2
+
+
+class BackfillJob:
+    """Credits historical chat activity for one guild.
+
+    Every readable text channel is walked newest-first with channel.history,
+    a few channels at a time, paced by a shared page budget on top of
+    discord.py's own per-route rate limiting. The walk stops where live
+    earning started, so no message is paid twice.
+
+    Channels are walked concurrently, so messages don't arrive in time
+    order; the live rules are applied on fixed slots instead. Each member
+    keeps one bitmask per cap window with a bit per min-interval slot, so
+    at most one message per slot earns and each window is capped like live
+    earning. Memory grows with member-hours, not messages.
+
+    Checkpoints go to the guild's partition and cost only what changed
+    since the last one: the masks touched since then are appended to a
+    journal, then the small cursor state is rewritten. Masks are OR-ed
+    together on replay, so a journal line whose cursor was never saved is
+    harmless. A restart resumes each channel where it stopped. The result
+    is credited as one ledger transaction.
+    """
+
+    def __init__(self, guild: discord.Guild, days: int):
+        self.guild = guild
+        partition = guild_states.get(guild.id)
+        self.path = os.path.join(partition.path, BACKFILL_FILE)
+        self.slots_path = os.path.join(partition.path, BACKFILL_SLOTS_FILE)
+        # Messages from before live earning started; everything since was already paid
+        until = partition.activity_since or datetime.now(timezone.utc).timestamp()
+        loaded = self._load()
+        self.state = loaded or {
+            'after': until - timedelta(days=days).total_seconds(),
+            'until': until,
+            'channels': {},
+            'applied': False,
+            'version': BACKFILL_CHECKPOINT_VERSION
+        }
+        # user ID -> {window number: bitmask of min-interval slots that earned}
+        self.slots: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        # (user ID, window) changed since the last checkpoint
+        self._dirty = set()
+        if loaded:
+            self._load_slots()
+        else:
+            self._remove(self.slots_path)  # Left by an abandoned job
+        self.pages = TokenBucket(*BACKFILL_PAGE_RATE)
+        self.scanned = sum(cursor['scanned'] for cursor in self.state['channels'].values())
+        self.started = clock.now()
+        self.scanned_at_start = self.scanned
+        self._fractions: Dict[int, float] = {}
+        self.cancelled = False
+
+    def _load(self) -> Optional[dict]:
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Older checkpoints kept counts or whole mask maps; they can't be resumed
+        return state if state.get('version') == BACKFILL_CHECKPOINT_VERSION else None
+
+    def _load_slots(self) -> None:
+        try:
+            with open(self.slots_path, 'r') as f:
+                for line in f:
+                    try:
+                        entries = json.loads(line)
+                    except ValueError:
+                        continue  # Torn final write
+                    for user_id, window, mask in entries:
+                        self.slots[user_id][window] |= mask
+        except OSError:
+            pass
+
+    def checkpoint(self) -> None:
+        if self._dirty:
+            entries = [[user_id, window, self.slots[user_id][window]] for user_id, window in self._dirty]
+            with open(self.slots_path, 'a') as f:
+                f.write(json.dumps(entries) + "\n")
+            self._dirty.clear()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def discard(self) -> None:
+        self._remove(self.path)
+        self._remove(self.slots_path)
+
+    def _channels(self):
+        me = self.guild.me
+        return [
+            channel for channel in self.guild.text_channels
+            if channel.permissions_for(me).read_message_history
+        ]
+
+    def progress(self) -> float:
+        """Overall fraction done, judged by how far back in time each channel has reached"""
+        channels = self._channels()
+        if not channels:
+            return 1.0
+        total = 0.0
+        for channel in channels:
+            cursor = self.state['channels'].get(str(channel.id))
+            if cursor and cursor['done']:
+                total += 1.0
+            else:
+                total += self._fractions.get(channel.id, 0.0)
+        return total / len(channels)
+
+    def eta(self) -> Optional[float]:
+        fraction = self.progress()
+        elapsed = clock.now() - self.started
+        if fraction <= 0 or self.scanned == self.scanned_at_start:
+            return None
+        return elapsed / fraction - elapsed
+
+    def counts_message(self, message: discord.Message) -> bool:
+        if message.author.bot or message.type != discord.MessageType.default:
+            return False
+        content = message.content
+        return len(content) >= ACTIVITY_MIN_LENGTH and not content.startswith("!")
+
+    async def _walk(self, channel: discord.TextChannel) -> None:
+        cursor = self.state['channels'].setdefault(
+            str(channel.id), {'before': None, 'done': False, 'scanned': 0}
+        )
+        if cursor['done']:
+            return
+        after = datetime.fromtimestamp(self.state['after'], timezone.utc)
+        if cursor['before']:
+            before = discord.Object(cursor['before'])
+        else:
+            before = datetime.fromtimestamp(self.state['until'], timezone.utc)
+        newest = None
+        since_checkpoint = 0
+        while not self.cancelled:
+            # Wait for the shared page budget before each request, not after it
+            wait = self.pages.delay(clock.now())
+            if wait:
+                await clock.sleep(wait)
+            self.pages.take(clock.now())
+            await rate_limits.pace('GET', f"/channels/{channel.id}/messages")
+            page = [
+                message async for message in
+                channel.history(limit=BACKFILL_PAGE_SIZE, before=before, after=after, oldest_first=False)
+            ]
+            for message in page:
+                if newest is None:
+                    newest = message.created_at.timestamp()
+                if self.counts_message(message):
+                    self.record(message.author.id, message.created_at.timestamp())
+                cursor['scanned'] += 1
+                self.scanned += 1
+                span = newest - self.state['after']
+                if span > 0:
+                    self._fractions[channel.id] = (newest - message.created_at.timestamp()) / span
+            if page:
+                cursor['before'] = page[-1].id
+                before = discord.Object(page[-1].id)
+                since_checkpoint += len(page)
+            if len(page) < BACKFILL_PAGE_SIZE:
+                cursor['done'] = True
+                break
+            if since_checkpoint >= BACKFILL_CHECKPOINT_EVERY:
+                self.checkpoint()
+                since_checkpoint = 0
+        self.checkpoint()
+
+    async def _walk_guarded(self, channel, semaphore) -> None:
+        async with semaphore:
+            try:
+                await self._walk(channel)
+            except discord.Forbidden:
+                self.state['channels'][str(channel.id)]['done'] = True
+            except Exception as e:
+                logger.error(f"Backfill of #{channel.name} in {self.guild.id} stopped: {e}")
+
+    def record(self, user_id: int, when: float) -> None:
+        window, offset = divmod(int(when), ACTIVITY_WINDOW)
+        self.slots[user_id][window] |= 1 << (offset // ACTIVITY_MIN_INTERVAL)
+        self._dirty.add((user_id, window))
+
+    def totals(self) -> Dict[int, int]:
+        per_window = ACTIVITY_WINDOW_CAP // ACTIVITY_POINTS
+        return {
+            user_id: min(
+                sum(min(bin(mask).count("1"), per_window) for mask in windows.values()) * ACTIVITY_POINTS,
+                BACKFILL_USER_CAP
+            )
+            for user_id, windows in self.slots.items()
+        }
+
+    async def run(self) -> Optional[tuple]:
+        """Walk every channel, then credit the totals once; None if cancelled or unfinished"""
+        if self.state['applied']:
+            return None
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        await asyncio.gather(*(self._walk_guarded(channel, semaphore) for channel in self._channels()))
+        if self.cancelled or not all(
+            self.state['channels'].get(str(channel.id), {}).get('done') for channel in self._channels()
+        ):
+            return None
+
+        result = await guild_states.get(self.guild.id).ledger.apply_many(
+            self.totals(), key=f"backfill:{self.guild.id}:{self.state['after']}"
+        )
+        self.state['applied'] = True
+        self.checkpoint()
+        return result
+
+
+# guild_id -> running job
+backfill_jobs: Dict[int, BackfillJob] = {}
@@ -0,0 +1,149 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+
+SNAPSHOT_MAGIC = b"PTS1"
+# magic, byte order flag, member count
+SNAPSHOT_HEADER = struct.Struct("<4sBxxxQ")
+
+
+class BalanceStore(MutableMapping):
+    """Compact user_id -> points mapping kept in two parallel sorted arrays.
+
+    IDs live in an ``array('Q')`` and balances in an ``array('q')``, which is
+    16 bytes per member instead of a dict of boxed ints. Missing users read
+    as 0 like the ``defaultdict(int)`` it replaces, so ``store[uid] += n``
+    keeps working.
+    """
+
+    def __init__(self, data=None):
+        self.ids = array('Q')
+        self.balances = array('q')
+        if data:
+            self.update(data)
+
+    def _find(self, user_id: int) -> int:
+        idx = bisect_left(self.ids, user_id)
+        if idx < len(self.ids) and self.ids[idx] == user_id:
+            return idx
+        return -1
+
+    def __getitem__(self, user_id: int) -> int:
+        idx = self._find(user_id)
+        return self.balances[idx] if idx >= 0 else 0
+
+    def get(self, user_id: int, default=0):
+        idx = self._find(user_id)
+        return self.balances[idx] if idx >= 0 else default
+
+    def __contains__(self, user_id) -> bool:
+        return isinstance(user_id, int) and self._find(user_id) >= 0
+
+    def __setitem__(self, user_id: int, balance: int) -> None:
+        idx = bisect_left(self.ids, user_id)
+        if idx < len(self.ids) and self.ids[idx] == user_id:
+            self.balances[idx] = balance
+        else:
+            self.ids.insert(idx, user_id)
+            self.balances.insert(idx, balance)
+
+    def __delitem__(self, user_id: int) -> None:
+        idx = self._find(user_id)
+        if idx < 0:
+            raise KeyError(user_id)
+        del self.ids[idx]
+        del self.balances[idx]
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def items(self):
+        return zip(self.ids, self.balances)
+
+    def values(self):
+        return iter(self.balances)
+
+    def clear(self) -> None:
+        self.ids = array('Q')
+        self.balances = array('q')
+
+    def update(self, other=(), **kwargs) -> None:
+        """Set many balances with one merge pass instead of one insert each"""
+        incoming = dict(other)
+        new_ids = []
+        for user_id, balance in incoming.items():
+            idx = self._find(user_id)
+            if idx >= 0:
+                self.balances[idx] = balance
+            else:
+                new_ids.append(user_id)
+        if new_ids:
+            new_ids.sort()
+            self._merge(new_ids, [incoming[uid] for uid in new_ids])
+
+    def add_many(self, deltas: dict) -> None:
+        """Add a delta to many balances at once, creating missing users"""
+        self.update({uid: self.get(uid) + delta for uid, delta in deltas.items()})
+
+    def _merge(self, new_ids, new_balances) -> None:
+        ids = array('Q')
+        balances = array('q')
+        i = j = 0
+        old_ids, old_balances = self.ids, self.balances
+        while i < len(old_ids) and j < len(new_ids):
+            if old_ids[i] < new_ids[j]:
+                # Copy the whole run that sorts before the next new ID in one slice
+                end = bisect_left(old_ids, new_ids[j], i)
+                ids.extend(old_ids[i:end])
+                balances.extend(old_balances[i:end])
+                i = end
+            else:
+                ids.append(new_ids[j])
+                balances.append(new_balances[j])
+                j += 1
+        ids.extend(old_ids[i:])
+        balances.extend(old_balances[i:])
+        ids.extend(new_ids[j:])
+        balances.extend(new_balances[j:])
+        self.ids, self.balances = ids, balances
+
+    def nbytes(self) -> int:
+        """Memory held by the array buffers"""
+        return (self.ids.buffer_info()[1] * self.ids.itemsize
+                + self.balances.buffer_info()[1] * self.balances.itemsize)
+
+    def snapshot(self, path: str) -> None:
+        """Write the raw array buffers to disk atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, sys.byteorder == "little", len(self.ids)))
+            f.write(memoryview(self.ids))
+            f.write(memoryview(self.balances))
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path: str) -> None:
+        """Replace contents from a snapshot, memory-mapping the file and copying each array in one block"""
+        ids = array('Q')
+        balances = array('q')
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < SNAPSHOT_HEADER.size:
+                raise ValueError(f"Truncated points snapshot: {path}")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                magic, little, count = SNAPSHOT_HEADER.unpack_from(view, 0)
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError(f"Not a points snapshot: {path}")
+                start = SNAPSHOT_HEADER.size
+                split = start + count * 8
+                ids.frombytes(view[start:split])
+                balances.frombytes(view[split:split + count * 8])
+        if bool(little) != (sys.byteorder == "little"):
+            ids.byteswap()
+            balances.byteswap()
+        self.ids, self.balances = ids, balances
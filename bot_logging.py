@@ -0,0 +1,183 @@
+import contextvars
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+
+LOG_FILE = "bot.log"
+# Defaults for the LOG_* environment variables, which setup_logging() reads
+# when called so values loaded from .env after import still apply
+LOG_FORMAT = "text"              # "text" or "json" (JSON lines)
+LOG_ROTATE = "size"              # "size" or "time"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = "midnight"
+LOG_BACKUPS = 7
+LOG_QUEUE_SIZE = 10000
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ('guild_id', 'user_id', 'command')
+
+# Guild/user/command of the command currently running in this task
+log_context = contextvars.ContextVar("log_context", default={})
+
+
+def bind_command_context(ctx) -> None:
+    """Tag every record logged while this command runs with its guild, user and name"""
+    log_context.set({
+        'guild_id': ctx.guild.id if ctx.guild else None,
+        'user_id': ctx.author.id,
+        'command': ctx.command.qualified_name if ctx.command else None
+    })
+
+
+class ContextFilter(logging.Filter):
+    """Copy the bound command context onto records, keeping explicit extra= values"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line with the context fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        metrics = getattr(record, 'metrics', None)
+        if metrics is not None:
+            entry['metrics'] = metrics
+        # Queued records carry the traceback as text (see DroppingQueueHandler.prepare)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking.
+
+    Drops are counted, and the count is reported in a warning as soon as the
+    writer thread has caught up enough to take a record again.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge msg and args but keep the traceback, as text, apart from the message.
+
+        The base class folds the formatted traceback into the message and
+        drops exc_text, which left JSON records without their exc field.
+        """
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self._unreported:
+                notice = logging.makeLogRecord({
+                    'name': "discord_bot.logging",
+                    'levelno': logging.WARNING,
+                    'levelname': "WARNING",
+                    'msg': f"Dropped {self._unreported} log record(s) under backpressure",
+                })
+                self.queue.put_nowait(notice)
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+
+_traceback_formatter = logging.Formatter()
+
+
+class LogListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() waits for room rather than failing on a full queue"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _setting(name: str, default):
+    value = os.getenv(name)
+    return default if value is None else type(default)(value)
+
+
+def _file_handler(path: str) -> logging.Handler:
+    backups = _setting("LOG_BACKUPS", LOG_BACKUPS)
+    if _setting("LOG_ROTATE", LOG_ROTATE) == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=_setting("LOG_ROTATE_WHEN", LOG_ROTATE_WHEN), backupCount=backups,
+            encoding="utf-8", delay=True
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=_setting("LOG_MAX_BYTES", LOG_MAX_BYTES), backupCount=backups,
+            encoding="utf-8", delay=True
+        )
+    # Rotated files are compressed by the listener thread, never on the event loop
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logging(path: str = LOG_FILE, level: int = logging.INFO):
+    """Route all logging through a bounded queue to a background writer thread.
+
+    Returns (listener, queue_handler); call listener.stop() on shutdown to
+    flush what is still queued.
+    """
+    json_lines = _setting("LOG_FORMAT", LOG_FORMAT) == "json"
+    formatter = JsonLinesFormatter() if json_lines else logging.Formatter(TEXT_FORMAT)
+    file_handler = _file_handler(path)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(_setting("LOG_QUEUE_SIZE", LOG_QUEUE_SIZE)))
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = LogListener(
+        queue_handler.queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    return listener, queue_handler
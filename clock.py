@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# How many loop iterations woken tasks get to run before virtual time moves on
+SETTLE_ROUNDS = 20
+
+
+class SystemClock:
+    """Real time backed by time.time() and asyncio.sleep()"""
+
+    def time(self) -> float:
+        return time.time()
+
+    async def sleep(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+
+class VirtualClock:
+    """Manually advanced clock for fast-forwarding prison, cooldown and vote timers.
+
+    Sleepers park on futures in a heap instead of the event loop's timer list,
+    so ``advance(86400)`` runs a simulated day of timers in order, as fast as
+    the woken tasks can execute.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._timers = []
+        self._seq = itertools.count()
+
+    def time(self) -> float:
+        return self._now
+
+    async def sleep(self, delay: float) -> None:
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self._now + delay, next(self._seq), future))
+        await future
+
+    @property
+    def pending(self) -> int:
+        """Number of sleepers still waiting"""
+        return sum(1 for _, _, future in self._timers if not future.done())
+
+    async def advance(self, seconds: float) -> int:
+        """Move time forward, waking sleepers in deadline order. Returns wakeups."""
+        target = self._now + seconds
+        woken = 0
+        await self._settle()
+        while self._timers and self._timers[0][0] <= target:
+            when = self._timers[0][0]
+            self._now = max(self._now, when)
+            # Wake everything due at the same instant before letting tasks run
+            while self._timers and self._timers[0][0] <= when:
+                _, _, future = heapq.heappop(self._timers)
+                if not future.done():
+                    future.set_result(None)
+                    woken += 1
+            await self._settle()
+        self._now = max(self._now, target)
+        return woken
+
+    async def run_until_idle(self, max_seconds: float = float('inf')) -> int:
+        """Fast-forward until no sleepers remain or max_seconds have passed"""
+        deadline = self._now + max_seconds
+        woken = 0
+        await self._settle()
+        while self._timers and self._timers[0][0] <= deadline:
+            woken += await self.advance(self._timers[0][0] - self._now)
+        return woken
+
+    @staticmethod
+    async def _settle():
+        for _ in range(SETTLE_ROUNDS):
+            await asyncio.sleep(0)
+
+
+_clock = SystemClock()
+
+
+def now() -> float:
+    """Current timestamp from the active clock"""
+    return _clock.time()
+
+
+async def sleep(delay: float) -> None:
+    """Sleep on the active clock"""
+    await _clock.sleep(delay)
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(new_clock) -> None:
+    """Swap the clock used by every timer (e.g. a VirtualClock in simulations)"""
+    global _clock
+    _clock = new_clock
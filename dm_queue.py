@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import random
+from collections import deque
+
+import discord
+import clock
+from shared import SCRIPT_DIR, load_data, save_data
+from task_supervisor import task_supervisor
+
+logger = logging.getLogger("discord_bot")
+
+DM_QUEUE_FILE = os.path.join(SCRIPT_DIR, "dm_queue.json")
+DM_GLOBAL_RATE = (5, 5.0)         # 5 DMs per 5 seconds across the bot
+DM_RECIPIENT_RATE = (2, 10.0)     # 2 DMs per 10 seconds to one user
+DM_MAX_ATTEMPTS = 5
+DM_BACKOFF_BASE = 2.0             # seconds, doubled per attempt
+DM_BACKOFF_MAX = 300.0
+DM_CLOSED_TTL = 24 * 3600         # Skip users with closed DMs for a day
+DM_DEDUPE_TTL = 600               # Identical message to same user within 10 minutes is dropped
+DM_IDLE_POLL = 1.0
+CANNOT_DM_USER = 50007            # Discord error code for closed DMs
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens refilled over `per` seconds"""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = clock.now()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class DMDeliveryQueue:
+    """Persistent background DM sender.
+
+    Messages are queued to disk and sent by a single worker that respects a
+    global and a per-recipient token bucket, retries failures with jittered
+    exponential backoff, remembers users whose DMs are closed, and drops
+    duplicate messages to the same user.
+    """
+
+    def __init__(self, path: str = DM_QUEUE_FILE):
+        self.path = path
+        self.jobs = deque(load_data(path) or [])
+        self._ids = itertools.count(max((job['id'] for job in self.jobs), default=0) + 1)
+        self.global_bucket = TokenBucket(*DM_GLOBAL_RATE)
+        self.recipient_buckets = {}
+        self.closed_until = {}
+        self.recent = {}
+        self.sent = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._worker = None
+        self.bot = None
+
+    def save(self) -> None:
+        save_data(list(self.jobs), self.path)
+
+    def dms_closed(self, recipient_id: int) -> bool:
+        until = self.closed_until.get(recipient_id)
+        if until is None:
+            return False
+        if until <= clock.now():
+            del self.closed_until[recipient_id]
+            return False
+        return True
+
+    def enqueue(self, recipient_id: int, content: str, dedupe: bool = True) -> bool:
+        """Queue a DM; returns False if it was dropped as a duplicate or the user has DMs closed"""
+        now = clock.now()
+        if self.dms_closed(recipient_id):
+            return False
+        if dedupe:
+            digest = hashlib.sha1(f"{recipient_id}:{content}".encode()).hexdigest()
+            if self.recent.get(digest, 0) > now:
+                return False
+            self.recent[digest] = now + DM_DEDUPE_TTL
+            if len(self.recent) > 1000:
+                self.recent = {k: v for k, v in self.recent.items() if v > now}
+        self.jobs.append({
+            'id': next(self._ids),
+            'recipient_id': recipient_id,
+            'content': content,
+            'attempts': 0,
+            'not_before': now
+        })
+        self.save()
+        self._wakeup.set()
+        return True
+
+    def start(self, bot) -> None:
+        """Start the delivery worker (no-op if it is already running)"""
+        self.bot = bot
+        self._worker = task_supervisor.spawn('dm_queue', 'worker', self._run())
+
+    def _recipient_bucket(self, recipient_id: int) -> TokenBucket:
+        bucket = self.recipient_buckets.get(recipient_id)
+        if bucket is None:
+            bucket = self.recipient_buckets[recipient_id] = TokenBucket(*DM_RECIPIENT_RATE)
+        return bucket
+
+    def _next_job(self, now: float):
+        """Pop the first job that is due and whose buckets allow it; else (None, wait)"""
+        wait = DM_IDLE_POLL
+        for idx, job in enumerate(self.jobs):
+            delay = max(job['not_before'] - now,
+                        self._recipient_bucket(job['recipient_id']).delay(now),
+                        self.global_bucket.delay(now))
+            if delay <= 0:
+                del self.jobs[idx]
+                return job, 0
+            wait = min(wait, delay)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            if not self.jobs:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = clock.now()
+            job, wait = self._next_job(now)
+            if job is None:
+                await clock.sleep(wait)
+                continue
+            self.global_bucket.take(now)
+            self._recipient_bucket(job['recipient_id']).take(now)
+            await self._deliver(job)
+            self.save()
+            # Buckets that have refilled completely carry no state worth keeping
+            if len(self.recipient_buckets) > 1000:
+                now = clock.now()
+                self.recipient_buckets = {
+                    rid: b for rid, b in self.recipient_buckets.items() if not b.full(now)
+                }
+
+    async def _deliver(self, job: dict) -> None:
+        recipient_id = job['recipient_id']
+        if self.dms_closed(recipient_id):
+            return
+        try:
+            user = self.bot.get_user(recipient_id) or await self.bot.fetch_user(recipient_id)
+            await user.send(job['content'])
+            self.sent += 1
+        except discord.NotFound:
+            self.failed += 1
+        except discord.Forbidden as e:
+            if e.code == CANNOT_DM_USER:
+                self.closed_until[recipient_id] = clock.now() + DM_CLOSED_TTL
+                # Anything else queued for this user would fail the same way
+                self.jobs = deque(j for j in self.jobs if j['recipient_id'] != recipient_id)
+            self.failed += 1
+            logger.info(f"DM to {recipient_id} refused: {e}")
+        except Exception as e:
+            job['attempts'] += 1
+            if job['attempts'] >= DM_MAX_ATTEMPTS:
+                self.failed += 1
+                logger.error(f"Giving up DM to {recipient_id} after {job['attempts']} attempts: {e}")
+                return
+            backoff = min(DM_BACKOFF_MAX, DM_BACKOFF_BASE * 2 ** job['attempts'])
+            job['not_before'] = clock.now() + random.uniform(backoff / 2, backoff)
+            self.jobs.append(job)
+            logger.warning(f"DM to {recipient_id} failed (attempt {job['attempts']}), retrying: {e}")
+
+
+dm_queue = DMDeliveryQueue()
@@ -0,0 +1,60 @@
+import logging
+import os
+from typing import FrozenSet, Tuple
+
+import discord
+
+logger = logging.getLogger("discord_bot")
+
+# Comma-separated list of enabled features; everything is on by default
+BOT_FEATURES = os.getenv("BOT_FEATURES", "prison,reports,points,activity,voice")
+# Guilds with at most this many members are chunked (fully cached) as before;
+# larger ones only cache members seen in voice or in member events.
+# A cached member costs roughly 0.9 KB (see measure_member_cache.py)
+MEMBER_CACHE_CHUNK_LIMIT = int(os.getenv("MEMBER_CACHE_CHUNK_LIMIT", "5000"))
+
+KNOWN_FEATURES = {'prison', 'reports', 'points', 'activity', 'voice'}
+
+
+def enabled_features(spec: str = BOT_FEATURES) -> FrozenSet[str]:
+    features = {name.strip().lower() for name in spec.split(",") if name.strip()}
+    unknown = features - KNOWN_FEATURES
+    if unknown:
+        logger.warning(f"Ignoring unknown BOT_FEATURES entries: {', '.join(sorted(unknown))}")
+    return frozenset(features & KNOWN_FEATURES)
+
+
+def build_gateway_profile(features: FrozenSet[str]) -> Tuple[discord.Intents, discord.MemberCacheFlags]:
+    """Intents and member cache flags for the enabled features.
+
+    - Prefix commands always need message content.
+    - prison: member events, for the prison role being added by hand.
+      Members seen in those events stay cached.
+    - reports and points: the members intent too. Their commands take
+      members by name, and the converter can only search by name through
+      the gateway member query, which Discord gates behind that intent.
+    - activity: message events (already on for commands).
+    - voice: voice states, with voice members cached, for voice points and
+      the move/kick redeems.
+    """
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    intents.members = bool(features & {'prison', 'reports', 'points'})
+    intents.voice_states = 'voice' in features
+    flags = discord.MemberCacheFlags.none()
+    flags.joined = intents.members
+    flags.voice = intents.voice_states
+    return intents, flags
+
+
+def should_chunk(bot, guild: discord.Guild) -> bool:
+    """Whether to load the full member list for this guild"""
+    if guild.chunked or not bot.intents.members:
+        return False
+    return (guild.member_count or 0) <= MEMBER_CACHE_CHUNK_LIMIT
+
+
+features = enabled_features()
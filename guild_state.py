@@ -0,0 +1,346 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import clock
+from balance_store import BalanceStore
+from ledger import PointsLedger
+from point_stats import EventHistory
+from records import ReportRecord, PrisonRecord, encode, decode, decode_id_sets
+import seasons
+from member_lookup import member_lookup
+from shared import (
+    SCRIPT_DIR,
+    REPORT_DATA_FILE,
+    PRISON_DATA_FILE,
+    ReportIndex,
+    report_window,
+    load_data,
+    save_data
+)
+
+logger = logging.getLogger("discord_bot")
+
+GUILD_DATA_DIR = os.path.join(SCRIPT_DIR, "guilds")
+GUILD_IDLE_SECONDS = 1800  # Evict partitions nobody touched for 30 minutes
+
+# Pre-partition files, split across guilds once by migrate_legacy()
+LEGACY_FILES = {
+    'reports': REPORT_DATA_FILE,
+    'prison': PRISON_DATA_FILE,
+    'dm_permissions': os.path.join(SCRIPT_DIR, "dm_permissions.json"),
+    'points': os.path.join(SCRIPT_DIR, "user_points.bin"),
+    'points_json': os.path.join(SCRIPT_DIR, "user_points.json"),
+    'point_history': os.path.join(SCRIPT_DIR, "points_history.json"),
+    'vc_locks': os.path.join(SCRIPT_DIR, "vc_locks.json"),
+}
+# Where migrated legacy files are moved; records no guild claimed stay here
+LEGACY_ARCHIVE_DIR = os.path.join(SCRIPT_DIR, "legacy_migrated")
+PARTITION_FILES = {
+    'reports': "reports.json",
+    'prison': "prison.json",
+    'dm_permissions': "dm_permissions.json",
+    'points': "points.bin",
+    'points_json': "points.json",
+    'point_history': "points_history.json",
+    'vc_locks': "vc_locks.json",
+    'season': "season.json",
+    'activity': "activity.json",
+}
+
+
+class GuildState:
+    """Points, reports, DM permissions and prison records for one guild.
+
+    Every partition reads and writes its own files under guilds/<guild_id>/,
+    so a save in one guild never rewrites another guild's data.
+    """
+
+    def __init__(self, guild_id: int, root: str = GUILD_DATA_DIR):
+        self.guild_id = guild_id
+        self.path = os.path.join(root, str(guild_id))
+        self.points = BalanceStore()
+        self.point_history = EventHistory()
+        self.ledger = PointsLedger(self.points, self.save_points)
+        self.reported_users: Dict[int, ReportRecord] = {}
+        self.report_index = ReportIndex()
+        # Target user ID -> reporters allowed to DM them
+        self.dm_permissions = defaultdict(set)
+        self.prisoners: Dict[int, PrisonRecord] = {}
+        # Voice channel ID -> {locked member ID: expiry time}
+        self.vc_locks: Dict[int, Dict[int, float]] = defaultdict(dict)
+        # Current season number, when it started, and a closed season whose reset is unfinished
+        self.season = {'number': 1, 'started': clock.now(), 'reset_pending': None}
+        # When live chat earning started here; backfills stop at this point
+        self.activity_since: Optional[float] = None
+        self.last_used = clock.now()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, PARTITION_FILES[name])
+
+    def load(self) -> "GuildState":
+        """Read the partition, creating an empty one on first use"""
+        if os.path.isdir(self.path):
+            self._read({name: self._file(name) for name in PARTITION_FILES})
+            season = load_data(self._file('season'))
+            if season:
+                self.season.update(season)
+            else:
+                # Partitions from before seasons start their first one now
+                self.save_season()
+            self.activity_since = load_data(self._file('activity')).get('live_since')
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self.flush()
+            logger.info(f"Created state partition for guild {self.guild_id}")
+        self.report_index.rebuild(self.reported_users)
+        seasons.catch_up(self)
+        return self
+
+    def _read(self, files: Dict[str, str]) -> None:
+        self.reported_users.update(decode(ReportRecord, load_data(files['reports'])))
+
+        prison_data = load_data(files['prison'])
+        if 'user_roles' in prison_data:
+            prison_data = self._upgrade_prison_data(prison_data)
+        self.prisoners.update(decode(PrisonRecord, prison_data))
+
+        self.dm_permissions.update(decode_id_sets(load_data(files['dm_permissions'])))
+        for channel_id, locks in load_data(files['vc_locks']).items():
+            self.vc_locks[int(channel_id)] = {int(user_id): expires for user_id, expires in locks.items()}
+
+        try:
+            if os.path.exists(files['points']):
+                self.points.load_snapshot(files['points'])
+            elif os.path.exists(files['points_json']):
+                with open(files['points_json'], "r") as f:
+                    self.points.update({int(k): v for k, v in json.load(f).items()})
+        except Exception as e:
+            logger.error(f"Error loading points for guild {self.guild_id}: {e}")
+        self.point_history.load(files['point_history'])
+
+    def save_points(self) -> bool:
+        try:
+            self.points.snapshot(self._file('points'))
+            self.point_history.save(self._file('point_history'))
+            return True
+        except Exception as e:
+            logger.error(f"Error saving points for guild {self.guild_id}: {e}")
+            return False
+
+    @staticmethod
+    def _upgrade_prison_data(prison_data: dict) -> dict:
+        """Fold the old parallel user_roles/user_nicknames/imprisonment_times maps into records"""
+        nicknames = prison_data.get('user_nicknames', {})
+        times = prison_data.get('imprisonment_times', {})
+        # Older data has no start time; treat those sentences as served
+        return {
+            user_id: {'role_ids': roles, 'nick': nicknames.get(user_id), 'since': times.get(user_id, 0)}
+            for user_id, roles in prison_data['user_roles'].items()
+        }
+
+    def save_reports(self) -> bool:
+        return save_data(encode(self.reported_users), self._file('reports'))
+
+    def save_prison(self) -> bool:
+        """Save prison state (role IDs, nicknames and start times)"""
+        return save_data(encode(self.prisoners), self._file('prison'))
+
+    def save_dm_permissions(self) -> bool:
+        allowed = {user_id: ids for user_id, ids in self.dm_permissions.items() if ids}
+        return save_data(encode(allowed), self._file('dm_permissions'))
+
+    def save_vc_locks(self) -> bool:
+        locks = {channel_id: members for channel_id, members in self.vc_locks.items() if members}
+        return save_data(encode(locks), self._file('vc_locks'))
+
+    def save_season(self) -> bool:
+        return save_data(self.season, self._file('season'))
+
+    def save_activity(self) -> bool:
+        return save_data({'live_since': self.activity_since}, self._file('activity'))
+
+    def flush(self) -> None:
+        self.save_season()
+        self.save_points()
+        self.save_reports()
+        self.save_prison()
+        self.save_dm_permissions()
+        self.save_vc_locks()
+        self.save_activity()
+
+    def report(self, user_id: int) -> Optional[ReportRecord]:
+        return self.reported_users.get(user_id)
+
+    def add_report(self, user_id: int, reason: str, when: float) -> ReportRecord:
+        """Record one report against a user and keep the index in step"""
+        record = self.reported_users.get(user_id)
+        if record is None:
+            record = self.reported_users[user_id] = ReportRecord()
+        record.count += 1
+        record.reasons.append(reason)
+        record.last_report = when
+        record.guild_id = self.guild_id
+        self.report_index.refresh(user_id, record)
+        return record
+
+    def set_report_count(self, user_id: int, count: int) -> None:
+        """Overwrite a user's report count (e.g. reset on release)"""
+        record = self.reported_users.get(user_id)
+        if record is not None:
+            record.count = count
+            self.report_index.refresh(user_id, record)
+        if count == 0:
+            report_window.reset((self.guild_id, user_id))
+
+    def remove_reports(self, user_id: int) -> bool:
+        """Drop a user's report record entirely"""
+        self.report_index.discard(user_id)
+        report_window.reset((self.guild_id, user_id))
+        return self.reported_users.pop(user_id, None) is not None
+
+    def clear_reports(self) -> None:
+        for user_id in self.reported_users:
+            report_window.reset((self.guild_id, user_id))
+        self.reported_users.clear()
+        self.report_index.rebuild(self.reported_users)
+
+    def evictable(self, now: float, idle_seconds: float) -> bool:
+        # Partitions holding prisoners or VC locks stay resident so expiries stay on schedule
+        return (
+            now - self.last_used >= idle_seconds
+            and not self.prisoners
+            and not any(self.vc_locks.values())
+            and self.ledger.idle
+        )
+
+
+class GuildStateManager:
+    """Loads guild partitions on first use and evicts idle ones after a flush"""
+
+    def __init__(self, root: str = GUILD_DATA_DIR, idle_seconds: float = GUILD_IDLE_SECONDS):
+        self.root = root
+        self.idle_seconds = idle_seconds
+        self._partitions: Dict[int, GuildState] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, guild_id: int) -> GuildState:
+        state = self._partitions.get(guild_id)
+        if state is None:
+            state = self._partitions[guild_id] = GuildState(guild_id, self.root).load()
+            self.loads += 1
+        state.last_used = clock.now()
+        return state
+
+    def has_prisoners(self, guild_id: int) -> bool:
+        """Whether a guild holds prisoners, reading only its saved prison file if it isn't loaded"""
+        state = self._partitions.get(guild_id)
+        if state is not None:
+            return bool(state.prisoners)
+        return bool(load_data(os.path.join(self.root, str(guild_id), PARTITION_FILES['prison'])))
+
+    def loaded(self) -> List[GuildState]:
+        return list(self._partitions.values())
+
+    def evict_idle(self) -> int:
+        now = clock.now()
+        evicted = 0
+        for guild_id, state in list(self._partitions.items()):
+            if state.evictable(now, self.idle_seconds):
+                state.flush()
+                del self._partitions[guild_id]
+                evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def flush_all(self) -> None:
+        for state in self._partitions.values():
+            state.flush()
+
+    async def migrate_legacy(self, guilds) -> int:
+        """Split the pre-partition global files across guilds, once.
+
+        Every record goes to exactly one guild: reports to the guild they
+        were filed in, VC locks to the guild owning the channel, everything
+        else to the first guild the user is a member of. The files are then
+        moved to legacy_migrated/, which marks them consumed; records no
+        guild claimed are left there. Returns the number of records assigned.
+        """
+        present = {name: path for name, path in LEGACY_FILES.items() if os.path.exists(path)}
+        if not present or not guilds:
+            return 0
+        guilds = sorted(guilds, key=lambda guild: guild.id)
+        by_id = {guild.id: guild for guild in guilds}
+        legacy = GuildState(0)
+        legacy._read(LEGACY_FILES)
+
+        owners = {}
+
+        async def owner(user_id: int):
+            if user_id not in owners:
+                if len(guilds) == 1:
+                    owners[user_id] = guilds[0]
+                else:
+                    owners[user_id] = None
+                    for guild in guilds:
+                        if await member_lookup.get(guild, user_id) is not None:
+                            owners[user_id] = guild
+                            break
+            return owners[user_id]
+
+        touched = {}
+        assigned = 0
+
+        def target(guild) -> GuildState:
+            state = touched.get(guild.id)
+            if state is None:
+                state = touched[guild.id] = self.get(guild.id)
+            return state
+
+        # Partitions seeded by older releases may already hold a copy; never add twice
+        for user_id, record in legacy.reported_users.items():
+            guild = by_id.get(record.guild_id) if record.guild_id is not None else await owner(user_id)
+            if guild is not None:
+                record.guild_id = guild.id
+                target(guild).reported_users.setdefault(user_id, record)
+                assigned += 1
+        for user_id, record in legacy.prisoners.items():
+            if (guild := await owner(user_id)) is not None:
+                target(guild).prisoners.setdefault(user_id, record)
+                assigned += 1
+        for user_id, allowed in legacy.dm_permissions.items():
+            if (guild := await owner(user_id)) is not None:
+                target(guild).dm_permissions[user_id] |= allowed
+                assigned += 1
+        for user_id, balance in legacy.points.items():
+            if (guild := await owner(user_id)) is not None:
+                state = target(guild)
+                if user_id not in state.points:
+                    state.points[user_id] = balance
+                assigned += 1
+        for channel_id, locks in legacy.vc_locks.items():
+            guild = next((guild for guild in guilds if guild.get_channel(channel_id)), None)
+            if guild is not None:
+                target(guild).vc_locks.setdefault(channel_id, locks)
+                assigned += 1
+        # Aggregate counters can't be split by user; they only follow a single guild
+        if len(guilds) == 1 and max(target(guilds[0]).point_history.slot_hour) < 0:
+            target(guilds[0]).point_history = legacy.point_history
+
+        for state in touched.values():
+            state.report_index.rebuild(state.reported_users)
+            state.flush()
+        os.makedirs(LEGACY_ARCHIVE_DIR, exist_ok=True)
+        for path in present.values():
+            os.replace(path, os.path.join(LEGACY_ARCHIVE_DIR, os.path.basename(path)))
+        logger.info(
+            f"Migrated {assigned} legacy record(s) into {len(touched)} guild partition(s); "
+            f"originals moved to {LEGACY_ARCHIVE_DIR}"
+        )
+        return assigned
+
+
+guild_states = GuildStateManager()
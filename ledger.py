@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger("discord_bot")
+
+IDEMPOTENCY_CACHE_SIZE = 10000  # Remembered transaction keys
+
+
+class InsufficientPoints(Exception):
+    """Raised when a debit would take a balance below zero"""
+
+    def __init__(self, user_id: int, balance: int, amount: int):
+        super().__init__(f"User {user_id} has {balance} points, needs {amount}")
+        self.user_id = user_id
+        self.balance = balance
+        self.amount = amount
+
+
+class PointsLedger:
+    """Atomic credit/debit/transfer on a balances mapping.
+
+    Each user has their own lock, created on demand and dropped once nobody
+    holds it, so operations on unrelated users never wait on each other.
+    Passing ``key`` makes an operation idempotent: a repeated key returns the
+    first result instead of applying the change again.
+    """
+
+    def __init__(self, balances, persist):
+        self.balances = balances
+        self.persist = persist
+        self._locks = {}
+        self._holders = defaultdict(int)
+        self._applied = OrderedDict()
+
+    def balance(self, user_id: int) -> int:
+        return self.balances.get(user_id, 0)
+
+    @property
+    def idle(self) -> bool:
+        """True when no operation holds or waits on any user's lock"""
+        return not self._holders
+
+    @asynccontextmanager
+    async def hold(self, *user_ids: int):
+        """Lock the given users, always in ascending ID order to avoid deadlocks"""
+        ids = sorted(set(user_ids))
+        for user_id in ids:
+            self._holders[user_id] += 1
+        acquired = []
+        try:
+            for user_id in ids:
+                lock = self._locks.setdefault(user_id, asyncio.Lock())
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            for user_id in ids:
+                self._holders[user_id] -= 1
+                if not self._holders[user_id]:
+                    del self._holders[user_id]
+                    self._locks.pop(user_id, None)
+
+    def _replay(self, key):
+        if key is None or key not in self._applied:
+            return None
+        self._applied.move_to_end(key)
+        return self._applied[key]
+
+    def _remember(self, key, result):
+        if key is None:
+            return
+        self._applied[key] = result
+        if len(self._applied) > IDEMPOTENCY_CACHE_SIZE:
+            self._applied.popitem(last=False)
+
+    async def credit(self, user_id: int, amount: int, key: str = None) -> int:
+        """Add points and return the new balance"""
+        cached = self._replay(key)
+        if cached is not None:
+            return cached
+        async with self.hold(user_id):
+            cached = self._replay(key)
+            if cached is not None:
+                return cached
+            new_balance = self.balance(user_id) + amount
+            self.balances[user_id] = new_balance
+            self._remember(key, new_balance)
+            self.persist()
+            return new_balance
+
+    async def debit(self, user_id: int, amount: int, key: str = None) -> int:
+        """Remove points and return the new balance, or raise InsufficientPoints"""
+        cached = self._replay(key)
+        if cached is not None:
+            return cached
+        async with self.hold(user_id):
+            cached = self._replay(key)
+            if cached is not None:
+                return cached
+            balance = self.balance(user_id)
+            if balance < amount:
+                raise InsufficientPoints(user_id, balance, amount)
+            new_balance = balance - amount
+            self.balances[user_id] = new_balance
+            self._remember(key, new_balance)
+            self.persist()
+            return new_balance
+
+    async def transfer(self, from_id: int, to_id: int, amount: int, key: str = None):
+        """Move points between users; returns (from_balance, to_balance)"""
+        cached = self._replay(key)
+        if cached is not None:
+            return cached
+        async with self.hold(from_id, to_id):
+            cached = self._replay(key)
+            if cached is not None:
+                return cached
+            balance = self.balance(from_id)
+            if balance < amount:
+                raise InsufficientPoints(from_id, balance, amount)
+            self.balances[from_id] = balance - amount
+            self.balances[to_id] = self.balance(to_id) + amount
+            result = (self.balances[from_id], self.balances[to_id])
+            self._remember(key, result)
+            self.persist()
+            return result
+
+    async def apply_many(self, deltas: dict, key: str = None):
+        """Apply {user_id: delta} as one transaction with a single persist.
+
+        Debits that would overdraw a balance are skipped rather than failing
+        the batch. Returns (applied, skipped) where applied maps user IDs to
+        the delta actually applied and skipped lists overdrawn user IDs.
+        """
+        cached = self._replay(key)
+        if cached is not None:
+            return cached
+        async with self.hold(*deltas):
+            cached = self._replay(key)
+            if cached is not None:
+                return cached
+            applied = {}
+            new_balances = {}
+            skipped = []
+            for user_id, delta in deltas.items():
+                new_balance = self.balance(user_id) + delta
+                if new_balance < 0:
+                    skipped.append(user_id)
+                    continue
+                new_balances[user_id] = new_balance
+                applied[user_id] = delta
+            # One update() lets array-backed stores merge new users in a single pass
+            self.balances.update(new_balances)
+            result = (applied, skipped)
+            self._remember(key, result)
+            if applied:
+                self.persist()
+            return result
@@ -1,51 +1,93 @@
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
+import asyncio
 import os
+import signal
 import sys
-import time
-import asyncio
+import clock
 import json
 from collections import defaultdict
 import logging
 import threading
 from shared import (
-    load_data,
-    save_data,
-    PRISON_DATA_FILE,
-    REPORT_DATA_FILE,
     PRISON_ROLE_NAME,
-    user_roles_before_prison,
-    user_nicknames_before_prison,
-    imprisonment_times,
-    reported_users,
     log_activity
 )
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("discord_bot")
+from snapshots import restore_before_startup, snapshot_sync_from_env, SNAPSHOT_INTERVAL_MINUTES
+from bot_logging import setup_logging, bind_command_context
 
 # Load environment variables
 load_dotenv()
 
-# Initialize intents
-intents = discord.Intents.default()
-intents.messages = True
-intents.guilds = True
-intents.members = True
-intents.message_content = True
-intents.voice_states = True
+# Set up logging; records are written by a background thread, off the event loop
+log_listener, log_queue_handler = setup_logging()
+logger = logging.getLogger("discord_bot")
+
+# Local files don't survive a Cloud Run restart; pull the last snapshot
+# before the modules below read their state files at import time
+snapshot_sync = snapshot_sync_from_env()
+if snapshot_sync:
+    restore_before_startup(snapshot_sync)
+
+from guild_state import guild_states
+from dm_queue import dm_queue
+from prison import prison_service
+from vc_locks import vc_locks
+from task_supervisor import task_supervisor
+from rate_limits import rate_limits
+from gateway_profile import build_gateway_profile, features, should_chunk
+from activity import activity_earner
+from voice_points import voice_tracker
+from report_search import report_search
+
+# Intents and member caching follow the enabled features (BOT_FEATURES)
+intents, member_cache_flags = build_gateway_profile(features)
+
+class PrisonBot(commands.Bot):
+    shutdown_task = None
+    shutdown_started = False
+
+    async def setup_hook(self):
+        # Cloud Run stops the container with SIGTERM; discord.py itself only handles Ctrl+C
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.request_shutdown)
+        except NotImplementedError:
+            pass  # No signal handlers on Windows event loops
+
+    def request_shutdown(self):
+        if self.shutdown_task is None:
+            self.shutdown_task = asyncio.ensure_future(self.close())
+
+    async def close(self):
+        if self.shutdown_started:
+            return await super().close()
+        self.shutdown_started = True
+        # Finish in-flight edits and redeems, cancel timers; restore reschedules them on startup
+        drained = await task_supervisor.drain()
+        if drained:
+            logger.info(f"Drained {drained} background task(s) on shutdown")
+        # Credit chat and voice earnings now; the cogs only unload after the final upload
+        await activity_earner.flush()
+        await voice_tracker.checkpoint()
+        guild_states.flush_all()
+        if snapshot_sync:
+            try:
+                await snapshot_sync.push()
+            except Exception as e:
+                logger.error(f"Final snapshot upload failed: {e}")
+            await snapshot_sync.backend.close()
+        await super().close()
 
 # Initialize bot
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = PrisonBot(
+    command_prefix='!',
+    intents=intents,
+    member_cache_flags=member_cache_flags,
+    # Small guilds are chunked in on_ready; large ones stay lean (see gateway_profile)
+    chunk_guilds_at_startup=False,
+    http_trace=rate_limits.trace_config()
+)
 
 # Constants
 LOG_CHANNEL_IDS = [1351561404150448248, 1350543441821564988]
@@ -64,190 +106,93 @@ def ensure_directory_exists():
     """Ensure the data directory exists"""
     os.makedirs(SCRIPT_DIR, exist_ok=True)
 
-async def restore_prison_state(prison_data):
+async def restore_prison_state():
     """Restore prison state after bot restart"""
-    if not prison_data:
-        return
+    # Replay transitions interrupted by a crash first; nothing new starts before this
+    await prison_service.recover(bot)
 
     for guild in bot.guilds:
-        prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
+        # Loading the partition is what brings its prisoners into memory; the
+        # replay above already loaded guilds with in-flight intents, the rest stay lazy
+        if guild_states.has_prisoners(guild.id):
+            guild_states.get(guild.id)
+        prison_role = await prison_service.ensure_prison_role(bot, guild)
         if not prison_role:
-            try:
-                prison_role = await guild.create_role(
-                    name=PRISON_ROLE_NAME,
-                    permissions=discord.Permissions.none(),
-                    reason="Prison system initialization"
+            logger.error(f"Failed to create prison role in {guild.name}")
+            continue
+        # Pick up anyone given the prison role while the bot was offline
+        for member in prison_role.members:
+            if not prison_service.is_tracked(member):
+                await prison_service.adopt(bot, member, prison_role)
+
+    now = clock.now()
+    for state in guild_states.loaded():
+        for user_id, record in state.prisoners.items():
+            remaining = record.since + PRISON_DURATION - now
+            if remaining > 0:
+                task_supervisor.spawn(
+                    'prison_release', (state.guild_id, user_id),
+                    prison_service.release_after_delay(bot, remaining)
                 )
-                
-                for channel in guild.channels:
-                    try:
-                        await channel.set_permissions(
-                            prison_role,
-                            send_messages=False,
-                            add_reactions=False,
-                            connect=False,
-                            speak=False,
-                            view_channel=True
-                        )
-                    except Exception as e:
-                        logger.debug(f"Couldn't set permissions for {channel.name}: {e}")
-                        continue
-            except Exception as e:
-                logger.error(f"Failed to create prison role in {guild.name}: {e}")
-                continue
-
-        # Restore prisoners
-        if 'user_roles' in prison_data:
-            for user_id_str, role_ids in prison_data['user_roles'].items():
-                try:
-                    user_id = int(user_id_str)
-                    member = guild.get_member(user_id)
-                    if not member:
-                        continue
-
-                    # Calculate remaining prison time
-                    imprisonment_time = prison_data.get('imprisonment_times', {}).get(user_id_str, 0)
-                    remaining_time = max(0, (imprisonment_time + PRISON_DURATION) - time.time())
-
-                    if remaining_time > 0:
-                        # Store original data
-                        user_roles_before_prison[user_id] = []
-                        for role_id in role_ids:
-                            role = guild.get_role(int(role_id))
-                            if role:
-                                user_roles_before_prison[user_id].append(role)
-                        
-                        if 'user_nicknames' in prison_data:
-                            user_nicknames_before_prison[user_id_str] = prison_data['user_nicknames'].get(user_id_str, "")
-
-                        # Apply prison state
-                        if prison_role not in member.roles:
-                            await member.add_roles(prison_role)
-                        
-                        # Set prisoner nickname
-                        new_nick = f"🔒 Prisoner"
-                        if len(new_nick) > 32:
-                            new_nick = new_nick[:32]
-                        try:
-                            await member.edit(nick=new_nick)
-                        except discord.errors.Forbidden:
-                            pass
-                        
-                        # Schedule release
-                        asyncio.create_task(release_after_delay(member, remaining_time))
-                        
-                except Exception as e:
-                    logger.error(f"Error restoring prisoner {user_id_str}: {e}")
-                    continue
+
+    # Prisoners whose time ran out while the bot was down
+    await prison_service.release_due(bot)
 
 @tasks.loop(minutes=5)
 async def check_prison_releases():
-    """Background task to check and release prisoners with auto-fix"""
+    """Background task to release prisoners whose time is up"""
+    await prison_service.release_due(bot)
+
+@tasks.loop(minutes=5)
+async def evict_idle_guilds():
+    """Flush and drop guild partitions that have gone quiet"""
+    evicted = guild_states.evict_idle()
+    if evicted:
+        logger.info(f"Evicted {evicted} idle guild partition(s)")
+
+@tasks.loop(minutes=1)
+async def expire_vc_locks():
+    """Lift kick-locks whose hour is up"""
+    cleared = await vc_locks.expire_due(bot)
+    if cleared:
+        logger.info(f"Lifted {cleared} expired kick lock(s)")
+
+@tasks.loop(hours=24)
+async def prune_vc_overwrites():
+    """Daily sweep of voice overwrites left behind by members who have left"""
     for guild in bot.guilds:
-        try:
-            prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
-            if not prison_role:
-                continue
-
-            for member in guild.members:
-                try:
-                    if prison_role in member.roles:
-                        if member.id not in user_roles_before_prison:
-                            logger.info(f"Auto-adding {member.name} to prison system")
-
-                            user_roles_before_prison[member.id] = [
-                                role for role in member.roles 
-                                if role != prison_role and not role.is_default()
-                            ]
-                            user_nicknames_before_prison[str(member.id)] = member.display_name
-                            imprisonment_times[member.id] = time.time()
-                            
-                            try:
-                                new_nick = f"🔒 Prisoner"
-                                if len(new_nick) > 32:
-                                    new_nick = new_nick[:32]
-                                await member.edit(nick=new_nick)
-                            except discord.errors.Forbidden:
-                                pass
-                            
-                            save_data({
-                                'user_roles': {
-                                    str(user_id): [role.id for role in roles]
-                                    for user_id, roles in user_roles_before_prison.items()
-                                },
-                                'user_nicknames': dict(user_nicknames_before_prison),
-                                'imprisonment_times': imprisonment_times
-                            }, PRISON_DATA_FILE)
-                            
-                            asyncio.create_task(release_after_delay(member, PRISON_DURATION))
-                            
-                except Exception as e:
-                    logger.error(f"Error processing prisoner {member.name}: {e}")
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"Error checking prison in {guild.name}: {e}")
-            continue
+        channels, removed = await vc_locks.prune_orphans(guild)
+        if removed:
+            logger.info(f"Pruned {removed} orphaned overwrite(s) across {channels} channel(s) in {guild.id}")
 
-async def release_after_delay(member, delay):
-    """Release member after a delay"""
-    await asyncio.sleep(delay)
-    await release_from_prison(member)
+@tasks.loop(minutes=5)
+async def log_rate_limit_metrics():
+    """Periodic rate limit snapshot; JSON logs carry the counters under the metrics key"""
+    rate_limits.prune()
+    logger.info("Rate limit metrics", extra={'metrics': rate_limits.metrics()})
 
-async def release_from_prison(member):
-    """Release a member from prison"""
-    if not member:
-        return False
-    
+@bot.event
+async def on_member_update(before, after):
+    """Track members who were given the prison role by hand"""
+    prison_role = discord.utils.get(after.guild.roles, name=PRISON_ROLE_NAME)
+    if prison_role and prison_role in after.roles and prison_role not in before.roles:
+        await prison_service.adopt(bot, after, prison_role)
+
+@tasks.loop(minutes=SNAPSHOT_INTERVAL_MINUTES)
+async def push_snapshot():
+    """Upload state files that changed since the last snapshot"""
     try:
-        prison_role = discord.utils.get(member.guild.roles, name=PRISON_ROLE_NAME)
-        if not prison_role or prison_role not in member.roles:
-            return False
-            
-        # Release from prison
-        original_roles = user_roles_before_prison.pop(member.id, [])
-        
-        if not original_roles:
-            await member.remove_roles(prison_role)
-        else:
-            roles_to_apply = [role for role in original_roles if role.id != prison_role.id]
-            await member.edit(roles=roles_to_apply)
-        
-        # Reset nickname
-        original_nick = user_nicknames_before_prison.pop(str(member.id), None)
-        if original_nick:
-            try:
-                await member.edit(nick=original_nick)
-            except discord.errors.Forbidden:
-                pass
-        elif member.display_name.startswith("🔒 Prisoner"):
-            try:
-                await member.edit(nick=None)
-            except discord.errors.Forbidden:
-                pass
-        
-        # Reset reports
-        if str(member.id) in reported_users:
-            reported_users[str(member.id)]['count'] = 0
-            save_data(reported_users, REPORT_DATA_FILE)
-        
-        # Save prison state
-        save_data({
-            'user_roles': {
-                str(user_id): [role.id for role in roles]
-                for user_id, roles in user_roles_before_prison.items()
-            },
-            'user_nicknames': dict(user_nicknames_before_prison),
-            'imprisonment_times': imprisonment_times
-        }, PRISON_DATA_FILE)
-        
-        await log_activity(bot, f"🔓 {member.mention} has been released from prison!")
-        return True
-        
+        written = await snapshot_sync.push()
     except Exception as e:
-        await log_activity(bot, f"❌ Error releasing {member.mention}: {e}")
-        logger.error(f"Error in release_from_prison: {e}")
-        return False
+        logger.error(f"Snapshot upload failed: {e}")
+        return
+    if written:
+        logger.info(f"Uploaded {written} changed state file(s) to the snapshot store")
+
+@bot.event
+async def on_guild_join(guild):
+    if should_chunk(bot, guild):
+        await guild.chunk()
 
 @bot.event
 async def on_ready():
@@ -255,13 +200,33 @@ async def on_ready():
     print(f'Bot {bot.user} is now online!')
     await log_activity(bot, f'✅ **Bot {bot.user} is back online after restart!**')
 
-    # Load and restore prison state for all guilds
-    prison_data = load_data(PRISON_DATA_FILE)
-    await restore_prison_state(prison_data)
+    for guild in bot.guilds:
+        if should_chunk(bot, guild):
+            await guild.chunk()
+
+    # One-time split of the pre-partition files, before any partition is read
+    await guild_states.migrate_legacy(bot.guilds)
+    # Opened after the migration so a rebuild sees every guild's reports
+    report_search.setup()
+
+    # Restore prison state for all guilds
+    await restore_prison_state()
     
     check_prison_releases.start()
+    evict_idle_guilds.start()
+    expire_vc_locks.start()
+    prune_vc_overwrites.start()
+    log_rate_limit_metrics.start()
+    if snapshot_sync:
+        push_snapshot.start()
+    dm_queue.start(bot)
     await setup(bot)
 
+@bot.before_invoke
+async def tag_command_logs(ctx):
+    """Attach guild, user and command to everything logged while the command runs"""
+    bind_command_context(ctx)
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.MissingRequiredArgument):
@@ -284,7 +249,8 @@ async def setup(bot):
     
     await bot.add_cog(AdminCommands(bot))
     await bot.add_cog(UserCommands(bot))
-    await bot.add_cog(PointSystem(bot))
+    if 'points' in features:
+        await bot.add_cog(PointSystem(bot))
 
 if __name__ == "__main__":
     ensure_directory_exists()
@@ -294,4 +260,6 @@ if __name__ == "__main__":
         print("❌ ERROR: Token bot tidak ditemukan.")
         sys.exit(1)
 
-    bot.run(TOKEN, reconnect=True)
\ No newline at end of file
+    bot.run(TOKEN, reconnect=True, log_handler=None)
+    guild_states.flush_all()
+    log_listener.stop()
\ No newline at end of file
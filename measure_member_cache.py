@@ -0,0 +1,57 @@
+"""Estimate what a fully chunked guild costs in discord.py Member objects.
+
+Builds a detached ConnectionState and Guild, adds synthetic members (no
+presences) and reports the heap growth traced by tracemalloc. This is the
+measurement behind MEMBER_CACHE_CHUNK_LIMIT; compare with !cachestats on
+the live bot.
+
+Usage: python measure_member_cache.py [members]
+"""
+import gc
+import sys
+import tracemalloc
+
+import discord
+from discord.guild import Guild
+from discord.state import ConnectionState
+
+
+def measure(count: int) -> int:
+    """Bytes traced for `count` cached members"""
+    state = ConnectionState(
+        dispatch=lambda *args: None, handlers={}, hooks={}, http=None,
+        intents=discord.Intents.all(), member_cache_flags=discord.MemberCacheFlags.all(),
+        chunk_guilds_at_startup=False
+    )
+    everyone = {
+        'id': '1', 'name': '@everyone', 'permissions': '0', 'position': 0,
+        'color': 0, 'hoist': False, 'managed': False, 'mentionable': False
+    }
+    guild = Guild(data={'id': '1', 'name': 'measure', 'roles': [everyone]}, state=state)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        user = {
+            'id': str(10**17 + i), 'username': f'user{i}', 'discriminator': '0',
+            'avatar': 'a' * 32, 'global_name': f'User {i}'
+        }
+        data = {
+            'user': user,
+            'roles': [str(2 * 10**17 + i % 7), str(3 * 10**17 + i % 3)],
+            'joined_at': '2024-01-01T00:00:00+00:00',
+            'nick': None, 'deaf': False, 'mute': False, 'flags': 0
+        }
+        guild._add_member(discord.Member(data=data, guild=guild, state=state))
+        state.store_user(user)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    used = measure(count)
+    print(f"{count} members: {used / 2**20:.1f} MiB, {used / count:.0f} B/member")
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+
+import discord
+import clock
+from rate_limits import rate_limits
+from task_supervisor import task_supervisor
+
+logger = logging.getLogger("discord_bot")
+
+MEMBER_EDIT_WINDOW = 0.25  # seconds to collect changes before flushing
+MISSING = discord.utils.MISSING
+
+
+class _PendingEdit:
+    __slots__ = ('member', 'roles', 'add', 'remove', 'nick', 'reason', 'future')
+
+    def __init__(self, member):
+        self.member = member
+        self.roles = None     # Full replacement, {role_id: Role}
+        self.add = {}
+        self.remove = {}
+        self.nick = MISSING
+        self.reason = None
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class MemberEditBatcher:
+    """Coalesces role and nickname changes per member into a single member.edit().
+
+    Every change requested for the same member within MEMBER_EDIT_WINDOW is
+    merged and sent as one PATCH; all callers await the same result. The
+    result is True when everything applied and False when only the nickname
+    was refused (roles still applied), matching how the prison code has
+    always treated nickname Forbidden errors as non-fatal.
+    """
+
+    def __init__(self, window: float = MEMBER_EDIT_WINDOW):
+        self.window = window
+        self._pending = {}
+        # (guild, member) -> [lock, users]; a newer batch waits for the one being applied
+        self._applying = {}
+        self.flushes = 0
+        self.requests = 0
+
+    async def edit(self, member: discord.Member, *, roles=None, add_roles=(), remove_roles=(),
+                   nick=MISSING, reason: str = None) -> bool:
+        key = (member.guild.id, member.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingEdit(member)
+            # One task per batch: a batch for the same member may still be applying
+            if task_supervisor.spawn('member_edit', None, self._flush_later(key)) is None:
+                del self._pending[key]
+                raise RuntimeError("Member edits are closed for shutdown")
+        pending.member = member
+        self.requests += 1
+
+        if roles is not None:
+            pending.roles = {role.id: role for role in roles}
+            pending.add.clear()
+            pending.remove.clear()
+        for role in add_roles:
+            pending.remove.pop(role.id, None)
+            pending.add[role.id] = role
+        for role in remove_roles:
+            pending.add.pop(role.id, None)
+            pending.remove[role.id] = role
+        if nick is not MISSING:
+            pending.nick = nick
+        if reason:
+            pending.reason = reason
+        return await asyncio.shield(pending.future)
+
+    async def _flush_later(self, key) -> None:
+        await clock.sleep(self.window)
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        applying = self._applying.setdefault(key, [asyncio.Lock(), 0])
+        applying[1] += 1
+        try:
+            async with applying[0]:
+                result = await self._apply(pending)
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+        else:
+            if not pending.future.done():
+                pending.future.set_result(result)
+        finally:
+            applying[1] -= 1
+            if not applying[1]:
+                del self._applying[key]
+
+    @staticmethod
+    def _final_roles(pending: _PendingEdit):
+        if pending.roles is None and not pending.add and not pending.remove:
+            return None
+        if pending.roles is not None:
+            base = dict(pending.roles)
+        else:
+            base = {role.id: role for role in pending.member.roles}
+        base.update(pending.add)
+        for role_id in pending.remove:
+            base.pop(role_id, None)
+        return [role for role in base.values() if not role.is_default()]
+
+    async def _apply(self, pending: _PendingEdit) -> bool:
+        kwargs = {}
+        roles = self._final_roles(pending)
+        if roles is not None:
+            current = {role.id for role in pending.member.roles if not role.is_default()}
+            if {role.id for role in roles} != current:
+                kwargs['roles'] = roles
+        if pending.nick is not MISSING and pending.nick != pending.member.nick:
+            kwargs['nick'] = pending.nick
+        if not kwargs:
+            return True
+        if pending.reason:
+            kwargs['reason'] = pending.reason
+
+        route = f"/guilds/{pending.member.guild.id}/members/{pending.member.id}"
+        self.flushes += 1
+        await rate_limits.pace('PATCH', route)
+        try:
+            await pending.member.edit(**kwargs)
+            return True
+        except discord.Forbidden:
+            if 'nick' not in kwargs:
+                raise
+            # Usually a nickname above the bot's role; keep the role change
+            kwargs.pop('nick')
+            if 'roles' in kwargs:
+                self.flushes += 1
+                await rate_limits.pace('PATCH', route)
+                await pending.member.edit(**kwargs)
+            return False
+
+
+member_edits = MemberEditBatcher()
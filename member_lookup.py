@@ -0,0 +1,72 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+
+import discord
+import clock
+from rate_limits import rate_limits
+
+logger = logging.getLogger("discord_bot")
+
+MEMBER_LRU_SIZE = int(os.getenv("MEMBER_LRU_SIZE", "2000"))
+MEMBER_LRU_TTL = 300  # Seconds a fetched member (or a miss) is trusted
+
+
+class MemberLookup:
+    """Members by ID for guilds that are not fully cached.
+
+    The client cache is tried first. For a chunked guild a miss there means
+    the member is gone. Otherwise the member is fetched over REST, and the
+    result is kept in a small LRU, including "not in guild" answers, so
+    repeated lookups from loops and commands cost one request per TTL.
+    """
+
+    def __init__(self, size: int = MEMBER_LRU_SIZE, ttl: float = MEMBER_LRU_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.fetches = 0
+
+    async def get(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        member = guild.get_member(user_id)
+        if member is not None or guild.chunked:
+            return member
+        key = (guild.id, user_id)
+        cached = self._cache.get(key)
+        now = clock.now()
+        if cached is not None and now - cached[1] < self.ttl:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+
+        self.fetches += 1
+        await rate_limits.pace('GET', f"/guilds/{guild.id}/members/{user_id}")
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        self._cache[key] = (member, now)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return member
+
+    def forget(self, guild_id: int, user_id: int) -> None:
+        self._cache.pop((guild_id, user_id), None)
+
+    async def all_members(self, guild: discord.Guild) -> AsyncIterator[discord.Member]:
+        """Every member, from the cache when chunked, else paged over REST without caching"""
+        if guild.chunked:
+            for member in guild.members:
+                yield member
+            return
+        async for member in guild.fetch_members(limit=None):
+            yield member
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+member_lookup = MemberLookup()
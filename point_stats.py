@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+import clock
+
+logger = logging.getLogger("discord_bot")
+
+HISTORY_BUCKET_SECONDS = 3600  # 1 hour buckets
+HISTORY_BUCKETS = 24 * 30      # Keep 30 days
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+DISTRIBUTION_EDGES = (1, 100, 1000, 5000, 10000)
+
+
+class EventHistory:
+    """Ring of hourly claim/redeem counters with bounded memory.
+
+    Each slot remembers which hour it belongs to, so stale slots from a
+    previous lap of the ring are reset lazily when the hour comes round again.
+    """
+
+    KINDS = ("claim", "redeem")
+
+    def __init__(self, buckets: int = HISTORY_BUCKETS, width: int = HISTORY_BUCKET_SECONDS):
+        self.buckets = buckets
+        self.width = width
+        self.slot_hour = array('q', [-1]) * buckets
+        self.counts = {kind: array('q', [0]) * buckets for kind in self.KINDS}
+        self.amounts = {kind: array('q', [0]) * buckets for kind in self.KINDS}
+
+    def _slot(self, hour: int) -> int:
+        slot = hour % self.buckets
+        if self.slot_hour[slot] != hour:
+            self.slot_hour[slot] = hour
+            for kind in self.KINDS:
+                self.counts[kind][slot] = 0
+                self.amounts[kind][slot] = 0
+        return slot
+
+    def record(self, kind: str, amount: int, when: float = None) -> None:
+        hour = int((clock.now() if when is None else when) // self.width)
+        slot = self._slot(hour)
+        self.counts[kind][slot] += 1
+        self.amounts[kind][slot] += amount
+
+    def totals(self, kind: str, hours: int, now: float = None):
+        """(events, points) for kind over the last `hours` buckets"""
+        current = int((clock.now() if now is None else now) // self.width)
+        oldest = current - min(hours, self.buckets) + 1
+        events = points = 0
+        for slot, hour in enumerate(self.slot_hour):
+            if oldest <= hour <= current:
+                events += self.counts[kind][slot]
+                points += self.amounts[kind][slot]
+        return events, points
+
+    def save(self, path: str) -> None:
+        data = {'slot_hour': self.slot_hour.tolist()}
+        for kind in self.KINDS:
+            data[f'{kind}_counts'] = self.counts[kind].tolist()
+            data[f'{kind}_amounts'] = self.amounts[kind].tolist()
+        try:
+            with open(path, 'w') as f:
+                json.dump(data, f)
+        except Exception as e:
+            logger.error(f"Error saving point history to {path}: {e}")
+
+    def load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if len(data['slot_hour']) != self.buckets:
+                return
+            self.slot_hour = array('q', data['slot_hour'])
+            for kind in self.KINDS:
+                self.counts[kind] = array('q', data[f'{kind}_counts'])
+                self.amounts[kind] = array('q', data[f'{kind}_amounts'])
+        except Exception as e:
+            logger.error(f"Error loading point history from {path}: {e}")
+
+
+def balance_stats(balances) -> dict:
+    """Supply, percentiles, Gini and distribution over a flat sequence of balances.
+
+    Works directly on the BalanceStore's array so the per-element work stays
+    in C (sorted/sum/accumulate) rather than a Python loop over users.
+    """
+    values = sorted(balances)
+    n = len(values)
+    if not n:
+        return {'members': 0, 'total': 0, 'mean': 0, 'gini': 0.0,
+                'percentiles': {}, 'distribution': []}
+
+    total = sum(values)
+    percentiles = {p: values[min(n - 1, (p * n) // 100)] for p in PERCENTILES}
+
+    # Gini = 2 * sum(i * x_i) / (n * total) - (n + 1) / n with x sorted ascending, i from 1;
+    # sum(i * x_i) equals the sum of suffix sums, which accumulate() computes in C
+    if total > 0:
+        weighted = sum(accumulate(reversed(values)))
+        gini = 2 * weighted / (n * total) - (n + 1) / n
+    else:
+        gini = 0.0
+
+    distribution = []
+    lower = 0
+    for edge in DISTRIBUTION_EDGES:
+        count = bisect_left(values, edge) - bisect_left(values, lower)
+        distribution.append((lower, edge - 1, count))
+        lower = edge
+    distribution.append((lower, None, n - bisect_left(values, lower)))
+
+    return {
+        'members': n,
+        'total': total,
+        'mean': total / n,
+        'gini': gini,
+        'percentiles': percentiles,
+        'distribution': distribution,
+    }
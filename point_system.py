@@ -1,15 +1,33 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ui import Select, View, Button
 import os
-import json
-import time
+import re
+import clock
 import asyncio
-from collections import defaultdict
 from datetime import timedelta
+from ledger import InsufficientPoints
+from point_stats import balance_stats
+from guild_state import guild_states
+from activity import (
+    activity_earner,
+    mark_live,
+    ACTIVITY_FLUSH_SECONDS,
+    ACTIVITY_POINTS,
+    ACTIVITY_MIN_INTERVAL,
+    ACTIVITY_WINDOW_CAP
+)
+from voice_points import voice_tracker, VOICE_CHECKPOINT_MINUTES, VOICE_POINTS_PER_MINUTE
+from backfill import BackfillJob, backfill_jobs, BACKFILL_PROGRESS_SECONDS
+from redeem_executor import RedeemJob, redeem_executor
+from vc_locks import VC_LOCK_DURATION
+from task_supervisor import task_supervisor
+from rate_limits import rate_limits
+from gateway_profile import features
+from member_lookup import member_lookup
+import seasons
 
 # Constants
-POINTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_points.json")
 REDEEM_COOLDOWN = 900  # 15 minutes
 CLAIM_COOLDOWN = 60  # 5 minutes
 CLAIM_POINTS = 50
@@ -19,33 +37,9 @@ TIMEOUT_BASE_DURATION = 3  # Base duration in minutes
 REDEEM_TIMEOUT = 300  # 5 minutes for redeem message to disappear
 ADMIN_USER_ID = 776744923738800129  # Your user ID
 
-# Data storage
-user_points = defaultdict(int)
+# Data storage (balances and history live in each guild's partition)
 redeem_cooldowns = {}
 
-def save_points():
-    """Save points data to file"""
-    try:
-        with open(POINTS_FILE, "w") as f:
-            json.dump(dict(user_points), f, indent=4)
-        return True
-    except Exception as e:
-        print(f"Error saving points: {e}")
-        return False
-
-def load_points():
-    """Load points data from file"""
-    global user_points
-    try:
-        if os.path.exists(POINTS_FILE):
-            with open(POINTS_FILE, "r") as f:
-                user_points = defaultdict(int, {int(k): v for k, v in json.load(f).items()})
-        else:
-            user_points = defaultdict(int)
-    except Exception as e:
-        print(f"Error loading points: {e}")
-        user_points = defaultdict(int)
-
 class UserSelect(discord.ui.UserSelect):
     def __init__(self, placeholder="Select user..."):
         super().__init__(placeholder=placeholder, min_values=1, max_values=1)
@@ -71,7 +65,76 @@ class PointSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.log_channel_ids = [1351561404150448248, 1350543441821564988]
-        load_points()
+        self.flush_activity.start()
+        self.voice_checkpoint.start()
+        self.roll_seasons.start()
+        if bot.is_ready():
+            voice_tracker.reconcile(bot.guilds)
+            self.mark_live_earning(bot.guilds)
+
+    @staticmethod
+    def mark_live_earning(guilds):
+        # Backfills stop where live chat earning began
+        if 'activity' in features:
+            mark_live(guilds)
+
+    async def cog_unload(self):
+        self.flush_activity.cancel()
+        self.voice_checkpoint.cancel()
+        self.roll_seasons.cancel()
+        await activity_earner.flush()
+        await voice_tracker.checkpoint()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """Earn points for chatting; only counted here, credited by flush_activity"""
+        if 'activity' not in features or message.author.bot or not message.guild:
+            return
+        if message.content.startswith(self.bot.command_prefix):
+            return
+        activity_earner.record(message.guild.id, message.author.id, message.content)
+
+    @tasks.loop(seconds=ACTIVITY_FLUSH_SECONDS)
+    async def flush_activity(self):
+        await activity_earner.flush()
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        voice_tracker.update(member, before, after)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # After a reconnect the cache is fresh; pick up joins and leaves we missed
+        voice_tracker.reconcile(self.bot.guilds)
+        self.mark_live_earning(self.bot.guilds)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.mark_live_earning([guild])
+
+    @tasks.loop(minutes=VOICE_CHECKPOINT_MINUTES)
+    async def voice_checkpoint(self):
+        await voice_tracker.checkpoint()
+
+    @tasks.loop(hours=1)
+    async def roll_seasons(self):
+        """Close seasons whose boundary has passed; unloaded guilds catch up when they load"""
+        now = clock.now()
+        due = [state for state in guild_states.loaded() if now >= seasons.season_ends(state.season)]
+        if not due:
+            return
+        # Credit what was earned before the boundary to the season it was earned in
+        await activity_earner.flush()
+        await voice_tracker.checkpoint()
+        for state in due:
+            # A manual !season rollover may have closed it during the awaits above
+            if clock.now() < seasons.season_ends(state.season):
+                continue
+            number = state.season['number']
+            archived = seasons.roll_over(state)
+            await self.log_activity(
+                f"🏁 Season {number} ditutup di guild {state.guild_id}: {archived} saldo diarsipkan"
+            )
 
     async def log_activity(self, message):
         """Log activity to designated channels"""
@@ -79,6 +142,7 @@ class PointSystem(commands.Cog):
             channel = self.bot.get_channel(channel_id)
             if channel:
                 try:
+                    await rate_limits.pace('POST', f"/channels/{channel_id}/messages")
                     await channel.send(message)
                 except discord.errors.HTTPException as e:
                     print(f"Error sending log message: {e}")
@@ -88,8 +152,18 @@ class PointSystem(commands.Cog):
         return user.id == ADMIN_USER_ID
 
     @commands.command()
-    async def leaderboard(self, ctx):
-        """Show points leaderboard"""
+    async def leaderboard(self, ctx, *, query: str = ""):
+        """Show points leaderboard. Past seasons: !leaderboard season:<n>"""
+        state = guild_states.get(ctx.guild.id)
+        match = re.fullmatch(r"season:(\d+)", query.strip().lower())
+        if query.strip() and not match:
+            await ctx.send("❌ Gunakan: `!leaderboard` atau `!leaderboard season:<n>`")
+            return
+        if match and int(match.group(1)) != state.season['number']:
+            await self.season_leaderboard(ctx, state, int(match.group(1)))
+            return
+
+        user_points = state.points
         sorted_users = sorted(
             user_points.items(), 
             key=lambda x: x[1], 
@@ -97,7 +171,7 @@ class PointSystem(commands.Cog):
         )[:LEADERBOARD_LIMIT]
         
         embed = discord.Embed(
-            title="🏆 Points Leaderboard",
+            title=f"🏆 Points Leaderboard • Season {state.season['number']}",
             color=discord.Color.gold()
         )
         
@@ -113,6 +187,62 @@ class PointSystem(commands.Cog):
         embed.set_footer(text=f"Your points: {user_points.get(ctx.author.id, 0)}")
         await ctx.send(embed=embed)
 
+    async def season_leaderboard(self, ctx, state, number: int):
+        """Leaderboard of a closed season, streamed from its archive"""
+        path = seasons.archive_path(state.path, number)
+        if not os.path.exists(path):
+            closed = ", ".join(str(n) for n in seasons.archived_seasons(state.path)) or "belum ada"
+            await ctx.send(f"❌ Season {number} tidak ditemukan. Season yang sudah selesai: {closed}")
+            return
+        # Decompressing a large archive shouldn't stall the gateway
+        top, mine = await asyncio.to_thread(seasons.archive_top, path, LEADERBOARD_LIMIT, ctx.author.id)
+        _, count, started, ended = seasons.read_archive_header(path)
+
+        embed = discord.Embed(
+            title=f"🏆 Leaderboard Season {number}",
+            description=f"<t:{int(started)}:d> – <t:{int(ended)}:d> • {count} member",
+            color=discord.Color.dark_gold()
+        )
+        for idx, (user_id, points) in enumerate(top, 1):
+            user = self.bot.get_user(user_id)
+            username = user.name if user else f"Unknown User ({user_id})"
+            embed.add_field(
+                name=f"{idx}. {username}",
+                value=f"`{points}` points",
+                inline=False
+            )
+        embed.set_footer(text=f"Your points in season {number}: {mine or 0}")
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def season_policy_text() -> str:
+        if seasons.SEASON_POLICY == "carry":
+            return f"{seasons.SEASON_CARRY_PERCENT}% poin dibawa ke season berikutnya"
+        return "poin direset ke 0"
+
+    @commands.command()
+    async def season(self, ctx, action: str = None):
+        """Show the current season. Admin: !season rollover closes it now"""
+        state = guild_states.get(ctx.guild.id)
+        if action == "rollover":
+            if not self.is_admin(ctx.author):
+                await ctx.send("❌ Hanya owner bot yang bisa menggunakan command ini!", ephemeral=True)
+                return
+            await activity_earner.flush()
+            await voice_tracker.checkpoint()
+            number = state.season['number']
+            archived = seasons.roll_over(state)
+            await ctx.send(f"🏁 Season {number} ditutup: {archived} saldo diarsipkan. Season {number + 1} dimulai!")
+            await self.log_activity(f"🏁 {ctx.author.mention} menutup season {number} ({archived} saldo)")
+            return
+
+        closed = ", ".join(str(n) for n in seasons.archived_seasons(state.path)) or "belum ada"
+        await ctx.send(
+            f"📅 **Season {state.season['number']}** berakhir <t:{int(seasons.season_ends(state.season))}:R>\n"
+            f"• Akhir season: {self.season_policy_text()}\n"
+            f"• Season selesai: {closed} (`!leaderboard season:<n>`)"
+        )
+
     @commands.command()
     async def givepoints(self, ctx):
         """Admin command to give points (with dropdown)"""
@@ -145,12 +275,13 @@ class PointSystem(commands.Cog):
                     await interaction.response.send_message("❌ Poin harus positif!", ephemeral=True)
                     return
 
-                user_points[self.target.id] += self.points
-                save_points()
+                # Keyed by the prompt so a double-click can't credit twice
+                ledger = guild_states.get(interaction.guild.id).ledger
+                total = await ledger.credit(self.target.id, self.points, key=f"give:{self.message.id}")
 
                 await interaction.response.send_message(
                     f"✅ {self.points} poin diberikan ke {self.target.mention}! "
-                    f"Total: {user_points[self.target.id]}",
+                    f"Total: {total}",
                     ephemeral=True
                 )
                 await self.cog.log_activity(
@@ -233,19 +364,19 @@ class PointSystem(commands.Cog):
                     await interaction.response.send_message("❌ Poin harus positif!", ephemeral=True)
                     return
 
-                if user_points.get(self.target.id, 0) < self.points:
+                ledger = guild_states.get(interaction.guild.id).ledger
+                try:
+                    remaining = await ledger.debit(self.target.id, self.points, key=f"remove:{self.message.id}")
+                except InsufficientPoints as e:
                     await interaction.response.send_message(
-                        f"❌ {self.target.mention} hanya memiliki {user_points.get(self.target.id, 0)} poin!",
+                        f"❌ {self.target.mention} hanya memiliki {e.balance} poin!",
                         ephemeral=True
                     )
                     return
 
-                user_points[self.target.id] -= self.points
-                save_points()
-
                 await interaction.response.send_message(
                     f"✅ {self.points} poin dihapus dari {self.target.mention}! "
-                    f"Sisa: {user_points[self.target.id]}",
+                    f"Sisa: {remaining}",
                     ephemeral=True
                 )
                 await self.cog.log_activity(
@@ -296,11 +427,80 @@ class PointSystem(commands.Cog):
         message = await ctx.send("**Remove Points**\nPilih user dan set jumlah poin:", view=view, ephemeral=True)
         view.message = message
 
+    async def resolve_bulk_targets(self, ctx, target: str):
+        """Resolve 'all', a role, a voice channel or pasted IDs/mentions to user IDs"""
+        if target.lower() in ("all", "guild", "server"):
+            return "seluruh server", {m.id async for m in member_lookup.all_members(ctx.guild) if not m.bot}
+        try:
+            role = await commands.RoleConverter().convert(ctx, target)
+        except commands.BadArgument:
+            pass
+        else:
+            if ctx.guild.chunked:
+                return f"role {role.name}", {m.id for m in role.members if not m.bot}
+            return f"role {role.name}", {
+                m.id async for m in member_lookup.all_members(ctx.guild) if not m.bot and role in m.roles
+            }
+        try:
+            channel = await commands.VoiceChannelConverter().convert(ctx, target)
+            return f"VC {channel.name}", {m.id for m in channel.members if not m.bot}
+        except commands.BadArgument:
+            pass
+        return "daftar ID", {int(uid) for uid in re.findall(r"\d{15,20}", target)}
+
+    @commands.command()
+    async def bulkpoints(self, ctx, action: str, amount: int, *, target: str):
+        """Admin: give/take points for a role, VC, the whole server or a list of IDs.
+
+        Usage: !bulkpoints give|take <amount> <all|@role|#vc|IDs...> [--dry]
+        """
+        if not self.is_admin(ctx.author):
+            await ctx.send("❌ Hanya owner bot yang bisa menggunakan command ini!", ephemeral=True)
+            return
+
+        action = action.lower()
+        if action not in ("give", "take") or amount <= 0:
+            await ctx.send("❌ Gunakan: `!bulkpoints give|take <jumlah> <all|@role|#vc|ID...> [--dry]`")
+            return
+
+        dry_run = "--dry" in target
+        target = target.replace("--dry", "").strip()
+        label, user_ids = await self.resolve_bulk_targets(ctx, target)
+        if not user_ids:
+            await ctx.send(f"❌ Tidak ada member ditemukan untuk `{target}`")
+            return
+
+        delta = amount if action == "give" else -amount
+        ledger = guild_states.get(ctx.guild.id).ledger
+        if dry_run:
+            short = sum(1 for uid in user_ids if ledger.balance(uid) + delta < 0)
+            await ctx.send(
+                f"🔍 **Preview** {action} {amount} poin untuk {label}\n"
+                f"• Member terdampak: {len(user_ids) - short}\n"
+                f"• Dilewati (poin kurang): {short}\n"
+                f"• Total perubahan: {delta * (len(user_ids) - short):+}"
+            )
+            return
+
+        applied, skipped = await ledger.apply_many(
+            {uid: delta for uid in user_ids},
+            key=f"bulk:{ctx.message.id}"
+        )
+        await ctx.send(
+            f"✅ {action} {amount} poin untuk {label}\n"
+            f"• Member terdampak: {len(applied)}\n"
+            f"• Dilewati (poin kurang): {len(skipped)}"
+        )
+        await self.log_activity(
+            f"📦 {ctx.author.mention} bulk {action} {amount} poin ke {label}: "
+            f"{len(applied)} member ({delta * len(applied):+} total), {len(skipped)} dilewati"
+        )
+
     @commands.command()
     async def redeem(self, ctx):
         """Redeem points for actions"""
         user_id = ctx.author.id
-        current_time = time.time()
+        current_time = clock.now()
 
         if user_id in redeem_cooldowns and current_time - redeem_cooldowns[user_id] < REDEEM_COOLDOWN:
             remaining = REDEEM_COOLDOWN - (current_time - redeem_cooldowns[user_id])
@@ -317,6 +517,7 @@ class PointSystem(commands.Cog):
                 self.duration = None
                 self.message = None
                 self.success = False
+                self.confirming = False
 
             async def interaction_check(self, interaction: discord.Interaction) -> bool:
                 if interaction.user != self.author:
@@ -363,6 +564,12 @@ class PointSystem(commands.Cog):
                     if not self.target:
                         await interaction.response.send_message("❌ Please select a user!", ephemeral=True)
                         return
+                    if self.action == "timeout" and self.duration is None:
+                        await interaction.response.send_message("❌ Please set a duration first!", ephemeral=True)
+                        return
+                    if self.confirming:
+                        await interaction.response.send_message("⏳ This redeem is already being processed!", ephemeral=True)
+                        return
                     
                     if self.action == "timeout":
                         cost = (self.duration // TIMEOUT_BASE_DURATION) * TIMEOUT_BASE_COST
@@ -376,57 +583,82 @@ class PointSystem(commands.Cog):
                         }
                         cost = costs.get(self.action, 0)
                     
-                    if user_points[user_id] < cost:
-                        await interaction.response.send_message(
-                            f"❌ You need {cost} points! You have {user_points[user_id]}",
-                            ephemeral=True
-                        )
-                        return
-                    
+                    self.confirming = True
                     try:
-                        if self.action == "timeout":
-                            await self.target.timeout(discord.utils.utcnow() + timedelta(minutes=self.duration))
-                            msg = f"⏳ {self.target.mention} timed out for {self.duration} minutes (Cost: {cost} points)"
-                        elif self.action == "move":
-                            await self.target.move_to(self.channel)
-                            msg = f"🚚 Moved {self.target.mention} to {self.channel.name} (Cost: 300 points)"
-                        elif self.action == "kick":
-                            await self.target.move_to(None)
-                            msg = f"🚪 Kicked {self.target.mention} from VC (Cost: 300 points)"
-                        elif self.action == "kick_lock":
-                            await self.target.voice.channel.set_permissions(self.target, connect=False)
-                            await self.target.move_to(None)
-                            msg = f"🔒 Kicked & locked {self.target.mention} from VC (Cost: 5000 points)"
-                        
-                        user_points[user_id] -= cost
+                        # Answer within the interaction deadline; the outcome arrives as a followup
+                        await interaction.response.defer(ephemeral=True, thinking=True)
+                        await self.set_confirm_enabled(False)
+
+                        # Reserve the points up front so concurrent confirms can't spend the same balance.
+                        # Keyed by the redeem message, which every click on it shares, so a repeated
+                        # confirm replays the first debit instead of charging again
+                        state = guild_states.get(interaction.guild.id)
+                        ledger = state.ledger
+                        try:
+                            await ledger.debit(user_id, cost, key=f"redeem:{self.message.id}")
+                        except InsufficientPoints as e:
+                            await interaction.followup.send(
+                                f"❌ You need {cost} points! You have {e.balance}",
+                                ephemeral=True
+                            )
+                            return
+
+                        job = RedeemJob(
+                            key=f"redeem:{self.message.id}",
+                            guild_id=interaction.guild.id,
+                            action=self.action,
+                            target=self.target,
+                            cost=cost,
+                            duration=self.duration,
+                            channel=self.channel
+                        )
+                        try:
+                            msg = await redeem_executor.submit(job)
+                        except Exception as e:
+                            # Action failed or timed out: release the reservation
+                            await ledger.credit(user_id, cost, key=f"refund:{self.message.id}")
+                            await interaction.followup.send(f"❌ Error: {str(e)} (points refunded)", ephemeral=True)
+                            self.stop()
+                            return
+
                         redeem_cooldowns[user_id] = current_time
-                        save_points()
-                        
+                        state.point_history.record("redeem", cost)
                         self.success = True
-                        
+
                         # Delete the original message
                         if self.message:
                             try:
                                 await self.message.delete()
                             except:
                                 pass
-                        
+
                         # Send success message
                         success_embed = discord.Embed(
                             description=f"✅ {msg} by {self.author.mention}",
                             color=discord.Color.green()
                         )
-                        await interaction.response.send_message(embed=success_embed, ephemeral=True)
-                        
+                        await interaction.followup.send(embed=success_embed, ephemeral=True)
+
                         await self.cog.log_activity(f"{msg} by {self.author.mention}")
                         self.stop()
-                    except Exception as e:
-                        await interaction.response.send_message(f"❌ Error: {str(e)}", ephemeral=True)
+                    finally:
+                        # Any outcome but success frees the view; a refunded failure has stopped it
+                        if not self.success:
+                            self.confirming = False
+                            if not self.is_finished():
+                                await self.set_confirm_enabled(True)
                 
                 self.confirm_button.callback = confirm_callback
                 self.add_item(self.confirm_button)
                 await interaction.edit_original_response(view=self)
 
+            async def set_confirm_enabled(self, enabled: bool):
+                self.confirm_button.disabled = not enabled
+                try:
+                    await self.message.edit(view=self)
+                except discord.HTTPException:
+                    pass
+
         class DurationModal(discord.ui.Modal):
             def __init__(self, view):
                 super().__init__(title="Set Timeout Duration")
@@ -470,29 +702,152 @@ class PointSystem(commands.Cog):
     async def claim(self, ctx):
         """Claim free points"""
         user_id = ctx.author.id
-        current_time = time.time()
+        current_time = clock.now()
 
         if user_id in redeem_cooldowns and current_time - redeem_cooldowns[user_id] < CLAIM_COOLDOWN:
             remaining = CLAIM_COOLDOWN - (current_time - redeem_cooldowns[user_id])
             await ctx.send(f"❌ Please wait {remaining/60:.1f} minutes before claiming again!", ephemeral=True)
             return
 
-        user_points[user_id] += CLAIM_POINTS
         redeem_cooldowns[user_id] = current_time
-        save_points()
+        state = guild_states.get(ctx.guild.id)
+        state.point_history.record("claim", CLAIM_POINTS)
+        total = await state.ledger.credit(user_id, CLAIM_POINTS, key=f"claim:{ctx.message.id}")
 
         await ctx.send(
             f"✅ {ctx.author.mention} claimed {CLAIM_POINTS} points! "
-            f"Total: {user_points[user_id]}",
+            f"Total: {total}",
             ephemeral=True
         )
         await self.log_activity(f"📥 {ctx.author.mention} claimed {CLAIM_POINTS} points")
 
+    @commands.command()
+    async def backfillpoints(self, ctx, option: str = "30"):
+        """Admin: credit chat history from the last N days as activity points.
+
+        Usage: !backfillpoints [days] | cancel | reset
+        Re-running after a restart resumes each channel from its checkpoint.
+        """
+        if not self.is_admin(ctx.author):
+            await ctx.send("❌ Hanya owner bot yang bisa menggunakan command ini!", ephemeral=True)
+            return
+
+        running = backfill_jobs.get(ctx.guild.id)
+        if option == "cancel":
+            if running:
+                running.cancelled = True
+                await ctx.send("🛑 Backfill dihentikan; progres tersimpan dan bisa dilanjutkan.")
+            else:
+                await ctx.send("ℹ️ Tidak ada backfill yang berjalan.")
+            return
+        if running:
+            await ctx.send("⏳ Backfill sudah berjalan untuk server ini.")
+            return
+        if option == "reset":
+            BackfillJob(ctx.guild, 0).discard()
+            await ctx.send("🗑️ Checkpoint backfill dihapus.")
+            return
+        if not option.isdigit() or int(option) <= 0:
+            await ctx.send("❌ Gunakan: `!backfillpoints [hari] | cancel | reset`")
+            return
+
+        job = backfill_jobs[ctx.guild.id] = BackfillJob(ctx.guild, int(option))
+        if job.state['applied']:
+            del backfill_jobs[ctx.guild.id]
+            await ctx.send("ℹ️ Backfill sebelumnya sudah dikreditkan. Gunakan `!backfillpoints reset` untuk mulai ulang.")
+            return
+
+        status = await ctx.send("📚 Memulai backfill riwayat pesan...")
+
+        async def report_progress():
+            while True:
+                await clock.sleep(BACKFILL_PROGRESS_SECONDS)
+                eta = job.eta()
+                eta_text = str(timedelta(seconds=int(eta))) if eta is not None else "menghitung..."
+                try:
+                    await status.edit(content=(
+                        f"📚 Backfill: {job.progress():.1%} • {job.scanned:,} pesan dipindai • "
+                        f"{len(job.slots):,} member • ETA {eta_text}"
+                    ))
+                except discord.HTTPException:
+                    pass
+
+        task_supervisor.spawn('backfill_progress', ctx.guild.id, report_progress(), replace=True)
+        try:
+            result = await job.run()
+        finally:
+            task_supervisor.cancel('backfill_progress', ctx.guild.id)
+            backfill_jobs.pop(ctx.guild.id, None)
+
+        if result is None:
+            await status.edit(content=(
+                f"⏸️ Backfill berhenti di {job.progress():.1%} ({job.scanned:,} pesan). "
+                "Jalankan lagi untuk melanjutkan."
+            ))
+            return
+        applied, _ = result
+        total = sum(applied.values())
+        await status.edit(content=(
+            f"✅ Backfill selesai: {job.scanned:,} pesan, {len(applied):,} member, {total:,} poin dikreditkan."
+        ))
+        await self.log_activity(
+            f"📚 {ctx.author.mention} backfill poin aktivitas: {len(applied)} member, {total} poin"
+        )
+
+    @commands.command()
+    async def pointstats(self, ctx):
+        """Admin: balance distribution, percentiles, Gini and claim/redeem velocity"""
+        if not self.is_admin(ctx.author):
+            await ctx.send("❌ Hanya owner bot yang bisa menggunakan command ini!", ephemeral=True)
+            return
+
+        state = guild_states.get(ctx.guild.id)
+        stats = balance_stats(state.points.balances)
+        embed = discord.Embed(title="📈 Point Statistics", color=discord.Color.gold())
+        embed.add_field(
+            name="Supply",
+            value=(
+                f"Members: {stats['members']}\n"
+                f"Total: {stats['total']}\n"
+                f"Mean: {stats['mean']:.1f}\n"
+                f"Gini: {stats['gini']:.3f}"
+            ),
+            inline=True
+        )
+        embed.add_field(
+            name="Percentiles",
+            value="\n".join(f"p{p}: {v}" for p, v in stats['percentiles'].items()) or "-",
+            inline=True
+        )
+        embed.add_field(
+            name="Distribution",
+            value="\n".join(
+                f"{low}+: {count}" if high is None else f"{low}-{high}: {count}"
+                for low, high, count in stats['distribution']
+            ) or "-",
+            inline=True
+        )
+
+        for label, hours in (("24h", 24), ("7d", 24 * 7), ("30d", 24 * 30)):
+            claims, claimed = state.point_history.totals("claim", hours)
+            redeems, spent = state.point_history.totals("redeem", hours)
+            embed.add_field(
+                name=f"Velocity ({label})",
+                value=(
+                    f"Claims: {claims} ({claimed} pts)\n"
+                    f"Redeems: {redeems} ({spent} pts)\n"
+                    f"Net: {claimed - spent:+} pts ({(claimed - spent) / hours:+.1f}/h)"
+                ),
+                inline=True
+            )
+
+        await ctx.send(embed=embed)
+
     @commands.command()
     async def points(self, ctx, user: discord.Member = None):
         """Check your points"""
         target = user or ctx.author
-        await ctx.send(f"💰 {target.mention} has {user_points.get(target.id, 0)} points!", ephemeral=True)
+        await ctx.send(f"💰 {target.mention} has {guild_states.get(ctx.guild.id).points.get(target.id, 0)} points!", ephemeral=True)
 
     @commands.command()
     async def poininfo(self, ctx):
@@ -511,7 +866,29 @@ class PointSystem(commands.Cog):
             ),
             inline=False
         )
-        
+
+        embed.add_field(
+            name="🔹 **Poin Aktivitas**",
+            value=(
+                f"Setiap pesan di server memberi {ACTIVITY_POINTS} poin "
+                f"(maks. 1 pesan per {ACTIVITY_MIN_INTERVAL} detik, {ACTIVITY_WINDOW_CAP} poin per jam)\n"
+                "Pesan pendek, berulang, atau command tidak dihitung\n"
+                f"Berada di voice channel memberi {VOICE_POINTS_PER_MINUTE} poin per menit "
+                "(tidak dihitung saat deafen atau di channel AFK)"
+            ),
+            inline=False
+        )
+
+        embed.add_field(
+            name="🔹 **Season**",
+            value=(
+                f"Setiap season berlangsung {seasons.SEASON_LENGTH_DAYS} hari; di akhir season {self.season_policy_text()}\n"
+                "Cek season berjalan dengan ```!season```\n"
+                "Leaderboard season lalu: `!leaderboard season:<n>`"
+            ),
+            inline=False
+        )
+
         embed.add_field(
             name="🔹 **Redeem Poin**",
             value=(
@@ -524,7 +901,7 @@ class PointSystem(commands.Cog):
                 "🚪 **Kick VC** - 300 poin\n"
                 "> Mengeluarkan user dari voice channel\n\n"
                 "🔒 **Kick & Lock VC** - 5000 poin\n"
-                "> Mengeluarkan dan memblokir akses voice channel"
+                f"> Mengeluarkan dan memblokir akses voice channel selama {VC_LOCK_DURATION // 60} menit"
             ),
             inline=False
         )
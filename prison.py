@@ -0,0 +1,422 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import discord
+import clock
+from shared import (
+    SCRIPT_DIR,
+    log_activity,
+    PRISON_DURATION,
+    PRISON_ROLE_NAME
+)
+from guild_state import guild_states
+from member_edits import member_edits
+from records import PrisonRecord
+from task_supervisor import task_supervisor
+from member_lookup import member_lookup
+
+logger = logging.getLogger("discord_bot")
+
+PRISON_INTENT_LOG = os.path.join(SCRIPT_DIR, "prison_intents.log")
+RELEASE_CONCURRENCY = 5  # Members released in parallel per batch
+SUMMARY_MENTION_LIMIT = 40
+INTENT_LOG_COMPACT_LINES = 500
+PRISONER_NICK = "🔒 Prisoner"[:32]
+
+# Prison states
+IMPRISONING = "imprisoning"
+IMPRISONED = "imprisoned"
+RELEASING = "releasing"
+RELEASED = "released"
+
+
+class IntentLog:
+    """Append-only JSON-lines log of prison transitions, fsynced before any API call"""
+
+    def __init__(self, path: str = PRISON_INTENT_LOG):
+        self.path = path
+        self.seq = 0
+        self.lines = 0
+        # Continue after the last process's numbers, so a new intent can't be
+        # mistaken for the finish of an old unfinished one
+        for entry in self._entries():
+            self.seq = max(self.seq, entry['seq'])
+            self.lines += 1
+
+    def _append(self, entry: dict) -> None:
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines += 1
+
+    def begin(self, op: str, member, roles, nick, since) -> int:
+        self.seq += 1
+        self._append({
+            'seq': self.seq, 'op': op, 'guild_id': member.guild.id, 'user_id': member.id,
+            'roles': list(roles), 'nick': nick, 'since': since
+        })
+        return self.seq
+
+    def finish(self, seq: int, ok: bool = True) -> None:
+        self._append({'seq': seq, 'op': 'done' if ok else 'abort'})
+
+    def _entries(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # Torn final write
+
+    def pending(self):
+        """Intents that were started but never finished or aborted"""
+        started = {}
+        for entry in self._entries():
+            self.seq = max(self.seq, entry['seq'])
+            if entry['op'] in ('done', 'abort'):
+                started.pop(entry['seq'], None)
+            else:
+                started[entry['seq']] = entry
+        return sorted(started.values(), key=lambda entry: entry['seq'])
+
+    def truncate(self) -> None:
+        with open(self.path, 'w'):
+            pass
+        self.lines = 0
+
+
+class PrisonService:
+    """Single owner of imprisonment and release.
+
+    Each member moves through imprisoning -> imprisoned -> releasing ->
+    released under a per-member lock. Prison records live in the member's
+    guild partition; only in-flight transitions are held here. The intended
+    transition, including
+    the roles and nickname to restore, is written to the intent log before
+    Discord is touched, so after a crash recover() only has to replay the
+    transitions that were in flight. No transition starts until recover()
+    has run, so a replay never races a new intent for the same member.
+    """
+
+    def __init__(self, intent_log: IntentLog = None):
+        self.intents = intent_log or IntentLog()
+        self.transitions = {}
+        self._locks = {}
+        self._holders = defaultdict(int)
+        self._in_flight = 0
+        self._recovered = asyncio.Event()
+
+    @asynccontextmanager
+    async def _member_lock(self, member):
+        await self._recovered.wait()
+        key = (member.guild.id, member.id)
+        self._holders[key] += 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key]
+                self._locks.pop(key, None)
+
+    def state(self, member) -> str:
+        transition = self.transitions.get((member.guild.id, member.id))
+        if transition:
+            return transition
+        if member.id in guild_states.get(member.guild.id).prisoners:
+            return IMPRISONED
+        return RELEASED
+
+    def is_tracked(self, member) -> bool:
+        return self.state(member) != RELEASED
+
+    def _begin(self, op, member, roles, nick, since) -> int:
+        self._in_flight += 1
+        return self.intents.begin(op, member, roles, nick, since)
+
+    def _finish(self, seq: int, ok: bool = True) -> None:
+        self.intents.finish(seq, ok)
+        self._in_flight -= 1
+        if not self._in_flight and self.intents.lines >= INTENT_LOG_COMPACT_LINES:
+            self.intents.truncate()
+
+    def _forget(self, state, user_id: int) -> None:
+        state.prisoners.pop(user_id, None)
+        self.transitions.pop((state.guild_id, user_id), None)
+
+    async def ensure_prison_role(self, bot, guild):
+        """Get the prison role, creating it and its channel overwrites if missing"""
+        prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
+        if prison_role:
+            return prison_role
+        try:
+            prison_role = await guild.create_role(
+                name=PRISON_ROLE_NAME,
+                permissions=discord.Permissions.none(),
+                reason="Prison system initialization"
+            )
+        except discord.errors.Forbidden:
+            await log_activity(bot, "❌ Failed to create prison role - insufficient permissions")
+            return None
+        for channel in guild.channels:
+            try:
+                await channel.set_permissions(
+                    prison_role,
+                    send_messages=False,
+                    add_reactions=False,
+                    connect=False,
+                    speak=False,
+                    view_channel=True
+                )
+            except Exception as e:
+                logger.debug(f"Couldn't set permissions for {channel.name}: {e}")
+        return prison_role
+
+    async def imprison(self, bot, member) -> bool:
+        """Put a member in prison"""
+        if not member or member.id == member.guild.owner_id:
+            return False
+
+        async with self._member_lock(member):
+            if self.is_tracked(member):
+                return False
+            prison_role = await self.ensure_prison_role(bot, member.guild)
+            if not prison_role:
+                return False
+
+            state = guild_states.get(member.guild.id)
+            roles = [role.id for role in member.roles if not role.is_default() and role != prison_role]
+            since = clock.now()
+            seq = self._begin('imprison', member, roles, member.display_name, since)
+            self.transitions[(member.guild.id, member.id)] = IMPRISONING
+            state.prisoners[member.id] = PrisonRecord(roles, member.display_name, since)
+
+            try:
+                # Apply prison role and remove all other roles
+                await member_edits.edit(member, roles=[prison_role], nick=PRISONER_NICK)
+            except Exception as e:
+                self._forget(state, member.id)
+                self._finish(seq, ok=False)
+                if isinstance(e, discord.errors.Forbidden):
+                    await log_activity(bot, f"❌ Failed to imprison {member.mention} - insufficient permissions")
+                else:
+                    await log_activity(bot, f"❌ Error imprisoning {member.mention}: {e}")
+                    logger.error(f"Error imprisoning {member.id}: {e}")
+                return False
+
+            self.transitions.pop((member.guild.id, member.id), None)
+            state.save_prison()
+            self._finish(seq)
+
+        await log_activity(bot, f"🔒 {member.mention} has been imprisoned for 1 hour!")
+        self._schedule_release(bot, member)
+        return True
+
+    async def adopt(self, bot, member, prison_role) -> bool:
+        """Track a member who was given the prison role outside the bot"""
+        async with self._member_lock(member):
+            if self.is_tracked(member):
+                return False
+            logger.info(f"Auto-adding {member.name} to prison system")
+            state = guild_states.get(member.guild.id)
+            roles = [role.id for role in member.roles if role != prison_role and not role.is_default()]
+            since = clock.now()
+            seq = self._begin('imprison', member, roles, member.display_name, since)
+            state.prisoners[member.id] = PrisonRecord(roles, member.display_name, since)
+            try:
+                await member_edits.edit(member, nick=PRISONER_NICK)
+            except Exception as e:
+                # Left untracked; the next role event or restart tries again
+                self._forget(state, member.id)
+                self._finish(seq, ok=False)
+                await log_activity(bot, f"❌ Error adding {member.mention} to the prison system: {e}")
+                logger.error(f"Error adopting prisoner {member.id}: {e}")
+                return False
+            state.save_prison()
+            self._finish(seq)
+
+        self._schedule_release(bot, member)
+        return True
+
+    def _release_edit(self, member, prison_role, role_ids, original_nick) -> dict:
+        original_roles = [
+            role for role in (member.guild.get_role(role_id) for role_id in role_ids)
+            if role and role != prison_role
+        ]
+        edit = {}
+        if original_roles:
+            edit['roles'] = original_roles
+        else:
+            edit['remove_roles'] = [prison_role]
+        if original_nick:
+            edit['nick'] = original_nick
+        elif member.display_name.startswith(PRISONER_NICK):
+            edit['nick'] = None
+        return edit
+
+    async def release(self, bot, member, persist=True, announce=True) -> bool:
+        """Release a member from prison, restoring roles and nickname in one edit"""
+        if not member:
+            return False
+
+        async with self._member_lock(member):
+            prison_role = discord.utils.get(member.guild.roles, name=PRISON_ROLE_NAME)
+            if not self.is_tracked(member):
+                # The timer and the release loop can both get here for one prisoner, and
+                # whoever comes second holds a member object from before the first release.
+                # Untracked members are only released when the cached copy has the role
+                member = member.guild.get_member(member.id)
+                if member is None or prison_role is None or prison_role not in member.roles:
+                    return False
+            has_role = prison_role is not None and prison_role in member.roles
+
+            state = guild_states.get(member.guild.id)
+            record = state.prisoners.get(member.id) or PrisonRecord()
+            role_ids, original_nick = record.role_ids, record.nick
+            seq = self._begin('release', member, role_ids, original_nick, record.since)
+            self.transitions[(member.guild.id, member.id)] = RELEASING
+
+            try:
+                if has_role:
+                    nick_applied = await member_edits.edit(
+                        member, **self._release_edit(member, prison_role, role_ids, original_nick)
+                    )
+                    if not nick_applied:
+                        await log_activity(bot, f"⚠️ Failed to restore nickname for {member.mention} due to permissions")
+            except Exception as e:
+                # Still imprisoned; leave it to the next release attempt
+                self.transitions.pop((member.guild.id, member.id), None)
+                self._finish(seq, ok=False)
+                await log_activity(bot, f"❌ Error releasing {member.mention}: {e}")
+                logger.error(f"Error releasing {member.id}: {e}")
+                return False
+
+            self._forget(state, member.id)
+            state.set_report_count(member.id, 0)
+            if persist:
+                state.save_reports()
+                state.save_prison()
+            self._finish(seq)
+
+        if announce:
+            await log_activity(bot, f"🔓 {member.mention} has been released from prison!")
+        return True
+
+    async def release_due(self, bot) -> int:
+        """Release every prisoner whose sentence is over, across all guilds, as one batch.
+
+        Members are released through a bounded pipeline, each touched guild
+        partition is saved once for the whole batch and a single summary line
+        goes to the log channels. Partitions with prisoners are never evicted,
+        so the loaded partitions hold every prisoner.
+        """
+        now = clock.now()
+        members = []
+        touched = []
+        for state in guild_states.loaded():
+            due = [user_id for user_id, record in state.prisoners.items() if record.since + PRISON_DURATION <= now]
+            if not due:
+                continue
+            touched.append(state)
+            guild = bot.get_guild(state.guild_id)
+            for user_id in due:
+                member = await member_lookup.get(guild, user_id) if guild else None
+                if member:
+                    members.append(member)
+                else:
+                    # Due prisoners who are not in the guild any more
+                    self._forget(state, user_id)
+        if not touched:
+            return 0
+
+        semaphore = asyncio.Semaphore(RELEASE_CONCURRENCY)
+
+        async def release(member):
+            async with semaphore:
+                return await self.release(bot, member, persist=False, announce=False)
+
+        results = await asyncio.gather(*(release(member) for member in members))
+        released = [member for member, ok in zip(members, results) if ok]
+
+        for state in touched:
+            state.save_reports()
+            state.save_prison()
+
+        if released:
+            mentions = " ".join(member.mention for member in released[:SUMMARY_MENTION_LIMIT])
+            if len(released) > SUMMARY_MENTION_LIMIT:
+                mentions += f" (+{len(released) - SUMMARY_MENTION_LIMIT} more)"
+            await log_activity(bot, f"🔓 Released {len(released)} prisoner(s) whose time was up: {mentions}")
+        return len(released)
+
+    def _schedule_release(self, bot, member) -> None:
+        # Keyed per member, so a second imprisonment restarts the timer instead of adding one
+        task_supervisor.spawn(
+            'prison_release', (member.guild.id, member.id),
+            self.release_after_delay(bot, PRISON_DURATION), replace=True
+        )
+
+    async def release_after_delay(self, bot, delay):
+        """Wait out a sentence, then release everyone who is due at that point"""
+        await clock.sleep(delay)
+        await self.release_due(bot)
+
+    async def recover(self, bot) -> int:
+        """Replay transitions that were in flight when the bot last stopped.
+
+        Imprisonments, adoptions and releases wait for this to finish. Runs
+        once per process; later calls (on_ready after a reconnect) are no-ops,
+        since the log then only holds this process's own in-flight intents.
+        """
+        if self._recovered.is_set():
+            return 0
+        try:
+            return await self._replay(bot)
+        finally:
+            self._recovered.set()
+
+    async def _replay(self, bot) -> int:
+        pending = self.intents.pending()
+        touched = {}
+        for intent in pending:
+            user_id = intent['user_id']
+            state = touched[intent['guild_id']] = guild_states.get(intent['guild_id'])
+            guild = bot.get_guild(intent['guild_id'])
+            member = await member_lookup.get(guild, user_id) if guild else None
+            try:
+                if intent['op'] == 'imprison':
+                    state.prisoners[user_id] = PrisonRecord(intent['roles'], intent['nick'], intent['since'])
+                    if member:
+                        prison_role = await self.ensure_prison_role(bot, guild)
+                        await member_edits.edit(member, roles=[prison_role], nick=PRISONER_NICK)
+                else:
+                    if member:
+                        prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
+                        if prison_role in member.roles:
+                            await member_edits.edit(
+                                member, **self._release_edit(member, prison_role, intent['roles'], intent['nick'])
+                            )
+                    self._forget(state, user_id)
+                    state.set_report_count(user_id, 0)
+            except Exception as e:
+                logger.error(f"Error replaying prison intent {intent['seq']} for {user_id}: {e}")
+
+        for state in touched.values():
+            state.save_reports()
+            state.save_prison()
+        if pending:
+            logger.info(f"Replayed {len(pending)} in-flight prison transition(s)")
+        self.intents.truncate()
+        return len(pending)
+
+
+prison_service = PrisonService()
@@ -0,0 +1,179 @@
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, Optional
+
+import aiohttp
+import clock
+
+logger = logging.getLogger("discord_bot")
+
+RATE_LIMIT_RESERVE = 1         # Requests left in a bucket that bulk work won't spend
+RATE_LIMIT_SPREAD_BELOW = 0.5  # Below this share of the limit, spread requests over the reset window
+RATE_LIMIT_STALE = 3600        # Seconds after which an unused bucket is forgotten
+
+_API_PREFIX = re.compile(r'^/api/v\d+')
+_MAJOR_PARAMS = ('guilds', 'channels', 'webhooks')
+
+
+def route_key(method: str, path: str) -> str:
+    """Route identity used for buckets: ids replaced except the major parameter.
+
+    "PATCH /api/v10/guilds/1/members/2" -> "PATCH /guilds/1/members/{id}"
+    """
+    parts = _API_PREFIX.sub('', path).strip('/').split('/')
+    for idx, part in enumerate(parts):
+        if idx == 1 and parts[0] in _MAJOR_PARAMS:
+            continue
+        if part.isdigit():
+            parts[idx] = '{id}'
+        elif len(part) > 40:
+            parts[idx] = '{token}'  # Interaction and webhook tokens
+    return f"{method.upper()} /{'/'.join(parts)}"
+
+
+def _major(key: str) -> str:
+    parts = key.split(' ', 1)[1].strip('/').split('/')
+    return '/'.join(parts[:2]) if parts[0] in _MAJOR_PARAMS and len(parts) > 1 else ''
+
+
+class _Bucket:
+    __slots__ = ('name', 'limit', 'remaining', 'reset_at', 'requests', 'limited', 'routes', 'seen')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = 0
+        self.remaining = 0
+        self.reset_at = 0.0
+        self.requests = 0
+        self.limited = 0
+        self.routes = set()
+        self.seen = 0.0
+
+
+class RateLimitTracker:
+    """Per-bucket view of Discord's rate limit headers.
+
+    Fed by an aiohttp TraceConfig on the bot's HTTP session, so every REST
+    call is seen without wrapping discord.py's client. Bulk pipelines call
+    pace() before each request: it waits out a nearly exhausted bucket and
+    spreads requests over the reset window once a bucket drops below half,
+    so mass edits slow down ahead of the limit instead of running into 429s.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[tuple, _Bucket] = {}
+        self.routes: Dict[str, tuple] = {}
+        self.responses_429 = defaultdict(int)  # scope -> count
+        self.requests = 0
+        self.paced = 0
+        self.paced_seconds = 0.0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._on_request_end)
+        return trace
+
+    async def _on_request_end(self, session, context, params) -> None:
+        self.observe(params.method, params.url.path, params.response.status, params.response.headers)
+
+    def observe(self, method: str, path: str, status: int, headers) -> None:
+        self.requests += 1
+        key = route_key(method, path)
+        if status == 429:
+            scope = headers.get('X-RateLimit-Scope') or (
+                'global' if headers.get('X-RateLimit-Global') else 'user'
+            )
+            self.responses_429[scope] += 1
+            logger.warning(f"429 on {key} (scope {scope}, retry after {headers.get('Retry-After')}s)")
+
+        name = headers.get('X-RateLimit-Bucket')
+        if name is None:
+            bucket = self._bucket_for(key)
+            if bucket is not None and status == 429:
+                bucket.limited += 1
+            return
+        bucket_key = (name, _major(key))
+        self.routes[key] = bucket_key
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self.buckets[bucket_key] = _Bucket(name)
+        now = clock.now()
+        bucket.routes.add(key)
+        bucket.requests += 1
+        bucket.seen = now
+        if status == 429:
+            bucket.limited += 1
+        try:
+            bucket.limit = int(headers.get('X-RateLimit-Limit', bucket.limit))
+            bucket.remaining = int(headers.get('X-RateLimit-Remaining', bucket.remaining))
+            reset_after = headers.get('X-RateLimit-Reset-After')
+            if reset_after is not None:
+                bucket.reset_at = now + float(reset_after)
+        except ValueError:
+            pass
+
+    def _bucket_for(self, key: str) -> Optional[_Bucket]:
+        bucket_key = self.routes.get(key)
+        return self.buckets.get(bucket_key) if bucket_key else None
+
+    def delay(self, method: str, path: str) -> float:
+        """Seconds a bulk caller should wait before this request; claims a slot in the bucket"""
+        bucket = self._bucket_for(route_key(method, path))
+        if bucket is None:
+            return 0.0
+        now = clock.now()
+        if now >= bucket.reset_at:
+            return 0.0
+        window = bucket.reset_at - now
+        if bucket.remaining <= RATE_LIMIT_RESERVE:
+            wait = window
+        elif bucket.remaining < bucket.limit * RATE_LIMIT_SPREAD_BELOW:
+            wait = window / bucket.remaining
+        else:
+            wait = 0.0
+        # Count ourselves in, so concurrent callers don't all see the same headroom
+        bucket.remaining -= 1
+        return wait
+
+    async def pace(self, method: str, path: str) -> float:
+        wait = self.delay(method, path)
+        if wait > 0:
+            self.paced += 1
+            self.paced_seconds += wait
+            await clock.sleep(wait)
+        return wait
+
+    def prune(self) -> int:
+        cutoff = clock.now() - RATE_LIMIT_STALE
+        stale = [key for key, bucket in self.buckets.items() if bucket.seen < cutoff]
+        for key in stale:
+            del self.buckets[key]
+        self.routes = {route: key for route, key in self.routes.items() if key in self.buckets}
+        return len(stale)
+
+    def tightest(self, limit: int = 10):
+        """Buckets with the least headroom left in their current window, 429s first"""
+        now = clock.now()
+
+        def headroom(bucket):
+            if now >= bucket.reset_at or not bucket.limit:
+                return 1.0
+            return max(bucket.remaining, 0) / bucket.limit
+        return sorted(self.buckets.values(), key=lambda b: (-b.limited, headroom(b)))[:limit]
+
+    def metrics(self) -> dict:
+        return {
+            'requests': self.requests,
+            'responses_429': dict(self.responses_429),
+            'buckets': len(self.buckets),
+            'paced': self.paced,
+            'paced_seconds': round(self.paced_seconds, 1),
+            'exhausted': sum(
+                1 for bucket in self.buckets.values()
+                if bucket.remaining <= 0 and bucket.reset_at > clock.now()
+            ),
+        }
+
+
+rate_limits = RateLimitTracker()
@@ -0,0 +1,57 @@
+from array import array
+from typing import Dict, Iterable, Optional, Set
+
+
+class ReportRecord:
+    """Reports filed against one user in one guild"""
+
+    __slots__ = ('count', 'reasons', 'last_report', 'guild_id')
+
+    def __init__(self, count: int = 0, reasons: Iterable[str] = (), last_report: float = 0,
+                 guild_id: Optional[int] = None):
+        self.count = count
+        self.reasons = list(reasons)
+        self.last_report = last_report
+        self.guild_id = guild_id
+
+
+class PrisonRecord:
+    """What a prisoner had before their sentence, restored on release"""
+
+    __slots__ = ('role_ids', 'nick', 'since')
+
+    def __init__(self, role_ids: Iterable[int] = (), nick: Optional[str] = None, since: float = 0):
+        self.role_ids = array('Q', role_ids)
+        self.nick = nick
+        self.since = since
+
+
+RECORD_TYPES = (ReportRecord, PrisonRecord)
+
+
+def encode(value):
+    """Turn records, and the ID-keyed maps holding them, into JSON-ready data"""
+    if isinstance(value, RECORD_TYPES):
+        return {name: encode(getattr(value, name)) for name in value.__slots__}
+    if isinstance(value, dict):
+        return {str(key): encode(item) for key, item in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, (list, tuple, array)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(record_type, data: dict) -> dict:
+    """Rebuild {user_id: record} from encode() output, ignoring unknown fields"""
+    return {
+        int(user_id): record_type(**{
+            name: fields[name] for name in record_type.__slots__ if name in fields
+        })
+        for user_id, fields in data.items()
+    }
+
+
+def decode_id_sets(data: dict) -> Dict[int, Set[int]]:
+    """Rebuild {user_id: {ids}} from encode() output"""
+    return {int(user_id): {int(other) for other in ids} for user_id, ids in data.items()}
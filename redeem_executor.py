@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict, deque
+from datetime import timedelta
+
+import discord
+from vc_locks import vc_locks, VC_LOCK_DURATION
+from task_supervisor import task_supervisor
+from rate_limits import rate_limits
+
+logger = logging.getLogger("discord_bot")
+
+REDEEM_CONCURRENCY = 2        # Actions running at once per guild
+REDEEM_ACTION_TIMEOUT = 30    # Seconds before an action is given up on
+REDEEM_JOB_CACHE_SIZE = 1000  # Remembered job keys for duplicate submits
+
+
+class RedeemJob:
+    __slots__ = ('key', 'guild_id', 'action', 'target', 'cost', 'duration', 'channel')
+
+    def __init__(self, key: str, guild_id: int, action: str, target: discord.Member, cost: int,
+                 duration: int = None, channel=None):
+        self.key = key
+        self.guild_id = guild_id
+        self.action = action
+        self.target = target
+        self.cost = cost
+        self.duration = duration
+        self.channel = channel
+
+
+class RedeemExecutor:
+    """Runs redeem actions off the interaction, per guild with bounded concurrency.
+
+    submit() returns a future resolving to the action's description or
+    raising its error. Submitting the same key again returns the original
+    future, so a retried interaction never runs an action twice. Workers
+    are started on demand and exit once their guild's queue is empty.
+    """
+
+    def __init__(self, concurrency: int = REDEEM_CONCURRENCY):
+        self.concurrency = concurrency
+        self._queues = defaultdict(deque)
+        self._workers = defaultdict(int)
+        self._jobs = OrderedDict()
+        self.completed = 0
+        self.failed = 0
+
+    def queued(self, guild_id: int) -> int:
+        return len(self._queues.get(guild_id, ()))
+
+    def submit(self, job: RedeemJob) -> asyncio.Future:
+        future = self._jobs.get(job.key)
+        if future is not None:
+            return future
+        future = asyncio.get_running_loop().create_future()
+        self._jobs[job.key] = future
+        if len(self._jobs) > REDEEM_JOB_CACHE_SIZE:
+            self._jobs.popitem(last=False)
+        self._queues[job.guild_id].append((job, future))
+        if self._workers[job.guild_id] < self.concurrency:
+            self._workers[job.guild_id] += 1
+            task_supervisor.spawn('redeem', None, self._work(job.guild_id))
+        return future
+
+    async def _work(self, guild_id: int) -> None:
+        queue = self._queues[guild_id]
+        try:
+            while queue:
+                job, future = queue.popleft()
+                try:
+                    result = await asyncio.wait_for(self._perform(job), REDEEM_ACTION_TIMEOUT)
+                except Exception as e:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._workers[guild_id] -= 1
+            if not self._workers[guild_id]:
+                del self._workers[guild_id]
+                if not queue:
+                    self._queues.pop(guild_id, None)
+
+    async def _perform(self, job: RedeemJob) -> str:
+        target = job.target
+        # Every action ends in a member PATCH; back off before it, not after a 429
+        await rate_limits.pace('PATCH', f"/guilds/{job.guild_id}/members/{target.id}")
+        if job.action == "timeout":
+            await target.timeout(discord.utils.utcnow() + timedelta(minutes=job.duration))
+            return f"⏳ {target.mention} timed out for {job.duration} minutes (Cost: {job.cost} points)"
+        if job.action == "move":
+            await target.move_to(job.channel)
+            return f"🚚 Moved {target.mention} to {job.channel.name} (Cost: {job.cost} points)"
+        if job.action == "kick":
+            await target.move_to(None)
+            return f"🚪 Kicked {target.mention} from VC (Cost: {job.cost} points)"
+        if job.action == "kick_lock":
+            if not target.voice or not target.voice.channel:
+                raise ValueError(f"{target.display_name} is not in a voice channel")
+            await vc_locks.lock(target, target.voice.channel)
+            await target.move_to(None)
+            return (
+                f"🔒 Kicked & locked {target.mention} from VC for {VC_LOCK_DURATION // 60} minutes "
+                f"(Cost: {job.cost} points)"
+            )
+        raise ValueError(f"Unknown redeem action: {job.action}")
+
+
+redeem_executor = RedeemExecutor()
@@ -0,0 +1,122 @@
+from array import array
+from typing import Dict, NamedTuple, Set
+
+import clock
+
+RATE_BUCKET_SECONDS = 900  # 15 minute buckets
+RATE_BUCKETS = 96          # 24 hour window
+
+
+class WindowRule(NamedTuple):
+    """N reports from M distinct reporters within T minutes"""
+    reports: int
+    reporters: int
+    minutes: int
+
+
+class _TargetWindow:
+    __slots__ = ('bucket_ids', 'reports', 'distinct', 'latest_by_reporter')
+
+    def __init__(self, buckets: int):
+        self.bucket_ids = array('q', [-1]) * buckets
+        self.reports = array('l', [0]) * buckets
+        # Reporters whose most recent report landed in each bucket
+        self.distinct = array('l', [0]) * buckets
+        self.latest_by_reporter = {}
+
+
+class ReportRateEngine:
+    """Per-target ring of report counters over a fixed sliding window.
+
+    Each slot counts reports and the reporters whose *latest* report fell in
+    it, so "distinct reporters in the last T minutes" is a sum over at most
+    RATE_BUCKETS slots: constant work per report and bounded memory per
+    target, no matter how long the reason history grows.
+    """
+
+    def __init__(self, buckets: int = RATE_BUCKETS, width: int = RATE_BUCKET_SECONDS):
+        self.buckets = buckets
+        self.width = width
+        self._targets: Dict[int, _TargetWindow] = {}
+        self._last_prune = -1
+
+    def _bucket(self, when: float = None) -> int:
+        return int((clock.now() if when is None else when) // self.width)
+
+    def _slot(self, window: _TargetWindow, bucket: int) -> int:
+        slot = bucket % self.buckets
+        if window.bucket_ids[slot] != bucket:
+            window.bucket_ids[slot] = bucket
+            window.reports[slot] = 0
+            window.distinct[slot] = 0
+        return slot
+
+    def counts(self, target_id: int, minutes: int, when: float = None):
+        """(reports, distinct reporters) against target in the last `minutes`"""
+        window = self._targets.get(target_id)
+        if window is None:
+            return 0, 0
+        current = self._bucket(when)
+        span = min(self.buckets, -(-minutes * 60 // self.width))
+        oldest = current - span + 1
+        reports = reporters = 0
+        for slot, bucket in enumerate(window.bucket_ids):
+            if oldest <= bucket <= current:
+                reports += window.reports[slot]
+                reporters += window.distinct[slot]
+        return reports, reporters
+
+    def satisfied(self, target_id: int, rules: Dict[str, WindowRule], when: float = None) -> Set[str]:
+        matched = set()
+        for name, rule in rules.items():
+            reports, reporters = self.counts(target_id, rule.minutes, when)
+            if reports >= rule.reports and reporters >= rule.reporters:
+                matched.add(name)
+        return matched
+
+    def record(self, target_id: int, reporter_id: int, rules: Dict[str, WindowRule] = None,
+               when: float = None) -> Set[str]:
+        """Count one report; returns the rules this report newly satisfied"""
+        before = self.satisfied(target_id, rules, when) if rules else set()
+        bucket = self._bucket(when)
+        if bucket != self._last_prune:
+            self.prune(bucket)
+
+        window = self._targets.get(target_id)
+        if window is None:
+            window = self._targets[target_id] = _TargetWindow(self.buckets)
+        slot = self._slot(window, bucket)
+
+        previous = window.latest_by_reporter.get(reporter_id)
+        if previous is not None:
+            prev_slot = previous % self.buckets
+            if window.bucket_ids[prev_slot] == previous:
+                window.distinct[prev_slot] -= 1
+        window.latest_by_reporter[reporter_id] = bucket
+        window.distinct[slot] += 1
+        window.reports[slot] += 1
+
+        if not rules:
+            return set()
+        return self.satisfied(target_id, rules, when) - before
+
+    def reset(self, target_id: int) -> None:
+        """Forget a target's window (e.g. after they served their sentence)"""
+        self._targets.pop(target_id, None)
+
+    def clear(self) -> None:
+        self._targets.clear()
+
+    def prune(self, bucket: int = None) -> None:
+        """Drop targets and reporters with nothing inside the window any more"""
+        bucket = self._bucket() if bucket is None else bucket
+        self._last_prune = bucket
+        oldest = bucket - self.buckets + 1
+        for target_id in list(self._targets):
+            window = self._targets[target_id]
+            if max(window.bucket_ids) < oldest:
+                del self._targets[target_id]
+                continue
+            stale = [rid for rid, b in window.latest_by_reporter.items() if b < oldest]
+            for reporter_id in stale:
+                del window.latest_by_reporter[reporter_id]
@@ -0,0 +1,124 @@
+import os
+import re
+import sqlite3
+import logging
+from typing import List, Optional, Tuple
+from shared import SCRIPT_DIR, load_data
+from guild_state import GUILD_DATA_DIR, PARTITION_FILES
+
+logger = logging.getLogger("discord_bot")
+
+REPORT_SEARCH_DB = os.path.join(SCRIPT_DIR, "report_search.db")
+SEARCH_PAGE_SIZE = 10
+REPORTED_BY_SUFFIX = re.compile(r"^(.*?)\s*\(Reported by: ([^()]*)\)\s*$", re.S)
+
+
+def parse_reason(full_reason: str) -> Tuple[str, Optional[str]]:
+    """Split 'reason (Reported by: name)' into (reason, reporter)"""
+    match = REPORTED_BY_SUFFIX.match(full_reason)
+    if match:
+        return match.group(1), match.group(2)
+    return full_reason, None
+
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+class ReportSearchIndex:
+    """FTS5 index over report reasons with the reporter parsed into its own column.
+
+    Nothing is opened on import; setup() opens the database once guild
+    partitions are in place and rebuilds it from them when needed.
+    """
+
+    def __init__(self, path: str = REPORT_SEARCH_DB):
+        self.path = path
+        self.db = None
+
+    def setup(self, root: str = GUILD_DATA_DIR) -> None:
+        """Open the index; rebuild it if it is empty or has rows from before guild scoping"""
+        if self.db is not None:
+            return
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS reports USING fts5("
+            "reason, reporter, target_id UNINDEXED, guild_id UNINDEXED, reported_at UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        self.db.commit()
+        unscoped = self.db.execute("SELECT rowid FROM reports WHERE guild_id IS NULL LIMIT 1").fetchone()
+        if unscoped is not None or self.is_empty():
+            # The database isn't snapshotted; a fresh host rebuilds it from the saved reports
+            with self.db:
+                self.db.execute("DELETE FROM reports")
+            seeded = sum(self.seed(reports, guild_id) for guild_id, reports in partition_reports(root))
+            if seeded:
+                logger.info(f"Seeded report search index with {seeded} reasons")
+
+    def is_empty(self) -> bool:
+        return self.db.execute("SELECT rowid FROM reports LIMIT 1").fetchone() is None
+
+    def add(self, target_id: int, guild_id: int, full_reason: str, when: float) -> None:
+        """Index one report as it is filed"""
+        reason, reporter = parse_reason(full_reason)
+        try:
+            self.db.execute(
+                "INSERT INTO reports (reason, reporter, target_id, guild_id, reported_at) VALUES (?, ?, ?, ?, ?)",
+                (reason, reporter or "", str(target_id), guild_id, when)
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error indexing report for {target_id}: {e}")
+
+    def seed(self, reports: dict, guild_id: int) -> int:
+        """Bulk-index one guild's report history; only reasons are known, not their times"""
+        rows = []
+        for target_id, record in reports.items():
+            for full_reason in record.get('reasons', []):
+                reason, reporter = parse_reason(full_reason)
+                rows.append((reason, reporter or "", str(target_id), guild_id, record.get('last_report', 0)))
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO reports (reason, reporter, target_id, guild_id, reported_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def search(self, text: str = "", reporter: Optional[str] = None, guild_id: int = None,
+               page: int = 1, per_page: int = SEARCH_PAGE_SIZE) -> Tuple[List[tuple], bool]:
+        """Return (rows, has_more) newest first; rows are (target_id, reason, reporter, reported_at)"""
+        terms = []
+        if text.strip():
+            terms.append("reason : (" + " ".join(_phrase(word) for word in text.split()) + ")")
+        if reporter:
+            terms.append("reporter : " + _phrase(reporter))
+        if not terms:
+            return [], False
+
+        query = (
+            "SELECT target_id, reason, reporter, reported_at FROM reports "
+            "WHERE reports MATCH ? AND guild_id = ? "
+            "ORDER BY rowid DESC LIMIT ? OFFSET ?"
+        )
+        rows = self.db.execute(
+            query, (" AND ".join(terms), guild_id, per_page + 1, (page - 1) * per_page)
+        ).fetchall()
+        return rows[:per_page], len(rows) > per_page
+
+
+def partition_reports(root: str = GUILD_DATA_DIR):
+    """Stream (guild_id, reports) from each partition's saved file without loading the partitions"""
+    try:
+        guild_dirs = os.listdir(root)
+    except OSError:
+        return
+    for guild_dir in guild_dirs:
+        path = os.path.join(root, guild_dir, PARTITION_FILES['reports'])
+        if guild_dir.isdigit() and os.path.exists(path):
+            yield int(guild_dir), load_data(path)
+
+
+report_search = ReportSearchIndex()
@@ -0,0 +1,158 @@
+import gzip
+import heapq
+import logging
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import clock
+
+logger = logging.getLogger("discord_bot")
+
+SEASON_LENGTH_DAYS = int(os.getenv("SEASON_LENGTH_DAYS", "30"))
+# "reset" starts everyone at 0; "carry" keeps SEASON_CARRY_PERCENT of each balance
+SEASON_POLICY = os.getenv("SEASON_POLICY", "reset")
+SEASON_CARRY_PERCENT = int(os.getenv("SEASON_CARRY_PERCENT", "10"))
+SEASON_DIR = "seasons"
+
+ARCHIVE_MAGIC = b"SEA1"
+# magic, season number, member count, season start, season end
+ARCHIVE_HEADER = struct.Struct("<4sIQdd")
+ARCHIVE_RECORD = struct.Struct("<Qq")  # user ID, final balance
+ARCHIVE_CHUNK = 4096                   # Records per read/write
+
+
+def archive_path(partition: str, number: int) -> str:
+    return os.path.join(partition, SEASON_DIR, f"season-{number}.gz")
+
+
+def archived_seasons(partition: str) -> List[int]:
+    try:
+        names = os.listdir(os.path.join(partition, SEASON_DIR))
+    except OSError:
+        return []
+    return sorted(
+        int(name[len("season-"):-len(".gz")]) for name in names
+        if name.startswith("season-") and name.endswith(".gz")
+    )
+
+
+def write_archive(path: str, number: int, started: float, ended: float, items) -> int:
+    """Write final balances as gzip'd fixed-size records, then make the file read-only"""
+    items = [(user_id, balance) for user_id, balance in items if balance]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wb") as f:
+        f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, number, len(items), started, ended))
+        for start in range(0, len(items), ARCHIVE_CHUNK):
+            f.write(b"".join(ARCHIVE_RECORD.pack(*item) for item in items[start:start + ARCHIVE_CHUNK]))
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, path)
+    return len(items)
+
+
+def read_archive_header(path: str) -> Tuple[int, int, float, float]:
+    with gzip.open(path, "rb") as f:
+        return _read_header(f, path)
+
+
+def _read_header(f, path: str) -> Tuple[int, int, float, float]:
+    header = f.read(ARCHIVE_HEADER.size)
+    if len(header) < ARCHIVE_HEADER.size:
+        raise ValueError(f"Truncated season archive: {path}")
+    magic, number, count, started, ended = ARCHIVE_HEADER.unpack(header)
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError(f"Not a season archive: {path}")
+    return number, count, started, ended
+
+
+def iter_archive(path: str) -> Iterator[Tuple[int, int]]:
+    """Stream (user_id, balance) records a chunk at a time"""
+    with gzip.open(path, "rb") as f:
+        _read_header(f, path)
+        chunk_bytes = ARCHIVE_CHUNK * ARCHIVE_RECORD.size
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            if len(chunk) % ARCHIVE_RECORD.size:
+                raise ValueError(f"Truncated season archive: {path}")
+            yield from ARCHIVE_RECORD.iter_unpack(chunk)
+
+
+def archive_top(path: str, limit: int, user_id: int = None) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """Top `limit` balances of an archive, plus one user's balance, in a single streaming pass.
+
+    Memory is bounded by `limit`, not by the number of archived members.
+    """
+    heap = []
+    mine = None
+    for record_id, balance in iter_archive(path):
+        if record_id == user_id:
+            mine = balance
+        if len(heap) < limit:
+            heapq.heappush(heap, (balance, record_id))
+        elif balance > heap[0][0]:
+            heapq.heapreplace(heap, (balance, record_id))
+    top = sorted(heap, reverse=True)
+    return [(record_id, balance) for balance, record_id in top], mine
+
+
+def carried_balances(path: str, policy: str = SEASON_POLICY,
+                     carry_percent: int = SEASON_CARRY_PERCENT) -> Dict[int, int]:
+    """Opening balances for the next season, derived from the closed season's archive"""
+    if policy != "carry":
+        return {}
+    carried = {}
+    for user_id, balance in iter_archive(path):
+        kept = balance * carry_percent // 100
+        if kept > 0:
+            carried[user_id] = kept
+    return carried
+
+
+def season_ends(season: dict) -> float:
+    return season['started'] + SEASON_LENGTH_DAYS * 86400
+
+
+def roll_over(state) -> int:
+    """Close the guild's current season; returns the number of balances archived.
+
+    Runs without awaiting, so no ledger write can land between the archive
+    and the reset. The order makes a crash at any point recoverable: the
+    archive is only published by the season bump that follows it, and the
+    live reset is always recomputed from the archive, so finish_reset() can
+    simply be repeated.
+    """
+    season = state.season
+    number = season['number']
+    now = clock.now()
+    archived = write_archive(
+        archive_path(state.path, number), number, season['started'], now, state.points.items()
+    )
+    state.season = {'number': number + 1, 'started': now, 'reset_pending': number}
+    state.save_season()
+    finish_reset(state)
+    logger.info(f"Guild {state.guild_id} closed season {number} ({archived} balances archived)")
+    return archived
+
+
+def finish_reset(state) -> None:
+    closed = state.season.get('reset_pending')
+    if closed is None:
+        return
+    # Mutate in place; the ledger holds this store
+    state.points.clear()
+    state.points.update(carried_balances(archive_path(state.path, closed)))
+    state.save_points()
+    state.season['reset_pending'] = None
+    state.save_season()
+
+
+def catch_up(state) -> bool:
+    """Finish an interrupted reset and close the season if its boundary has passed"""
+    finish_reset(state)
+    if clock.now() >= season_ends(state.season):
+        roll_over(state)
+        return True
+    return False
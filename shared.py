@@ -4,6 +4,10 @@ import os
 import json
 import time
 import logging
+import clock
+from report_rate import ReportRateEngine, WindowRule
+from records import ReportRecord
+from rate_limits import rate_limits
 from collections import defaultdict
 from typing import Dict, List, Any, Optional
 
@@ -21,6 +25,13 @@ REPORT_NOTICE_THRESHOLD = 2  # Notice at 2 reports
 REPORT_DM_THRESHOLD = 3      # DM at 3 reports
 REPORT_PRISON_THRESHOLD = 15 # Prison at 15 reports
 
+# Threshold rules evaluated over a sliding window: N reports from M distinct reporters in T minutes
+REPORT_WINDOW_RULES = {
+    'notice': WindowRule(REPORT_NOTICE_THRESHOLD, 1, 60),
+    'dm': WindowRule(REPORT_DM_THRESHOLD, 2, 180),
+    'prison': WindowRule(REPORT_PRISON_THRESHOLD, 3, 24 * 60),
+}
+
 
 # File paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -28,17 +39,75 @@ REPORT_DATA_FILE = os.path.join(SCRIPT_DIR, "report_data.json")
 PRISON_DATA_FILE = os.path.join(SCRIPT_DIR, "prison_data.json")
 
 # Data storage
-reported_users = defaultdict(lambda: {
-    'count': 0,
-    'reasons': [],
-    'last_report': 0
-})
-user_roles_before_prison = {}
-user_nicknames_before_prison = {}
 vote_sessions = {}
 vote_cooldowns = {}
-dm_permissions = defaultdict(list)
-imprisonment_times = {}
+
+
+class ReportIndex:
+    """Secondary index over reported_users.
+
+    Buckets user IDs by report count and tracks which users have active
+    (count > 0) reports per guild, so summary, threshold and cleanup queries
+    touch only the matching users instead of everyone ever reported.
+    Records without a guild_id (older data) are indexed under None.
+    """
+
+    def __init__(self):
+        self.by_count = defaultdict(set)
+        self.active_by_guild = defaultdict(set)
+        self._entries = {}
+
+    def refresh(self, user_id: int, record: Optional[ReportRecord] = None) -> None:
+        """Re-index one user after their record changed (None drops them)"""
+        self.discard(user_id)
+        if not record:
+            return
+        count = record.count
+        guild_id = record.guild_id
+        self._entries[user_id] = (count, guild_id)
+        self.by_count[count].add(user_id)
+        if count > 0:
+            self.active_by_guild[guild_id].add(user_id)
+
+    def discard(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        count, guild_id = entry
+        self.by_count[count].discard(user_id)
+        if not self.by_count[count]:
+            del self.by_count[count]
+        active = self.active_by_guild.get(guild_id)
+        if active is not None:
+            active.discard(user_id)
+            if not active:
+                del self.active_by_guild[guild_id]
+
+    def rebuild(self, reports: Dict[int, ReportRecord]) -> None:
+        self.by_count.clear()
+        self.active_by_guild.clear()
+        self._entries.clear()
+        for user_id, record in reports.items():
+            self.refresh(user_id, record)
+
+    def count(self, user_id: int) -> int:
+        return self._entries.get(user_id, (0, None))[0]
+
+    def active_in_guild(self, guild_id: Optional[int]) -> List[int]:
+        """Active user IDs for a guild, highest report count first"""
+        return sorted(self.active_by_guild.get(guild_id, ()), key=self.count, reverse=True)
+
+    def at_least(self, threshold: int) -> List[int]:
+        """User IDs whose count is >= threshold"""
+        return [
+            user_id
+            for count, user_ids in self.by_count.items() if count >= threshold
+            for user_id in user_ids
+        ]
+
+
+# Shared by all guilds; targets are keyed by (guild_id, user_id)
+report_window = ReportRateEngine()
 
 # Initialize logger
 logger = logging.getLogger("discord_bot")
@@ -88,36 +157,21 @@ def is_mod_or_admin(ctx: commands.Context) -> bool:
         return True
     return ctx.author.guild_permissions.administrator
 
+async def delete_after(message, delay: float) -> None:
+    """Delete a message once delay seconds have passed on the active clock"""
+    await clock.sleep(delay)
+    try:
+        await message.delete()
+    except Exception:
+        pass
+
 async def log_activity(bot: commands.Bot, message: str) -> None:
     """Log activity to designated channels"""
     for channel_id in LOG_CHANNEL_IDS:
         channel = bot.get_channel(channel_id)
         if channel:
             try:
+                await rate_limits.pace('POST', f"/channels/{channel_id}/messages")
                 await channel.send(message)
             except discord.errors.HTTPException as e:
                 logger.error(f"Error sending log message to channel {channel_id}: {e}")
-
-def load_initial_data():
-    """Load initial data from files"""
-    global reported_users, user_roles_before_prison, user_nicknames_before_prison
-    
-    # Load report data
-    report_data = load_data(REPORT_DATA_FILE, lambda: {
-        'count': 0,
-        'reasons': [],
-        'last_report': 0
-    })
-    reported_users.update(report_data)
-    
-    # Load prison data
-    prison_data = load_data(PRISON_DATA_FILE)
-    if prison_data:
-        user_roles_before_prison.update({
-            int(user_id): prison_data['user_roles'].get(user_id, [])
-            for user_id in prison_data.get('user_roles', {})
-        })
-        user_nicknames_before_prison.update(prison_data.get('user_nicknames', {}))
-
-# Load data when module is imported
-load_initial_data()
\ No newline at end of file
@@ -0,0 +1,443 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import hmac
+import json
+import logging
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+import aiohttp
+import yarl
+from multidict import CIMultiDict
+from shared import SCRIPT_DIR
+
+logger = logging.getLogger("discord_bot")
+
+# "" (off), "local:<directory>" or "s3"
+SNAPSHOT_BACKEND = os.getenv("SNAPSHOT_BACKEND", "")
+SNAPSHOT_INTERVAL_MINUTES = 5
+SNAPSHOT_CONCURRENCY = 8
+SNAPSHOT_MANIFEST = ".snapshot_manifest.json"
+
+# What makes up the bot's state, relative to SCRIPT_DIR. Directories are taken whole.
+SNAPSHOT_PATHS = (
+    "guilds",
+    "dm_queue.json",
+    "prison_intents.log",
+    # Pre-partition files until migrate_legacy() consumes them, then what it left unclaimed
+    "legacy_migrated",
+    "report_data.json",
+    "prison_data.json",
+    "dm_permissions.json",
+    "user_points.json",
+    "user_points.bin",
+    "points_history.json",
+    "vc_locks.json",
+)
+
+
+class SnapshotConflict(Exception):
+    """The remote object changed since we last saw it"""
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+class SnapshotBackend(ABC):
+    """Where snapshots live. Objects are addressed by relative path.
+
+    ETags are opaque strings. put() with if_match only succeeds while the
+    remote object still has that ETag; with if_none_match it only creates.
+    Either precondition failing raises SnapshotConflict.
+    """
+
+    @abstractmethod
+    async def list(self) -> Dict[str, str]:
+        """{name: etag} for every stored object"""
+
+    @abstractmethod
+    async def get(self, name: str) -> Tuple[bytes, str]:
+        """(data, etag) of one object"""
+
+    @abstractmethod
+    async def put(self, name: str, data: bytes, if_match: str = None, if_none_match: bool = False) -> str:
+        """Store data; returns the new ETag"""
+
+    @abstractmethod
+    async def delete(self, name: str) -> None:
+        """Remove an object; missing objects are not an error"""
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalSnapshotBackend(SnapshotBackend):
+    """Snapshots in a local directory, with content MD5s as ETags like S3.
+
+    Meant for tests and single-host setups; it honours the same conditional
+    write rules as the object store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    async def list(self) -> Dict[str, str]:
+        objects = {}
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    objects[name] = _md5(f.read())
+        return objects
+
+    async def get(self, name: str) -> Tuple[bytes, str]:
+        with open(self._path(name), "rb") as f:
+            data = f.read()
+        return data, _md5(data)
+
+    async def put(self, name: str, data: bytes, if_match: str = None, if_none_match: bool = False) -> str:
+        path = self._path(name)
+        current = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                current = _md5(f.read())
+        if (if_none_match and current is not None) or (if_match is not None and current != if_match):
+            raise SnapshotConflict(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return _md5(data)
+
+    async def delete(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class S3SnapshotBackend(SnapshotBackend):
+    """S3-compatible object store (AWS, MinIO, R2, ...) over aiohttp.
+
+    Requests are signed with SigV4 by hand to avoid pulling in an SDK, and
+    use path-style URLs (endpoint/bucket/key), which every S3-compatible
+    store accepts. Conditional writes use If-Match / If-None-Match.
+    """
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", prefix: str = ""):
+        self.endpoint = endpoint.rstrip("/")
+        self.host = yarl.URL(self.endpoint).raw_authority
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls) -> "S3SnapshotBackend":
+        return cls(
+            endpoint=os.getenv("SNAPSHOT_S3_ENDPOINT", "https://s3.amazonaws.com"),
+            bucket=os.environ["SNAPSHOT_S3_BUCKET"],
+            access_key=os.environ["AWS_ACCESS_KEY_ID"],
+            secret_key=os.environ["AWS_SECRET_ACCESS_KEY"],
+            region=os.getenv("SNAPSHOT_S3_REGION", "us-east-1"),
+            prefix=os.getenv("SNAPSHOT_S3_PREFIX", "")
+        )
+
+    def sign(self, method: str, path: str, query: Dict[str, str], headers: Dict[str, str],
+             payload_hash: str, amz_date: str) -> Dict[str, str]:
+        """Headers for a SigV4-signed request; path must already be URI-encoded"""
+        headers = {name.lower(): str(value).strip() for name, value in headers.items()}
+        headers['host'] = self.host
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        signed_headers = ";".join(sorted(headers))
+        canonical_query = "&".join(
+            f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}" for key, value in sorted(query.items())
+        )
+        canonical_request = "\n".join([
+            method,
+            path,
+            canonical_query,
+            "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+            signed_headers,
+            payload_hash,
+        ])
+        datestamp = amz_date[:8]
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        key = ("AWS4" + self.secret_key).encode()
+        for part in (datestamp, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['authorization'] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        del headers['host']  # aiohttp sets it from the URL
+        return headers
+
+    async def _request(self, method: str, name: str = "", query: Dict[str, str] = None,
+                       data: bytes = b"", headers: Dict[str, str] = None) -> Tuple[int, CIMultiDict, bytes]:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        query = query or {}
+        path = quote(f"/{self.bucket}/{self.prefix}{name}" if name else f"/{self.bucket}", safe="/-_.~")
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        signed = self.sign(method, path, query, headers or {}, hashlib.sha256(data).hexdigest(), amz_date)
+        url = self.endpoint + path
+        if query:
+            url += "?" + "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items()))
+        async with self._session.request(method, yarl.URL(url, encoded=True), data=data or None,
+                                         headers=signed) as response:
+            return response.status, response.headers.copy(), await response.read()
+
+    @staticmethod
+    def _raise_for(status: int, name: str, body: bytes) -> None:
+        if status == 412:
+            raise SnapshotConflict(name)
+        if status >= 300:
+            raise RuntimeError(f"Object store returned {status} for {name or 'bucket'}: {body[:200]!r}")
+
+    async def list(self) -> Dict[str, str]:
+        objects = {}
+        query = {'list-type': '2', 'prefix': self.prefix}
+        while True:
+            status, _, body = await self._request("GET", query=query)
+            self._raise_for(status, "", body)
+            root = ET.fromstring(body)
+            ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            for item in root.iter(f"{ns}Contents"):
+                key = item.findtext(f"{ns}Key")
+                objects[key[len(self.prefix):]] = item.findtext(f"{ns}ETag", "").strip('"')
+            token = root.findtext(f"{ns}NextContinuationToken")
+            if root.findtext(f"{ns}IsTruncated") != "true" or not token:
+                return objects
+            query = dict(query, **{'continuation-token': token})
+
+    async def get(self, name: str) -> Tuple[bytes, str]:
+        status, headers, body = await self._request("GET", name)
+        self._raise_for(status, name, body)
+        return body, headers.get("ETag", "").strip('"')
+
+    async def put(self, name: str, data: bytes, if_match: str = None, if_none_match: bool = False) -> str:
+        headers = {'content-type': 'application/octet-stream'}
+        if if_match is not None:
+            headers['if-match'] = f'"{if_match}"'
+        if if_none_match:
+            headers['if-none-match'] = '*'
+        status, response_headers, body = await self._request("PUT", name, data=data, headers=headers)
+        self._raise_for(status, name, body)
+        return response_headers.get("ETag", "").strip('"')
+
+    async def delete(self, name: str) -> None:
+        status, _, body = await self._request("DELETE", name)
+        if status != 404:
+            self._raise_for(status, name, body)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+class SnapshotSync:
+    """Mirrors the state files under SCRIPT_DIR to a snapshot backend.
+
+    restore() runs once before anything reads local state: objects that
+    differ from the local copy are downloaded in parallel. push() uploads
+    only files whose size or mtime changed since the last sync, each with
+    the ETag it was last synced at, so an instance holding stale state gets
+    a conflict instead of overwriting newer snapshots.
+
+    A conflict whose remote bytes match ours just adopts the new ETag. Any
+    other conflict is parked in `conflicted` and skipped by later pushes,
+    and push() raises SnapshotConflict naming them. Each push keeps failing
+    until a restart restores the remote copies.
+    """
+
+    def __init__(self, backend: SnapshotBackend, root: str = SCRIPT_DIR):
+        self.backend = backend
+        self.root = root
+        self.manifest_path = os.path.join(root, SNAPSHOT_MANIFEST)
+        # name -> {'etag', 'size', 'mtime'} as of the last sync
+        self.manifest: Dict[str, dict] = self._load_manifest()
+        self.uploaded = 0
+        self.downloaded = 0
+        self.conflicts = 0
+        self.conflicted = set()
+        self._lock = asyncio.Lock()
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def local_files(self) -> Dict[str, os.stat_result]:
+        files = {}
+        for entry in SNAPSHOT_PATHS:
+            path = os.path.join(self.root, entry)
+            if os.path.isfile(path):
+                files[entry] = os.stat(path)
+            for directory, _, filenames in os.walk(path):
+                for filename in filenames:
+                    if filename.endswith(".tmp"):
+                        continue
+                    file_path = os.path.join(directory, filename)
+                    files[os.path.relpath(file_path, self.root).replace(os.sep, "/")] = os.stat(file_path)
+        return files
+
+    def _record(self, name: str, etag: str) -> None:
+        stat = os.stat(self._path(name))
+        self.manifest[name] = {'etag': etag, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    async def restore(self) -> int:
+        """Download every remote object that differs from the local file; returns the count"""
+        async with self._lock:
+            remote = await self.backend.list()
+            wanted = []
+            for name, etag in remote.items():
+                path = self._path(name)
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        if _md5(f.read()) == etag:
+                            self._record(name, etag)
+                            continue
+                wanted.append(name)
+
+            semaphore = asyncio.Semaphore(SNAPSHOT_CONCURRENCY)
+
+            async def download(name):
+                async with semaphore:
+                    data, etag = await self.backend.get(name)
+                path = self._path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._record(name, etag)
+
+            await asyncio.gather(*(download(name) for name in wanted))
+            self.downloaded += len(wanted)
+            self._save_manifest()
+            return len(wanted)
+
+    async def push(self) -> int:
+        """Upload changed files and drop remote copies of deleted ones; returns objects written"""
+        async with self._lock:
+            local = self.local_files()
+            changed = [
+                name for name, stat in local.items()
+                if name not in self.conflicted and (
+                    (known := self.manifest.get(name)) is None
+                    or known['size'] != stat.st_size or known['mtime'] != stat.st_mtime_ns
+                )
+            ]
+            removed = [name for name in self.manifest if name not in local]
+            semaphore = asyncio.Semaphore(SNAPSHOT_CONCURRENCY)
+
+            async def upload(name):
+                with open(self._path(name), "rb") as f:
+                    data = f.read()
+                known = self.manifest.get(name)
+                if known is not None and _md5(data) == known['etag']:
+                    # Touched but unchanged; just remember the new mtime
+                    self._record(name, known['etag'])
+                    return False
+                try:
+                    async with semaphore:
+                        etag = await self.backend.put(
+                            name, data,
+                            if_match=known['etag'] if known else None,
+                            if_none_match=known is None
+                        )
+                except SnapshotConflict:
+                    return await resolve(name, data)
+                self._record(name, etag)
+                return True
+
+            async def resolve(name, data):
+                try:
+                    async with semaphore:
+                        remote_data, remote_etag = await self.backend.get(name)
+                except Exception:
+                    remote_data = None
+                if remote_data is not None and _md5(remote_data) == _md5(data):
+                    # Someone already uploaded these exact bytes
+                    self._record(name, remote_etag)
+                    return False
+                self.conflicts += 1
+                self.conflicted.add(name)
+                logger.error(f"Snapshot conflict on {name}: the remote copy changed; not overwriting")
+                return False
+
+            async def remove(name):
+                async with semaphore:
+                    await self.backend.delete(name)
+                del self.manifest[name]
+
+            results = await asyncio.gather(*(upload(name) for name in changed), return_exceptions=True)
+            removals = await asyncio.gather(*(remove(name) for name in removed), return_exceptions=True)
+            for name, result in zip(changed + removed, results + removals):
+                if isinstance(result, Exception):
+                    logger.error(f"Error syncing snapshot of {name}: {result}")
+            written = sum(1 for result in results if result is True)
+            self.uploaded += written
+            self._save_manifest()
+            if self.conflicted:
+                raise SnapshotConflict(
+                    f"{len(self.conflicted)} file(s) diverged from the snapshot store: "
+                    + ", ".join(sorted(self.conflicted))
+                )
+            return written
+
+
+def backend_from_env(spec: str = SNAPSHOT_BACKEND) -> Optional[SnapshotBackend]:
+    if not spec:
+        return None
+    if spec.startswith("local:"):
+        return LocalSnapshotBackend(spec[len("local:"):])
+    if spec == "s3":
+        return S3SnapshotBackend.from_env()
+    raise ValueError(f"Unknown SNAPSHOT_BACKEND: {spec}")
+
+
+def snapshot_sync_from_env() -> Optional[SnapshotSync]:
+    backend = backend_from_env(os.getenv("SNAPSHOT_BACKEND", SNAPSHOT_BACKEND))
+    return SnapshotSync(backend) if backend else None
+
+
+def restore_before_startup(sync: SnapshotSync) -> int:
+    """Blocking cold-start restore, run before the bot's event loop exists"""
+    async def restore():
+        try:
+            return await sync.restore()
+        finally:
+            # The session belongs to this short-lived loop; push() opens a new one
+            await sync.backend.close()
+    return asyncio.run(restore())
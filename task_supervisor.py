@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import logging
+from collections import defaultdict
+from typing import Coroutine, Dict, Hashable, Optional
+
+import clock
+
+logger = logging.getLogger("discord_bot")
+
+# Most tasks of a category running at once; the rest wait for a slot
+TASK_LIMITS = {
+    'member_edit': 10,
+    'message_cleanup': 20,
+}
+# Categories that are allowed to finish on shutdown; everything else is cancelled
+TASK_SHUTDOWN_WAIT = {'member_edit', 'redeem'}
+TASK_DRAIN_TIMEOUT = 10
+
+
+class _Entry:
+    __slots__ = ('task', 'started', 'running')
+
+    def __init__(self, task: asyncio.Task, started: float):
+        self.task = task
+        self.started = started
+        self.running = False
+
+
+class TaskSupervisor:
+    """Owns every background task the bot starts.
+
+    Tasks are keyed by (category, key). Spawning a key that is still live
+    either returns the existing task or, with replace=True, cancels it and
+    starts the new one, so imprisoning a member twice leaves one release
+    timer. Categories in TASK_LIMITS run at most that many tasks at once.
+    Failures are logged instead of disappearing with the task, and drain()
+    winds everything down on shutdown.
+    """
+
+    def __init__(self, limits: Dict[str, int] = None):
+        self.limits = dict(TASK_LIMITS if limits is None else limits)
+        self._tasks: Dict[tuple, _Entry] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._anonymous = itertools.count()
+        self.failed = defaultdict(int)
+        self.closing = False
+
+    def spawn(self, category: str, key: Optional[Hashable], coro: Coroutine,
+              replace: bool = False) -> Optional[asyncio.Task]:
+        """Start coro under (category, key); key None means no deduplication"""
+        if self.closing:
+            coro.close()
+            return None
+        if key is None:
+            key = ('#', next(self._anonymous))
+        task_key = (category, key)
+        existing = self._tasks.get(task_key)
+        if existing is not None and not existing.task.done():
+            if not replace:
+                coro.close()
+                return existing.task
+            existing.task.cancel()
+
+        entry = _Entry(None, clock.now())
+        entry.task = asyncio.create_task(self._run(category, entry, coro))
+        entry.task.add_done_callback(lambda task: self._done(task_key, task, coro))
+        self._tasks[task_key] = entry
+        return entry.task
+
+    def cancel(self, category: str, key: Hashable) -> bool:
+        entry = self._tasks.get((category, key))
+        if entry is None or entry.task.done() or entry.task is asyncio.current_task():
+            return False
+        entry.task.cancel()
+        return True
+
+    async def _run(self, category: str, entry: _Entry, coro: Coroutine):
+        limit = self.limits.get(category)
+        if limit is None:
+            entry.running = True
+            return await coro
+        slots = self._slots.get(category)
+        if slots is None:
+            slots = self._slots[category] = asyncio.Semaphore(limit)
+        async with slots:
+            entry.running = True
+            return await coro
+
+    def _done(self, task_key: tuple, task: asyncio.Task, coro: Coroutine) -> None:
+        # Cancelled before it got a slot (or before it first ran): coro never started
+        coro.close()
+        entry = self._tasks.get(task_key)
+        if entry is not None and entry.task is task:
+            del self._tasks[task_key]
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            category, key = task_key
+            self.failed[category] += 1
+            logger.error(f"Background task {category}:{key} failed: {error!r}", exc_info=error)
+
+    def stats(self) -> Dict[str, dict]:
+        """Per category: live, running and waiting counts, oldest age in seconds, failures"""
+        now = clock.now()
+        stats = {}
+        for (category, _), entry in self._tasks.items():
+            if entry.task.done():
+                continue
+            row = stats.setdefault(category, {'live': 0, 'running': 0, 'waiting': 0, 'oldest': 0.0})
+            row['live'] += 1
+            row['running' if entry.running else 'waiting'] += 1
+            row['oldest'] = max(row['oldest'], now - entry.started)
+        for category in self.failed:
+            stats.setdefault(category, {'live': 0, 'running': 0, 'waiting': 0, 'oldest': 0.0})
+        for category, row in stats.items():
+            row['failed'] = self.failed.get(category, 0)
+            row['limit'] = self.limits.get(category)
+        return stats
+
+    async def drain(self, timeout: float = TASK_DRAIN_TIMEOUT) -> int:
+        """Stop accepting tasks, let TASK_SHUTDOWN_WAIT categories finish, cancel the rest"""
+        self.closing = True
+        current = asyncio.current_task()
+        finishing, cancelled = [], []
+        for (category, _), entry in list(self._tasks.items()):
+            if entry.task.done() or entry.task is current:
+                continue
+            if category in TASK_SHUTDOWN_WAIT:
+                finishing.append(entry.task)
+            else:
+                entry.task.cancel()
+                cancelled.append(entry.task)
+        drained = len(finishing) + len(cancelled)
+        if finishing:
+            _, late = await asyncio.wait(finishing, timeout=timeout)
+            for task in late:
+                task.cancel()
+            cancelled.extend(late)
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
+        return drained
+
+
+task_supervisor = TaskSupervisor()
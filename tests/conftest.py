@@ -0,0 +1,76 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock
+import guild_state
+from shared import PRISON_ROLE_NAME
+
+START = 1_700_000_000
+
+
+@pytest.fixture
+def virtual_clock():
+    """Every clock.now()/clock.sleep() in the bot runs on virtual time for the test"""
+    previous = clock.get_clock()
+    virtual = clock.VirtualClock(START)
+    clock.set_clock(virtual)
+    yield virtual
+    clock.set_clock(previous)
+
+
+@pytest.fixture
+def guild_states(tmp_path, monkeypatch):
+    """The shared partition manager, writing under a temporary directory"""
+    monkeypatch.setattr(guild_state.guild_states, 'root', str(tmp_path / "guilds"))
+    monkeypatch.setattr(guild_state.guild_states, '_partitions', {})
+    return guild_state.guild_states
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = 1):
+        self.id = guild_id
+        self.owner_id = 0
+        self.chunked = True
+        self.prison_role = SimpleNamespace(id=99, name=PRISON_ROLE_NAME, is_default=lambda: False)
+        self.roles = [self.prison_role]
+        self.members = {}
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def add_member(self, user_id: int, roles=()):
+        member = SimpleNamespace(
+            id=user_id, guild=self, roles=list(roles), display_name=f"user{user_id}",
+            mention=f"<@{user_id}>", name=f"user{user_id}"
+        )
+        self.members[user_id] = member
+        return member
+
+
+class FakeBot:
+    def __init__(self, *guilds):
+        self.guilds = {guild.id: guild for guild in guilds}
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        return None  # Log channels are not needed in tests
+
+
+@pytest.fixture
+def guild():
+    return FakeGuild()
+
+
+@pytest.fixture
+def bot(guild):
+    return FakeBot(guild)
@@ -0,0 +1,62 @@
+import asyncio
+
+import clock
+from activity import ActivityEarner
+from report_rate import ReportRateEngine, WindowRule
+
+from conftest import START
+
+
+def test_virtual_clock_wakes_sleepers_in_deadline_order(virtual_clock):
+    woke = []
+
+    async def sleeper(name, delay):
+        await clock.sleep(delay)
+        woke.append((name, clock.now() - START))
+
+    async def main():
+        tasks = [asyncio.create_task(sleeper(name, delay)) for name, delay in (("b", 60), ("a", 30), ("c", 3600))]
+        assert await virtual_clock.advance(60) == 2
+        assert virtual_clock.pending == 1
+        await virtual_clock.run_until_idle()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert woke == [("a", 30), ("b", 60), ("c", 3600)]
+
+
+def test_activity_cooldown_and_window_cap(virtual_clock):
+    earner = ActivityEarner(points=2, min_interval=20, window=3600, window_cap=6)
+
+    async def main():
+        assert earner.record(1, 7, "first message")
+        assert not earner.record(1, 7, "too soon after")
+        await virtual_clock.advance(20)
+        assert earner.record(1, 7, "after the cooldown")
+        await virtual_clock.advance(20)
+        assert earner.record(1, 7, "third one earns")
+        await virtual_clock.advance(20)
+        assert not earner.record(1, 7, "window cap reached")
+        await virtual_clock.advance(3600)
+        assert earner.record(1, 7, "a new window")
+
+    asyncio.run(main())
+    assert earner.pending[1][7] == 8
+
+
+def test_report_window_crosses_and_expires(virtual_clock):
+    engine = ReportRateEngine()
+    rules = {'prison': WindowRule(3, 2, 60)}
+
+    async def main():
+        assert engine.record('target', 1, rules) == set()
+        assert engine.record('target', 1, rules) == set()
+        # Third report, second reporter: crossed once, not again on the next one
+        assert engine.record('target', 2, rules) == {'prison'}
+        assert engine.record('target', 2, rules) == set()
+        assert engine.satisfied('target', rules) == {'prison'}
+        await virtual_clock.advance(2 * 3600)
+        assert engine.satisfied('target', rules) == set()
+        assert engine.counts('target', 60) == (0, 0)
+
+    asyncio.run(main())
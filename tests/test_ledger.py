@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from balance_store import BalanceStore
+from ledger import InsufficientPoints, PointsLedger
+
+
+@pytest.fixture
+def persists():
+    return []
+
+
+@pytest.fixture
+def ledger(persists):
+    return PointsLedger(BalanceStore({1: 100}), persist=lambda: persists.append(True))
+
+
+def test_repeated_keys_apply_once(ledger, persists):
+    async def main():
+        assert await ledger.credit(2, 50, key="daily:2") == 50
+        assert await ledger.credit(2, 50, key="daily:2") == 50
+        assert await ledger.debit(1, 30, key="redeem:1") == 70
+        assert await ledger.debit(1, 30, key="redeem:1") == 70
+        assert await ledger.transfer(1, 2, 20, key="gift") == (50, 70)
+        assert await ledger.transfer(1, 2, 20, key="gift") == (50, 70)
+
+    asyncio.run(main())
+    assert dict(ledger.balances.items()) == {1: 50, 2: 70}
+    assert len(persists) == 3
+    assert ledger.idle
+
+
+def test_concurrent_debits_never_overdraw(ledger):
+    async def main():
+        return await asyncio.gather(*(ledger.debit(1, 40) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [r for r in results if not isinstance(r, Exception)] == [60, 20]
+    assert [r.balance for r in results if isinstance(r, InsufficientPoints)] == [20]
+    assert ledger.balance(1) == 20
+
+
+def test_apply_many_skips_overdrafts_and_replays(ledger, persists):
+    async def main():
+        first = await ledger.apply_many({1: -150, 3: 10, 2: 5}, key="reset")
+        again = await ledger.apply_many({1: -150, 3: 10, 2: 5}, key="reset")
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert first == again == ({3: 10, 2: 5}, [1])
+    assert dict(ledger.balances.items()) == {1: 100, 2: 5, 3: 10}
+    assert len(persists) == 1
+
+
+def test_balance_store_merges_new_users_in_order():
+    store = BalanceStore({30: 3, 10: 1})
+    store.update({20: 2, 10: 11, 40: 4, 5: 0})
+    assert list(store.ids) == [5, 10, 20, 30, 40]
+    assert list(store.balances) == [0, 11, 2, 3, 4]
+
+    store.add_many({20: 5, 25: 7})
+    store[15] += 1
+    assert dict(store.items()) == {5: 0, 10: 11, 15: 1, 20: 7, 25: 7, 30: 3, 40: 4}
+    assert store[999] == 0 and 999 not in store
+
+
+def test_balance_store_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "points.bin")
+    store = BalanceStore({2**63: 5, 7: -3, 1: 2**40})
+    store.snapshot(path)
+
+    loaded = BalanceStore()
+    loaded.load_snapshot(path)
+    assert dict(loaded.items()) == {1: 2**40, 7: -3, 2**63: 5}
+
+    (tmp_path / "short.bin").write_bytes(b"PTS")
+    with pytest.raises(ValueError):
+        loaded.load_snapshot(str(tmp_path / "short.bin"))
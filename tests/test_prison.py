@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import prison
+from member_edits import MISSING
+from prison import IntentLog, PrisonService, PRISONER_NICK
+from records import PrisonRecord
+from shared import PRISON_DURATION
+
+
+@pytest.fixture
+def edits(monkeypatch):
+    """Member edits applied to the fake members instead of Discord"""
+    applied = []
+
+    async def edit(member, *, roles=None, add_roles=(), remove_roles=(), nick=MISSING, reason=None):
+        applied.append((member.id, roles, nick))
+        if roles is not None:
+            member.roles = list(roles)
+        member.roles = [role for role in member.roles if role not in remove_roles] + list(add_roles)
+        if nick is not MISSING:
+            member.display_name = nick or member.name
+        return True
+
+    monkeypatch.setattr(prison.member_edits, 'edit', edit)
+    return applied
+
+
+@pytest.fixture
+def service(tmp_path):
+    return PrisonService(IntentLog(str(tmp_path / "intents.log")))
+
+
+def test_prisoner_is_released_when_the_sentence_expires(virtual_clock, guild_states, guild, bot, service, edits):
+    member = guild.add_member(5)
+
+    async def main():
+        await service.recover(bot)
+        assert await service.imprison(bot, member)
+        assert guild.prison_role in member.roles
+        await virtual_clock.advance(PRISON_DURATION - 1)
+        assert service.is_tracked(member)
+        await virtual_clock.advance(1)
+        assert not service.is_tracked(member)
+
+    asyncio.run(main())
+    assert guild.prison_role not in member.roles
+    assert guild_states.get(guild.id).prisoners == {}
+
+
+def test_overlapping_releases_edit_once(virtual_clock, guild_states, guild, bot, service, edits):
+    member = guild.add_member(5, roles=[guild.prison_role])
+    guild_states.get(guild.id).prisoners[5] = PrisonRecord([], None, 0)
+    stale = SimpleNamespace(**vars(member))
+
+    async def main():
+        await service.recover(bot)
+        return await asyncio.gather(service.release(bot, member), service.release(bot, stale))
+
+    assert sorted(asyncio.run(main())) == [False, True]
+    assert len(edits) == 1
+
+
+def test_intent_sequence_continues_across_processes(tmp_path):
+    path = str(tmp_path / "intents.log")
+    member = SimpleNamespace(id=5, guild=SimpleNamespace(id=1))
+    other = SimpleNamespace(id=6, guild=member.guild)
+    IntentLog(path).begin('imprison', member, [1, 2], "old nick", 0)  # Crashed before finishing
+
+    restarted = IntentLog(path)
+    restarted.finish(restarted.begin('imprison', other, [], None, 0))
+
+    pending = IntentLog(path).pending()
+    assert [(intent['user_id'], intent['roles'], intent['nick']) for intent in pending] == [(5, [1, 2], "old nick")]
+
+
+def test_recover_replays_an_unfinished_imprison(virtual_clock, guild_states, guild, bot, tmp_path, edits):
+    path = str(tmp_path / "intents.log")
+    member = guild.add_member(5)
+    IntentLog(path).begin('imprison', member, [42], "before", 123)
+
+    service = PrisonService(IntentLog(path))
+
+    async def main():
+        assert await service.recover(bot) == 1
+        # Only once per process
+        assert await service.recover(bot) == 0
+
+    asyncio.run(main())
+    record = guild_states.get(guild.id).prisoners[5]
+    assert (list(record.role_ids), record.nick, record.since) == ([42], "before", 123)
+    assert edits == [(5, [guild.prison_role], PRISONER_NICK)]
+    assert IntentLog(path).pending() == []
@@ -0,0 +1,72 @@
+import asyncio
+import gzip
+import os
+import stat
+
+import pytest
+
+import seasons
+from guild_state import GuildState
+
+from conftest import START
+
+
+def test_archive_round_trip_drops_zero_balances(tmp_path):
+    path = seasons.archive_path(str(tmp_path), 3)
+    items = [(user_id, user_id * 10) for user_id in range(seasons.ARCHIVE_CHUNK + 5)]
+    assert seasons.write_archive(path, 3, START, START + 60, items) == len(items) - 1
+
+    assert seasons.read_archive_header(path) == (3, len(items) - 1, START, START + 60)
+    assert list(seasons.iter_archive(path)) == items[1:]
+    assert seasons.archived_seasons(str(tmp_path)) == [3]
+    assert not os.stat(path).st_mode & stat.S_IWUSR
+
+
+def test_archive_top_and_carry(tmp_path):
+    path = seasons.archive_path(str(tmp_path), 1)
+    seasons.write_archive(path, 1, START, START + 60, [(1, 5), (2, 300), (3, 40), (4, -20), (5, 120)])
+
+    assert seasons.archive_top(path, 2, user_id=3) == ([(2, 300), (5, 120)], 40)
+    assert seasons.archive_top(path, 2, user_id=9) == ([(2, 300), (5, 120)], None)
+    assert seasons.carried_balances(path, "reset") == {}
+    assert seasons.carried_balances(path, "carry", 10) == {2: 30, 3: 4, 5: 12}
+
+
+def test_truncated_archive_is_rejected(tmp_path):
+    path = str(tmp_path / "broken.gz")
+    with gzip.open(path, "wb") as f:
+        f.write(b"SEA1")
+    with pytest.raises(ValueError):
+        seasons.read_archive_header(path)
+
+
+def test_season_rolls_over_once_its_boundary_passes(virtual_clock, guild_states):
+    state = guild_states.get(1)
+    state.points.update({1: 50, 2: 0, 3: 7})
+
+    async def main():
+        await virtual_clock.advance(seasons.SEASON_LENGTH_DAYS * 86400 - 1)
+        assert not seasons.catch_up(state)
+        await virtual_clock.advance(1)
+        assert seasons.catch_up(state)
+
+    asyncio.run(main())
+    assert state.season['number'] == 2
+    assert state.season['reset_pending'] is None
+    assert len(state.points) == 0
+    assert list(seasons.iter_archive(seasons.archive_path(state.path, 1))) == [(1, 50), (3, 7)]
+
+
+def test_interrupted_reset_finishes_on_load(virtual_clock, guild_states, monkeypatch):
+    state = guild_states.get(1)
+    state.points.update({1: 50})
+    state.save_points()
+    # Crash between publishing the season bump and clearing the balances
+    with monkeypatch.context() as patch:
+        patch.setattr(seasons, 'finish_reset', lambda state: None)
+        seasons.roll_over(state)
+
+    reloaded = GuildState(1, guild_states.root).load()
+    assert reloaded.season['number'] == 2
+    assert reloaded.season['reset_pending'] is None
+    assert len(reloaded.points) == 0
@@ -1,31 +1,30 @@
 import discord
 from discord.ui import Modal, TextInput, Select, View
 from discord.ext import commands
-import time
+import clock
 from collections import defaultdict
-import asyncio
 from shared import (
     PRISON_ROLE_NAME,
-    PRISON_DURATION,
-    PRISON_DATA_FILE,
     log_activity,
-    user_roles_before_prison,
-    user_nicknames_before_prison,
-    imprisonment_times,
-    save_data,
-    REPORT_DATA_FILE,
+    delete_after,
     REPORT_NOTICE_THRESHOLD,
-    REPORT_DM_THRESHOLD,
     REPORT_PRISON_THRESHOLD,
     REPORT_COOLDOWN,
-    reported_users,
-    dm_permissions
+    REPORT_WINDOW_RULES,
+    report_window
 )
+from guild_state import guild_states
+from report_search import report_search
+from dm_queue import dm_queue
+from prison import prison_service
+from task_supervisor import task_supervisor
+from member_lookup import member_lookup
 
 # Voting Constants
 VOTE_RELEASE_THRESHOLD = 3  # Minimal 3 votes
 VOTE_RELEASE_DURATION = 300  # 5 minutes voting time (300 seconds)
 VOTE_RELEASE_COOLDOWN = 600  # 10 minutes cooldown (600 seconds)
+SUMMARY_FIELD_LIMIT = 25  # Discord's max fields per embed
 
 class VoteReleaseView(View):
     def __init__(self, target_user: discord.Member):
@@ -76,30 +75,22 @@ class VoteReleaseView(View):
                 f"🎉 {self.target_user.mention} berhasil dibebaskan!"
             )
             # Manually delete after delay since followup.send doesn't support delete_after
-            asyncio.create_task(self._delete_after(msg, 30))
+            task_supervisor.spawn('message_cleanup', msg.id, delete_after(msg, 30))
         else:
             msg = await interaction.followup.send(
                 f"❌ Gagal membebaskan {self.target_user.mention}"
             )
-            asyncio.create_task(self._delete_after(msg, 30))
+            task_supervisor.spawn('message_cleanup', msg.id, delete_after(msg, 30))
         
         # Cleanup
         if self.message:
-            await asyncio.sleep(5)
+            await clock.sleep(5)
             try:
                 await self.message.delete()
             except:
                 pass
         self.stop()
 
-    async def _delete_after(self, message, delay):
-        """Helper to delete a message after a delay"""
-        await asyncio.sleep(delay)
-        try:
-            await message.delete()
-        except:
-            pass
-
 class ReportDMForm(Modal):
     def __init__(self, target_user: discord.Member, original_message: discord.Message):
         super().__init__(title=f"DM Warning to {target_user.display_name}", timeout=180)
@@ -115,10 +106,20 @@ class ReportDMForm(Modal):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            await self.target_user.send(
+            # Delivery happens in the background so the interaction answers immediately
+            queued = dm_queue.enqueue(
+                self.target_user.id,
                 f"⚠️ Warning from {interaction.user.mention}:\n"
                 f"{self.message_input.value}"
             )
+            if not queued:
+                await interaction.response.send_message(
+                    "❌ This user has DMs closed or already received this warning",
+                    ephemeral=True,
+                    delete_after=10
+                )
+                return
+
             # Delete the original message containing the DM button
             try:
                 await self.original_message.delete()
@@ -127,7 +128,7 @@ class ReportDMForm(Modal):
             
             # Show success notification that will auto-delete
             await interaction.response.send_message(
-                "✅ Your warning has been sent!",
+                "✅ Your warning has been queued for delivery!",
                 ephemeral=True,
                 delete_after=5
             )
@@ -197,133 +198,11 @@ class UserCommands(commands.Cog):
 
     async def put_in_prison(self, member):
         """Put a member in prison"""
-        if not member:
-            return False
-        
-        try:
-            guild = member.guild
-            prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
-            
-            if not prison_role:
-                try:
-                    prison_role = await guild.create_role(
-                        name=PRISON_ROLE_NAME,
-                        permissions=discord.Permissions.none()
-                    )
-                    
-                    for channel in guild.channels:
-                        await channel.set_permissions(prison_role, 
-                                                   send_messages=False,
-                                                   add_reactions=False)
-                except discord.errors.Forbidden:
-                    await log_activity(self.bot, f"❌ Failed to create prison role - insufficient permissions")
-                    return False
-            
-            # Store current roles as IDs and nickname
-            user_roles_before_prison[member.id] = [role.id for role in member.roles if not role.is_default()]
-            user_nicknames_before_prison[str(member.id)] = member.display_name
-            
-            try:
-                # Set prisoner nickname
-                new_nick = f"🔒 Prisoner"
-                if len(new_nick) > 32:
-                    new_nick = new_nick[:32]
-                
-                # Apply prison role and remove all other roles
-                await member.edit(
-                    roles=[prison_role],
-                    nick=new_nick
-                )
-                
-                await log_activity(self.bot, f"🔒 {member.mention} has been imprisoned for 1 hour!")
-                
-                save_data({
-                    'user_roles': user_roles_before_prison,
-                    'user_nicknames': user_nicknames_before_prison,
-                    'imprisonment_times': imprisonment_times
-                }, PRISON_DATA_FILE)
-                
-                asyncio.create_task(self.release_after_delay(member, PRISON_DURATION))
-                return True
-            except discord.errors.Forbidden:
-                await log_activity(self.bot, f"❌ Failed to imprison {member.mention} - insufficient permissions")
-                return False
-        except Exception as e:
-            await log_activity(self.bot, f"❌ Error imprisoning {member.mention}: {e}")
-            return False
-
-    async def release_after_delay(self, member, delay):
-        """Release member after a delay"""
-        await asyncio.sleep(delay)
-        await self.release_from_prison(member)
+        return await prison_service.imprison(self.bot, member)
 
     async def release_from_prison(self, member):
         """Release a member from prison with proper role and nickname restoration"""
-        if not member:
-            return False
-        
-        try:
-            guild = member.guild
-            prison_role = discord.utils.get(guild.roles, name=PRISON_ROLE_NAME)
-            if not prison_role or prison_role not in member.roles:
-                return False
-                
-            # Get original data
-            original_roles_ids = user_roles_before_prison.get(member.id, [])
-            original_nick = user_nicknames_before_prison.get(str(member.id))
-            
-            # Convert role IDs back to role objects
-            original_roles = []
-            for role_id in original_roles_ids:
-                role = guild.get_role(role_id)
-                if role:
-                    original_roles.append(role)
-            
-            # Remove prison role first
-            await member.remove_roles(prison_role)
-            
-            # Restore original roles (filter out None and prison role)
-            if original_roles:
-                roles_to_add = [
-                    role for role in original_roles 
-                    if role is not None and role != prison_role
-                ]
-                if roles_to_add:
-                    try:
-                        await member.add_roles(*roles_to_add)
-                    except discord.Forbidden:
-                        await log_activity(self.bot, f"❌ Tidak bisa mengembalikan role untuk {member.mention}")
-            
-            # Restore nickname
-            try:
-                if original_nick is not None:
-                    await member.edit(nick=original_nick)
-                else:
-                    # If no original nick, remove prisoner nick if exists
-                    if member.display_name.startswith("🔒"):
-                        await member.edit(nick=None)
-            except discord.Forbidden:
-                await log_activity(self.bot, f"❌ Tidak bisa mengembalikan nickname untuk {member.mention}")
-            
-            # Clean up stored data
-            if member.id in user_roles_before_prison:
-                del user_roles_before_prison[member.id]
-            if str(member.id) in user_nicknames_before_prison:
-                del user_nicknames_before_prison[str(member.id)]
-            
-            # Save prison state
-            save_data({
-                'user_roles': user_roles_before_prison,
-                'user_nicknames': user_nicknames_before_prison,
-                'imprisonment_times': imprisonment_times
-            }, PRISON_DATA_FILE)
-            
-            await log_activity(self.bot, f"🔓 {member.mention} telah dibebaskan dari penjara!")
-            return True
-            
-        except Exception as e:
-            await log_activity(self.bot, f"❌ Error saat membebaskan {member.mention}: {str(e)}")
-            return False
+        return await prison_service.release(self.bot, member)
 
     @commands.command(aliases=['votebebas'])
     async def voterelease(self, ctx, member: discord.Member):
@@ -336,7 +215,7 @@ class UserCommands(commands.Cog):
             return
         
         # Check cooldown
-        current_time = time.time()
+        current_time = clock.now()
         if member.id in self.release_votes:
             remaining = self.release_votes[member.id]['end_time'] - current_time
             if remaining > 0:
@@ -358,14 +237,14 @@ class UserCommands(commands.Cog):
         }
         
         # Auto cleanup after timeout
-        await asyncio.sleep(VOTE_RELEASE_DURATION)
+        await clock.sleep(VOTE_RELEASE_DURATION)
         if member.id in self.release_votes and not view.success:
             del self.release_votes[member.id]
 
     @commands.command(aliases=['openreport'])
     async def report(self, ctx, member: discord.Member, *, reason: str = None):
         """Report a user to moderators"""
-        current_time = time.time()
+        current_time = clock.now()
         
         # Cooldown for reporting the same user
         cooldown_key = (ctx.author.id, member.id)
@@ -383,43 +262,39 @@ class UserCommands(commands.Cog):
         formatted_reason = reason if reason else "No reason provided"
         full_reason = f"{formatted_reason} (Reported by: {ctx.author.name})"
         
-        if str(member.id) not in reported_users:
-            reported_users[str(member.id)] = {
-                'count': 0,
-                'reasons': [],
-                'last_report': 0
-            }
-
-        reported_users[str(member.id)]['count'] += 1
-        reported_users[str(member.id)]['reasons'].append(full_reason)
-        reported_users[str(member.id)]['last_report'] = current_time
+        state = guild_states.get(ctx.guild.id)
+        record = state.add_report(member.id, full_reason, current_time)
+        report_search.add(member.id, ctx.guild.id, full_reason, current_time)
+        # Thresholds fire when the recent report rate crosses a rule, not on the lifetime count
+        target = (ctx.guild.id, member.id)
+        crossed = report_window.record(target, ctx.author.id, REPORT_WINDOW_RULES, current_time)
+        # A sentence that failed earlier is retried while the rate is still over the rule
+        prison_rule = {'prison': REPORT_WINDOW_RULES['prison']}
+        if report_window.satisfied(target, prison_rule, current_time) and not prison_service.is_tracked(member):
+            crossed.add('prison')
         self.report_cooldowns[cooldown_key] = current_time + REPORT_COOLDOWN
 
-        save_data(reported_users, REPORT_DATA_FILE)
+        state.save_reports()
 
         await log_activity(self.bot, 
             f"⚠️ **New Report**\n"
             f"• Target: {member.mention}\n"
             f"• Reporter: {ctx.author.mention}\n"
             f"• Reason: {formatted_reason}\n"
-            f"• Total Reports: {reported_users[str(member.id)]['count']}/{REPORT_PRISON_THRESHOLD}"
+            f"• Total Reports: {record.count}/{REPORT_PRISON_THRESHOLD}"
         )
 
-        report_count = reported_users[str(member.id)]['count']
+        report_count = record.count
         
-        if report_count == REPORT_NOTICE_THRESHOLD:
+        if 'notice' in crossed and not crossed & {'dm', 'prison'}:
             notice_msg = await ctx.send(f"⚠️ WARNING {member.mention} has received {REPORT_NOTICE_THRESHOLD} reports!")
-            await asyncio.sleep(30)
-            try:
-                await notice_msg.delete()
-            except:
-                pass
+            await delete_after(notice_msg, 30)
         
-        elif report_count == REPORT_DM_THRESHOLD:
-            if member.id not in dm_permissions:
-                dm_permissions[member.id] = []
-            if ctx.author.id not in dm_permissions[member.id]:
-                dm_permissions[member.id].append(ctx.author.id)
+        elif 'dm' in crossed and 'prison' not in crossed:
+            allowed = state.dm_permissions[member.id]
+            if ctx.author.id not in allowed:
+                allowed.add(ctx.author.id)
+                state.save_dm_permissions()
             
             # Send DM offer and store the message reference
             dm_message = await ctx.send(
@@ -427,26 +302,18 @@ class UserCommands(commands.Cog):
                 view=DMButtonView(member, ctx.message)
             )
         
-        elif report_count >= REPORT_PRISON_THRESHOLD:
+        elif 'prison' in crossed:
             if await self.put_in_prison(member):
-                reported_users[str(member.id)]['count'] = 0
-                save_data(reported_users, REPORT_DATA_FILE)
+                state.set_report_count(member.id, 0)
+                state.save_reports()
                 prison_msg = await ctx.send(
                     f"🔒 {member.mention} has been IMPRISONED!\n"
                     f"Reason: Too many reports ({REPORT_PRISON_THRESHOLD}+)"
                 )
-                await asyncio.sleep(60)
-                try:
-                    await prison_msg.delete()
-                except:
-                    pass
+                await delete_after(prison_msg, 60)
             else:
                 fail_msg = await ctx.send(f"❌ Failed to imprison {member.mention}")
-                await asyncio.sleep(10)
-                try:
-                    await fail_msg.delete()
-                except:
-                    pass
+                await delete_after(fail_msg, 10)
 
         else:
             report_msg = await ctx.send(
@@ -461,9 +328,9 @@ class UserCommands(commands.Cog):
     async def check_reports(self, ctx, member: discord.Member = None):
         """Check report count and recent reasons for a user"""
         if member:
-            user_data = reported_users.get(str(member.id), {})
-            count = user_data.get('count', 0)
-            reasons = user_data.get('reasons', [])
+            record = guild_states.get(ctx.guild.id).report(member.id)
+            count = record.count if record else 0
+            reasons = record.reasons if record else []
             
             embed = discord.Embed(
                 title=f"📊 Reports for {member.display_name}",
@@ -480,11 +347,7 @@ class UserCommands(commands.Cog):
                 embed.add_field(name="Latest 5 Reasons", value=reasons_text, inline=False)
             
             report_msg = await ctx.send(embed=embed)
-            await asyncio.sleep(120)
-            try:
-                await report_msg.delete()
-            except:
-                pass
+            await delete_after(report_msg, 120)
         else:
             embed = discord.Embed(
                 title="📊 Report Summary",
@@ -492,22 +355,27 @@ class UserCommands(commands.Cog):
                 color=discord.Color.orange()
             )
             
-            for user_id, data in reported_users.items():
-                if data.get('count', 0) > 0:
-                    user = ctx.guild.get_member(int(user_id))
-                    if user:
-                        embed.add_field(
-                            name=user.display_name,
-                            value=f"{data['count']} reports",
-                            inline=True
-                        )
+            # Users reported in this guild, plus legacy records with no guild
+            report_index = guild_states.get(ctx.guild.id).report_index
+            candidates = report_index.active_in_guild(ctx.guild.id) + report_index.active_in_guild(None)
+            candidates.sort(key=report_index.count, reverse=True)
+            shown = 0
+            for user_id in candidates:
+                if shown == SUMMARY_FIELD_LIMIT:
+                    break
+                user = await member_lookup.get(ctx.guild, user_id)
+                if user:
+                    embed.add_field(
+                        name=user.display_name,
+                        value=f"{report_index.count(user_id)} reports",
+                        inline=True
+                    )
+                    shown += 1
+            if len(candidates) > shown:
+                embed.set_footer(text=f"Showing top {shown} of {len(candidates)} reported users")
             
             summary_msg = await ctx.send(embed=embed)
-            await asyncio.sleep(120)
-            try:
-                await summary_msg.delete()
-            except:
-                pass
+            await delete_after(summary_msg, 120)
 
     @commands.command()
     async def ping(self, ctx):
@@ -571,10 +439,12 @@ class UserCommands(commands.Cog):
                 ]
             elif value == "report":
                 embed.title = "⚖️ REPORT SYSTEM"
+                rules = REPORT_WINDOW_RULES
+                window = "{0.reports} reports from {0.reporters}+ users within {0.minutes} minutes"
                 commands_list = [
-                    ("Warning Threshold", f"{REPORT_NOTICE_THRESHOLD} reports"),
-                    ("DM Threshold", f"{REPORT_DM_THRESHOLD} reports"),
-                    ("Prison Threshold", f"{REPORT_PRISON_THRESHOLD} reports"),
+                    ("Warning Threshold", window.format(rules['notice'])),
+                    ("DM Threshold", window.format(rules['dm'])),
+                    ("Prison Threshold", window.format(rules['prison'])),
                     ("Cooldown", f"{REPORT_COOLDOWN//60} minutes between reports for the same user")
                 ]
             elif value == "prison":
@@ -605,11 +475,7 @@ class UserCommands(commands.Cog):
         )
         
         help_msg = await ctx.send(embed=initial_embed, view=view)
-        await asyncio.sleep(300)  # Auto-delete after 5 minutes
-        try:
-            await help_msg.delete()
-        except:
-            pass
+        await delete_after(help_msg, 300)  # Auto-delete after 5 minutes
 
 async def setup(bot):
     await bot.add_cog(UserCommands(bot))
\ No newline at end of file
@@ -0,0 +1,130 @@
+import logging
+from typing import Iterable, Tuple
+
+import discord
+import clock
+from guild_state import guild_states
+from rate_limits import rate_limits
+from member_lookup import member_lookup
+
+logger = logging.getLogger("discord_bot")
+
+VC_LOCK_DURATION = 3600  # Kick-locks last an hour
+
+
+def _is_member_target(target) -> bool:
+    if isinstance(target, (discord.Member, discord.User)):
+        return True
+    return isinstance(target, discord.Object) and target.type is discord.Member
+
+
+def _is_kick_lock(overwrite: discord.PermissionOverwrite) -> bool:
+    """The exact shape kick_lock leaves behind: connect denied and nothing else"""
+    allow, deny = overwrite.pair()
+    return allow.value == 0 and deny == discord.Permissions(connect=True)
+
+
+class VCLockScheduler:
+    """Expiring kick-lock overwrites.
+
+    Locks are recorded with an expiry in the guild partition. Expired locks
+    are lifted per channel with a single channel.edit(overwrites=...), so
+    any number of members expiring together costs one API call per channel.
+    """
+
+    async def lock(self, member: discord.Member, channel, duration: float = VC_LOCK_DURATION) -> float:
+        await channel.set_permissions(member, connect=False, reason="Kick lock redeem")
+        state = guild_states.get(member.guild.id)
+        expires = clock.now() + duration
+        state.vc_locks[channel.id][member.id] = expires
+        state.save_vc_locks()
+        return expires
+
+    @staticmethod
+    async def _lift(channel, user_ids: Iterable[int], reason: str) -> int:
+        """Clear the connect deny for the given members in one edit, dropping emptied overwrites"""
+        user_ids = set(user_ids)
+        overwrites = dict(channel.overwrites)
+        cleared = 0
+        for target, overwrite in list(overwrites.items()):
+            if not _is_member_target(target) or target.id not in user_ids:
+                continue
+            overwrite.connect = None
+            if overwrite.is_empty():
+                del overwrites[target]
+            else:
+                overwrites[target] = overwrite
+            cleared += 1
+        if cleared:
+            await rate_limits.pace('PATCH', f"/channels/{channel.id}")
+            await channel.edit(overwrites=overwrites, reason=reason)
+        return cleared
+
+    async def expire_due(self, bot) -> int:
+        """Lift every expired lock; returns the number of overwrites cleared"""
+        now = clock.now()
+        cleared = 0
+        for state in guild_states.loaded():
+            guild = bot.get_guild(state.guild_id)
+            changed = False
+            for channel_id, locks in list(state.vc_locks.items()):
+                expired = [user_id for user_id, expires in locks.items() if expires <= now]
+                if not expired:
+                    continue
+                channel = guild.get_channel(channel_id) if guild else None
+                if channel is not None:
+                    try:
+                        cleared += await self._lift(channel, expired, "Kick lock expired")
+                    except discord.HTTPException as e:
+                        # Keep the locks; the next run retries
+                        logger.error(f"Error lifting kick locks in {channel_id}: {e}")
+                        continue
+                for user_id in expired:
+                    del locks[user_id]
+                if not locks:
+                    del state.vc_locks[channel_id]
+                changed = True
+            if changed:
+                state.save_vc_locks()
+        return cleared
+
+    async def prune_orphans(self, guild: discord.Guild, untracked_locks: bool = False,
+                            dry_run: bool = False) -> Tuple[int, int]:
+        """Remove member overwrites on voice channels that nothing needs any more.
+
+        Always covers members who have left the guild. With untracked_locks,
+        also lifts bare connect-deny overwrites that have no expiry recorded
+        (kick-locks made before locks expired). Returns (channels, overwrites).
+        """
+        state = guild_states.get(guild.id)
+        channels = 0
+        removed = 0
+        for channel in list(guild.voice_channels) + list(guild.stage_channels):
+            tracked = state.vc_locks.get(channel.id, {})
+            overwrites = dict(channel.overwrites)
+            orphans = []
+            for target, overwrite in overwrites.items():
+                if not _is_member_target(target):
+                    continue
+                if untracked_locks and target.id not in tracked and _is_kick_lock(overwrite):
+                    orphans.append(target)
+                elif await member_lookup.get(guild, target.id) is None:
+                    # A miss in a lean guild is checked over REST, not taken as departed
+                    orphans.append(target)
+            if not orphans:
+                continue
+            channels += 1
+            removed += len(orphans)
+            if dry_run:
+                continue
+            for target in orphans:
+                del overwrites[target]
+            try:
+                await rate_limits.pace('PATCH', f"/channels/{channel.id}")
+                await channel.edit(overwrites=overwrites, reason="Pruning orphaned member overwrites")
+            except discord.HTTPException as e:
+                logger.error(f"Error pruning overwrites in {channel.id}: {e}")
+        return channels, removed
+
+
+vc_locks = VCLockScheduler()
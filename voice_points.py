@@ -0,0 +1,103 @@
+import logging
+from collections import defaultdict
+from typing import Dict
+
+import clock
+from activity import credit_batches
+
+logger = logging.getLogger("discord_bot")
+
+VOICE_POINTS_PER_MINUTE = 1
+VOICE_CHECKPOINT_MINUTES = 10  # Long sessions are credited at least this often
+
+
+class _Session:
+    __slots__ = ('channel_id', 'since')
+
+    def __init__(self, channel_id: int, since: float):
+        self.channel_id = channel_id
+        self.since = since  # Accrued up to here; the remainder carries over
+
+
+def earns_in(state) -> bool:
+    """Whether a voice state counts: connected, not deafened, not in the AFK channel"""
+    channel = state.channel if state else None
+    if channel is None:
+        return False
+    if state.self_deaf or state.deaf:
+        return False
+    return channel != getattr(channel.guild, 'afk_channel', None)
+
+
+class VoiceTracker:
+    """Voice-presence earning driven by voice state events.
+
+    Only a session start time per (guild, member) is kept. Points are
+    worked out when a session ends, or at a checkpoint for long sessions,
+    and credited to each guild's ledger in bulk. Channel membership is
+    never polled; after a restart, open sessions are rebuilt from the
+    client's cached voice states.
+    """
+
+    def __init__(self, points_per_minute: int = VOICE_POINTS_PER_MINUTE):
+        self.points_per_minute = points_per_minute
+        self.sessions: Dict[tuple, _Session] = {}
+        self.pending: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _accrue(self, key: tuple, session: _Session, now: float) -> None:
+        minutes = int((now - session.since) // 60)
+        if minutes <= 0:
+            return
+        session.since += minutes * 60
+        guild_id, user_id = key
+        self.pending[guild_id][user_id] += minutes * self.points_per_minute
+
+    def update(self, member, before, after) -> None:
+        """Apply one on_voice_state_update event"""
+        if member.bot:
+            return
+        key = (member.guild.id, member.id)
+        now = clock.now()
+        session = self.sessions.get(key)
+        if earns_in(after):
+            if session is None:
+                self.sessions[key] = _Session(after.channel.id, now)
+            else:
+                # Moving between channels keeps the session going
+                session.channel_id = after.channel.id
+        elif session is not None:
+            self._accrue(key, session, now)
+            del self.sessions[key]
+
+    def reconcile(self, guilds) -> int:
+        """Match the session table to the cached voice states; returns sessions opened"""
+        now = clock.now()
+        present = set()
+        opened = 0
+        for guild in guilds:
+            for channel in list(guild.voice_channels) + list(guild.stage_channels):
+                for user_id, state in channel.voice_states.items():
+                    member = guild.get_member(user_id)
+                    if member is None or member.bot or not earns_in(state):
+                        continue
+                    key = (guild.id, user_id)
+                    present.add(key)
+                    if key not in self.sessions:
+                        self.sessions[key] = _Session(channel.id, now)
+                        opened += 1
+        # Sessions whose member left voice while the gateway was disconnected
+        for key in list(self.sessions):
+            if key not in present:
+                self._accrue(key, self.sessions.pop(key), now)
+        return opened
+
+    async def checkpoint(self) -> int:
+        """Accrue open sessions and credit everything pending; returns users credited"""
+        now = clock.now()
+        for key, session in self.sessions.items():
+            self._accrue(key, session, now)
+        pending, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+        return await credit_batches(pending, "voice", self.pending)
+
+
+voice_tracker = VoiceTracker()